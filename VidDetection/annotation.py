@@ -0,0 +1,136 @@
+"""
+annotation.py - Rendu des annotations sans allocation par frame
+
+Les labels sont pré-rendus une seule fois sous forme de sprites (image + alpha)
+mis en cache, puis collés dans la frame par des opérations NumPy vectorisées.
+La partie variable d'un label (ex: la confiance, arrondie) a ses propres
+sprites, collés à droite du label: le cache reste petit. Le rendu se fait
+directement dans la frame (inplace), dans un buffer fourni par l'appelant
+(`out`) ou dans une copie.
+"""
+
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+class AnnotationRenderer:
+    """Dessine boîtes et labels avec un cache de sprites"""
+
+    def __init__(self, font_scale=0.6, text_thickness=2, box_thickness=2,
+                 label_alpha=1.0, max_sprites=512):
+        self.font_scale = font_scale
+        self.text_thickness = text_thickness
+        self.box_thickness = box_thickness
+        # Opacité du fond des labels (1.0 = opaque, comme cv2.rectangle plein)
+        self.label_alpha = float(label_alpha)
+        self.max_sprites = max_sprites
+
+        self.sprites = OrderedDict()
+        self.sprite_hits = 0
+        self.sprite_misses = 0
+
+    def _sprite(self, key, label, color, height=None):
+        """
+        Retourne le sprite (image, alpha) du label, en le créant si besoin
+
+        `height` impose la hauteur du sprite (suffixe aligné sur son label);
+        elle doit faire partie de `key`.
+        """
+        sprite = self.sprites.get(key)
+        if sprite is not None:
+            self.sprites.move_to_end(key)
+            self.sprite_hits += 1
+            return sprite
+
+        self.sprite_misses += 1
+        (text_width, text_height), _ = cv2.getTextSize(
+            label, FONT, self.font_scale, self.text_thickness
+        )
+        height = height or text_height + 10
+        width = max(text_width, 1)
+
+        image = np.empty((height, width, 3), dtype=np.uint8)
+        image[:] = color
+        cv2.putText(
+            image, label, (0, height - 5),
+            FONT, self.font_scale, (255, 255, 255), self.text_thickness
+        )
+
+        alpha = None
+        if self.label_alpha < 1.0:
+            # Le texte reste opaque, seul le fond est transparent
+            text_mask = np.zeros((height, width), dtype=np.uint8)
+            cv2.putText(
+                text_mask, label, (0, height - 5),
+                FONT, self.font_scale, 255, self.text_thickness
+            )
+            alpha = np.full((height, width, 1), int(self.label_alpha * 255), dtype=np.uint16)
+            alpha[text_mask > 0] = 255
+
+        sprite = (image, alpha)
+        self.sprites[key] = sprite
+        if len(self.sprites) > self.max_sprites:
+            self.sprites.popitem(last=False)
+        return sprite
+
+    def _blit(self, frame, sprite, x, y):
+        """Colle un sprite dont le coin haut-gauche est (x, y), avec découpage aux bords"""
+        image, alpha = sprite
+        frame_h, frame_w = frame.shape[:2]
+        sprite_h, sprite_w = image.shape[:2]
+
+        x1, y1 = max(x, 0), max(y, 0)
+        x2, y2 = min(x + sprite_w, frame_w), min(y + sprite_h, frame_h)
+        if x2 <= x1 or y2 <= y1:
+            return
+
+        src = image[y1 - y:y2 - y, x1 - x:x2 - x]
+        dst = frame[y1:y2, x1:x2]
+
+        if alpha is None:
+            dst[...] = src
+            return
+
+        a = alpha[y1 - y:y2 - y, x1 - x:x2 - x]
+        blended = (src.astype(np.uint16) * a + dst.astype(np.uint16) * (255 - a)) // 255
+        dst[...] = blended.astype(np.uint8)
+
+    def render(self, frame, annotations, inplace=False, enabled=True, out=None):
+        """
+        Dessine les annotations sur la frame
+
+        annotations: itérable de (bbox, key, label, color, suffix), où `key`
+        identifie le sprite du label dans le cache et `suffix` (ou None) est
+        un texte court ajouté après le label, avec son propre sprite (clé:
+        texte, couleur, hauteur du label). Si `inplace` est faux, le rendu se
+        fait dans `out` (buffer de même forme réutilisé par l'appelant d'une
+        frame à l'autre) ou à défaut dans une copie de la frame. Si `enabled`
+        est faux, la frame est retournée telle quelle.
+        """
+        if not enabled:
+            return frame
+
+        if inplace:
+            output = frame
+        elif out is not None:
+            output = out
+            np.copyto(output, frame)
+        else:
+            output = frame.copy()
+
+        for (x1, y1, x2, y2), key, label, color, suffix in annotations:
+            cv2.rectangle(output, (x1, y1), (x2, y2), color, self.box_thickness)
+            sprite = self._sprite(key, label, color)
+            sprite_h, sprite_w = sprite[0].shape[:2]
+            self._blit(output, sprite, x1, y1 - sprite_h)
+            if suffix:
+                self._blit(output, self._sprite(("suffix", suffix, color, sprite_h), suffix,
+                                                color, height=sprite_h),
+                           x1 + sprite_w, y1 - sprite_h)
+
+        return output
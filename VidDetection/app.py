@@ -5,7 +5,11 @@ app.py - Interface Streamlit pour la détection et tracking d'objets
 import streamlit as st
 import requests
 import io
+import json
 import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from track_format import TrackReader
 
 # Configuration de la page
 st.set_page_config(
@@ -17,6 +21,11 @@ st.set_page_config(
 # URL de l'API
 API_URL = "http://127.0.0.1:8000"
 
+# Uploads par morceaux et suivi des jobs
+CHUNK_SIZE = 8 * 1024 * 1024
+MAX_UPLOAD_RETRIES = 5
+POLL_INTERVAL = 1.0
+
 # Style personnalisé
 st.markdown("""
     <style>
@@ -35,13 +44,252 @@ st.markdown("""
     """, unsafe_allow_html=True)
 
 
+@st.cache_resource
+def get_session():
+    """Session HTTP partagée: connexions réutilisées d'un rerun Streamlit à l'autre"""
+    session = requests.Session()
+    retry = Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET", "PUT", "DELETE"})
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
 def check_api_health():
-    """Vérifie si l'API est accessible"""
+    """État de l'API (réponse de /health), None si elle n'est pas accessible"""
     try:
-        response = requests.get(f"{API_URL}/health", timeout=2)
-        return response.status_code == 200
-    except:
-        return False
+        response = get_session().get(f"{API_URL}/health", timeout=2)
+        return response.json() if response.status_code == 200 else None
+    except (requests.exceptions.RequestException, ValueError):
+        return None
+
+
+@st.cache_data(ttl=60)
+def available_models():
+    """Modèles sélectionnables par job (le premier est le modèle par défaut du serveur)"""
+    try:
+        response = get_session().get(f"{API_URL}/models", timeout=5)
+        response.raise_for_status()
+        return response.json()["allowed_models"]
+    except requests.exceptions.RequestException:
+        return []
+
+
+def select_model(key):
+    """Choix du modèle: rapide (n) pour le volume, plus précis (s, m) pour les clips importants"""
+    models = available_models()
+    if not models:
+        return {}
+    return {"model": st.selectbox("Modèle YOLO", models, key=key)}
+
+
+def upload_video(uploaded_file, progress_bar):
+    """
+    Envoie la vidéo par morceaux (PUT à un offset) et retourne l'upload_id
+    
+    Après une coupure réseau, l'offset déjà reçu est redemandé au serveur et
+    l'envoi reprend à partir de là. L'upload_id est conservé dans la session:
+    un nouvel essai sur le même fichier reprend l'upload en cours.
+    """
+    session = get_session()
+    size = uploaded_file.size
+    uploads = st.session_state.setdefault("uploads", {})
+    file_key = f"{uploaded_file.name}:{size}"
+    
+    status = None
+    if file_key in uploads:
+        response = session.get(f"{API_URL}/uploads/{uploads[file_key]}", timeout=10)
+        if response.status_code == 200:
+            status = response.json()
+    if status is None:
+        response = session.post(
+            f"{API_URL}/uploads",
+            params={"filename": uploaded_file.name, "size": size},
+            timeout=10
+        )
+        response.raise_for_status()
+        status = response.json()
+        uploads[file_key] = status["upload_id"]
+    
+    upload_url = f"{API_URL}/uploads/{status['upload_id']}"
+    offset = status["received"]
+    failures = 0
+    while offset < size:
+        uploaded_file.seek(offset)
+        chunk = uploaded_file.read(CHUNK_SIZE)
+        try:
+            response = session.put(
+                upload_url,
+                params={"offset": offset},
+                data=chunk,
+                headers={"Content-Type": "application/octet-stream"},
+                timeout=60
+            )
+            if response.status_code == 409:
+                # Le serveur a déjà reçu plus (ou moins): reprendre à son offset
+                offset = response.json()["detail"]["received"]
+                continue
+            response.raise_for_status()
+            offset = response.json()["received"]
+            failures = 0
+        
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            failures += 1
+            if failures > MAX_UPLOAD_RETRIES:
+                raise
+            time.sleep(min(2 ** failures, 30))
+            try:
+                offset = session.get(upload_url, timeout=10).json()["received"]
+            except requests.exceptions.RequestException:
+                pass
+        
+        progress_bar.progress(
+            offset / size,
+            text=f"📤 Envoi: {offset / (1024*1024):.1f} / {size / (1024*1024):.1f} MB"
+            + (f" (reprise {failures}/{MAX_UPLOAD_RETRIES})" if failures else "")
+        )
+    
+    return status["upload_id"]
+
+
+def run_job(upload_id, kind, params, progress_bar):
+    """
+    Soumet le traitement puis suit sa progression jusqu'à la fin
+    
+    Un job identique déjà soumis dans la session est repris au lieu d'être
+    relancé.
+    """
+    session = get_session()
+    jobs = st.session_state.setdefault("jobs", {})
+    job_key = (upload_id, kind, tuple(sorted(params.items())))
+    
+    job = None
+    if job_key in jobs:
+        response = session.get(f"{API_URL}/jobs/{jobs[job_key]}", timeout=10)
+        if response.status_code == 200 and response.json()["status"] != "error":
+            job = response.json()
+    if job is None:
+        response = session.post(
+            f"{API_URL}/jobs",
+            params={"upload_id": upload_id, "kind": kind, **params},
+            timeout=30
+        )
+        response.raise_for_status()
+        job = response.json()
+        jobs[job_key] = job["job_id"]
+    
+    while job["status"] in ("queued", "running"):
+        if job["status"] == "queued":
+            text = "⏳ En attente d'un worker..."
+        elif job["frames_total"]:
+            text = f"⚙️ Traitement: {job['frames_done']}/{job['frames_total']} frames"
+        else:
+            text = "⚙️ Traitement en cours..."
+        progress_bar.progress(job["progress"], text=text)
+        
+        time.sleep(POLL_INTERVAL)
+        response = session.get(f"{API_URL}/jobs/{job['job_id']}", timeout=10)
+        response.raise_for_status()
+        job = response.json()
+    
+    progress_bar.progress(1.0, text=f"✅ Traitement terminé en {job['elapsed_s']:.0f}s")
+    return job
+
+
+def download_result(job_id, progress_bar):
+    """
+    Télécharge le résultat d'un job par blocs, avec progression
+    
+    Retourne (response, contenu); le contenu est None en cas d'erreur.
+    """
+    response = get_session().get(f"{API_URL}/jobs/{job_id}/result", stream=True, timeout=60)
+    if response.status_code != 200:
+        return response, None
+    
+    total = int(response.headers.get("Content-Length") or 0)
+    buffer = io.BytesIO()
+    for block in response.iter_content(chunk_size=1024 * 1024):
+        buffer.write(block)
+        if total:
+            progress_bar.progress(min(buffer.tell() / total, 1.0),
+                                  text=f"📥 Téléchargement: {buffer.tell() / (1024*1024):.1f} MB")
+    return response, buffer.getvalue()
+
+
+def show_frame_details(frames):
+    """Affiche les détections/tracks d'une liste de frames"""
+    for frame_data in frames:
+        with st.expander(f"Frame {frame_data['frame_number']}"):
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                st.markdown("**Détections:**")
+                if frame_data["detections"]:
+                    for j, det in enumerate(frame_data["detections"], 1):
+                        st.write(f"{j}. **{det['class_name']}** - Confiance: {det['confidence']:.2%}")
+                else:
+                    st.write("Aucune détection")
+            
+            with col2:
+                st.markdown("**Tracks:**")
+                if frame_data["tracks"]:
+                    for track in frame_data["tracks"]:
+                        st.write(f"ID {track['id']}: {track['class']}")
+                else:
+                    st.write("Aucun track")
+
+
+def show_track_summary(summary, total_frames):
+    """Affiche le résumé des tracks calculé par le serveur (sans parcourir les frames)"""
+    st.markdown("### 📊 Statistiques")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Total Frames", total_frames)
+    with col2:
+        st.metric("Tracks Uniques", summary["total_tracks"])
+    with col3:
+        st.metric("Classes Détectées", len(summary["classes"]))
+    
+    if summary["classes"]:
+        st.markdown("### 🏷️ Objets Uniques par Classe")
+        st.table([
+            {"Classe": name, "Objets uniques": stats["unique"],
+             "Présence moyenne (s)": stats["mean_dwell_s"]}
+            for name, stats in sorted(summary["classes"].items(), key=lambda item: -item[1]["unique"])
+        ])
+    
+    if summary["lines"]:
+        st.markdown("### 🚧 Franchissements de Lignes")
+        st.table([
+            {"Ligne": str(line["line"]), "Sens direct": line["forward"],
+             "Sens inverse": line["backward"]}
+            for line in summary["lines"]
+        ])
+
+
+def show_vdt_results(payload, filename, summary=None):
+    """Affiche des résultats au format binaire .vdt (toutes les frames)"""
+    reader = TrackReader(payload)
+    
+    st.success("✅ Analyse terminée avec succès!")
+    
+    if summary is not None:
+        show_track_summary(summary, reader.n_frames)
+    
+    st.markdown("### 📋 Détails des Frames (10 premières)")
+    show_frame_details(reader.frames(0, 10))
+    
+    st.download_button(
+        label="📥 Télécharger les données VDT",
+        data=payload,
+        file_name=f"analysis_{filename}.vdt",
+        mime="application/x-vdt"
+    )
 
 
 def main():
@@ -53,8 +301,12 @@ def main():
     col1, col2 = st.columns([3, 1])
     
     with col2:
-        if check_api_health():
+        health = check_api_health()
+        if health and health.get("ready", True):
             st.success("✅ API connectée")
+        elif health:
+            # Les jobs soumis pendant le warmup démarrent dès que les modèles sont prêts
+            st.warning(f"⏳ API en cours de démarrage ({health.get('phase')})")
         else:
             st.error("❌ API non disponible")
             st.info("Lancez le serveur : `python main.py`")
@@ -89,88 +341,60 @@ def main():
                 Cette analyse retournera les détections et tracks pour chaque frame échantillonnée.
                 """)
             
+            output_format = st.radio(
+                "Format des résultats",
+                ["json", "vdt"],
+                format_func=lambda f: "JSON (frames échantillonnées)" if f == "json"
+                else "VDT binaire (toutes les frames)",
+                horizontal=True,
+                key="output_format"
+            )
+            model_params = select_model("model_analyze")
+            
             if st.button("🔍 Analyser la vidéo", type="primary", key="analyze_btn"):
-                with st.spinner("⏳ Analyse en cours... Cela peut prendre quelques minutes..."):
-                    try:
-                        # Envoyer la vidéo à l'API
-                        files = {"file": (uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type)}
-                        response = requests.post(
-                            f"{API_URL}/detect-video",
-                            files=files,
-                            timeout=300  # 5 minutes timeout
-                        )
+                progress_bar = st.progress(0.0, text="📤 Envoi de la vidéo...")
+                try:
+                    # Envoyer la vidéo par morceaux, puis suivre le job
+                    upload_id = upload_video(uploaded_file, progress_bar)
+                    job = run_job(upload_id, "detect-video", {"format": output_format, **model_params},
+                                  progress_bar)
+                    response, content = download_result(job["job_id"], progress_bar)
+                    
+                    if response.status_code == 200 and output_format == "vdt":
+                        show_vdt_results(content, uploaded_file.name, job["summary"])
+                    
+                    elif response.status_code == 200:
+                        data = json.loads(content)
                         
-                        if response.status_code == 200:
-                            data = response.json()
-                            
-                            # Afficher les résultats
-                            st.success("✅ Analyse terminée avec succès!")
-                            
-                            # Statistiques globales
-                            st.markdown("### 📊 Statistiques")
-                            col1, col2, col3 = st.columns(3)
-                            
-                            with col1:
-                                st.metric("Total Frames", data['total_frames'])
-                            
-                            with col2:
-                                st.metric("Frames Analysées", data['sampled_frames'])
-                            
-                            with col3:
-                                # Compter les objets uniques
-                                all_classes = set()
-                                for frame_data in data['frames']:
-                                    for det in frame_data['detections']:
-                                        all_classes.add(det['class_name'])
-                                st.metric("Classes Détectées", len(all_classes))
-                            
-                            # Afficher les classes détectées
-                            if all_classes:
-                                st.markdown("### 🏷️ Classes d'Objets Détectées")
-                                st.write(", ".join(sorted(all_classes)))
-                            
-                            # Afficher quelques frames échantillonnées
-                            st.markdown("### 📋 Détails des Frames (échantillon)")
-                            
-                            for i, frame_data in enumerate(data["frames"][:10]):  # Limiter à 10 frames
-                                with st.expander(f"Frame {frame_data['frame_number']}"):
-                                    col1, col2 = st.columns(2)
-                                    
-                                    with col1:
-                                        st.markdown("**Détections:**")
-                                        if frame_data["detections"]:
-                                            for j, det in enumerate(frame_data["detections"], 1):
-                                                st.write(f"{j}. **{det['class_name']}** - Confiance: {det['confidence']:.2%}")
-                                        else:
-                                            st.write("Aucune détection")
-                                    
-                                    with col2:
-                                        st.markdown("**Tracks:**")
-                                        if frame_data["tracks"]:
-                                            for track in frame_data["tracks"]:
-                                                st.write(f"ID {track['id']}: {track['class']}")
-                                        else:
-                                            st.write("Aucun track")
-                            
-                            # Option de téléchargement JSON
-                            import json
-                            json_str = json.dumps(data, indent=2)
-                            st.download_button(
-                                label="📥 Télécharger les données JSON",
-                                data=json_str,
-                                file_name=f"analysis_{uploaded_file.name}.json",
-                                mime="application/json"
-                            )
+                        # Afficher les résultats
+                        st.success("✅ Analyse terminée avec succès!")
                         
-                        else:
-                            st.error(f"❌ Erreur {response.status_code}: {response.text}")
-                    
-                    except requests.exceptions.Timeout:
-                        st.error("⏱️ Timeout: La vidéo est trop longue. Essayez une vidéo plus courte.")
+                        # Statistiques globales (résumé calculé sur toutes les frames par le serveur)
+                        show_track_summary(data["summary"], data["total_frames"])
+                        
+                        # Afficher quelques frames échantillonnées
+                        st.markdown("### 📋 Détails des Frames (échantillon)")
+                        
+                        show_frame_details(data["frames"][:10])  # Limiter à 10 frames
+                        
+                        # Option de téléchargement JSON
+                        json_str = json.dumps(data, indent=2)
+                        st.download_button(
+                            label="📥 Télécharger les données JSON",
+                            data=json_str,
+                            file_name=f"analysis_{uploaded_file.name}.json",
+                            mime="application/json"
+                        )
                     
-                    except Exception as e:
-                        st.error(f"❌ Erreur: {str(e)}")
-    
+                    else:
+                        st.error(f"❌ Erreur {response.status_code}: {response.text}")
+                
+                except requests.exceptions.RequestException as e:
+                    st.error(f"🔌 Connexion à l'API perdue: {e}. Relancez: l'envoi reprendra où il s'est arrêté.")
+                
+                except Exception as e:
+                    st.error(f"❌ Erreur: {str(e)}")
+
     # ========== ONGLET 2: Vidéo annotée ==========
     with tab2:
         st.header("🎥 Génération de Vidéo Annotée")
@@ -197,42 +421,43 @@ def main():
                 Cette option génère une vidéo avec les boîtes de détection et IDs de tracking dessinés.
                 """)
             
+            model_params2 = select_model("model_annotate")
+            
             if st.button("🎨 Générer vidéo annotée", type="primary", key="annotate_btn"):
-                with st.spinner("⏳ Traitement et annotation... Cela peut prendre plusieurs minutes..."):
-                    try:
-                        # Envoyer la vidéo à l'API
-                        files = {"file": (uploaded_file2.name, uploaded_file2.getvalue(), uploaded_file2.type)}
-                        response = requests.post(
-                            f"{API_URL}/detect-video-stream",
-                            files=files,
-                            timeout=600  # 10 minutes timeout
-                        )
+                progress_bar = st.progress(0.0, text="📤 Envoi de la vidéo...")
+                try:
+                    # Envoyer la vidéo par morceaux, puis suivre le job
+                    upload_id = upload_video(uploaded_file2, progress_bar)
+                    job = run_job(upload_id, "detect-video-stream", model_params2, progress_bar)
+                    response, video_bytes = download_result(job["job_id"], progress_bar)
+                    
+                    if response.status_code == 200:
+                        st.success("✅ Vidéo annotée générée avec succès!")
                         
-                        if response.status_code == 200:
-                            st.success("✅ Vidéo annotée générée avec succès!")
-                            
-                            # Afficher la vidéo annotée
-                            st.markdown("### 🎬 Vidéo Annotée")
-                            video_bytes = response.content
-                            st.video(video_bytes)
-                            
-                            # Bouton de téléchargement
-                            st.download_button(
-                                label="📥 Télécharger la vidéo annotée",
-                                data=video_bytes,
-                                file_name=f"annotated_{uploaded_file2.name}",
-                                mime="video/mp4"
-                            )
+                        # Afficher la vidéo annotée
+                        st.markdown("### 🎬 Vidéo Annotée")
+                        st.video(video_bytes)
                         
-                        else:
-                            st.error(f"❌ Erreur {response.status_code}: {response.text}")
-                    
-                    except requests.exceptions.Timeout:
-                        st.error("⏱️ Timeout: La vidéo est trop longue. Essayez une vidéo plus courte.")
+                        if job["summary"]:
+                            show_track_summary(job["summary"], job["frames_total"] or job["summary"]["frames"])
+                        
+                        # Bouton de téléchargement
+                        st.download_button(
+                            label="📥 Télécharger la vidéo annotée",
+                            data=video_bytes,
+                            file_name=f"annotated_{uploaded_file2.name}",
+                            mime="video/mp4"
+                        )
                     
-                    except Exception as e:
-                        st.error(f"❌ Erreur: {str(e)}")
-    
+                    else:
+                        st.error(f"❌ Erreur {response.status_code}: {response.text}")
+                
+                except requests.exceptions.RequestException as e:
+                    st.error(f"🔌 Connexion à l'API perdue: {e}. Relancez: l'envoi reprendra où il s'est arrêté.")
+                
+                except Exception as e:
+                    st.error(f"❌ Erreur: {str(e)}")
+
     # ========== ONGLET 3: Informations ==========
     with tab3:
         st.header("ℹ️ Informations sur le Système")
@@ -252,7 +477,7 @@ def main():
         - Analyse frame par frame
         - Extraction des détections et tracks
         - Export des données en JSON
-        - Statistiques détaillées
+        - Statistiques calculées sur toutes les frames (objets uniques, durée de présence, franchissements de lignes)
         
         **Onglet 2 - Vidéo Annotée:**
         - Génération d'une vidéo avec annotations visuelles
@@ -293,12 +518,14 @@ def main():
         
         - **YOLOv8n**: ~45 FPS (GPU) / ~15 FPS (CPU)
         - **Temps de traitement**: ~2-5 minutes pour une vidéo de 30s
+        - Mesurer sur votre machine: `python benchmark.py` (comparaison avec une
+          référence: `--baseline baseline.json`)
         
         ### 🆘 Support
         
         En cas de problème:
         - Vérifiez que l'API est en cours d'exécution
-        - Vérifiez la taille de la vidéo (< 100MB recommandé)
+        - Un envoi interrompu reprend là où il s'était arrêté: relancez simplement l'analyse
         - Consultez les logs du serveur FastAPI
         """)
         
@@ -0,0 +1,458 @@
+"""
+benchmark.py - Benchmark reproductible du débit de détection et de tracking
+
+Des vidéos synthétiques déterministes (formes colorées en mouvement, ou
+sprites découpés depuis un dossier d'images) sont générées à plusieurs
+résolutions et densités d'objets. ObjectDetector et ObjectTracker sont
+mesurés de bout en bout et par étape (décodage, détection, tracking, dessin):
+FPS, percentiles de latence et mémoire résidente, en JSON.
+
+Un rapport peut être enregistré comme référence puis comparé aux exécutions
+suivantes: toute baisse de FPS ou hausse de latence au-delà de la tolérance
+est signalée (code de sortie 1).
+
+`--filter-gain` mesure en plus le gain de FPS du filtre de détection
+(classes autorisées + zones polygonales appliquées dans l'inférence) sur les
+scènes denses: mêmes vidéos, avec et sans filtre.
+
+Usage:
+    python benchmark.py --output bench.json --save-baseline baseline.json
+    python benchmark.py --baseline baseline.json --tolerance 0.1
+    python benchmark.py --filter-gain --sprites sprites/ --classes person,car
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from detection_filter import DetectionFilter, parse_class_filter
+from profiling import current_rss_bytes
+
+
+RESOLUTIONS = {
+    "480p": (854, 480),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "4k": (3840, 2160),
+}
+
+# Nombre d'objets en mouvement par frame
+DENSITIES = {
+    "sparse": 4,
+    "medium": 16,
+    "crowded": 48,
+}
+
+STAGES = ("decode", "detect", "track", "draw")
+
+VIDEO_DIR = os.path.join("benchmarks", "videos")
+
+# Filtre par défaut de --filter-gain: personnes et véhicules dans une zone
+# trapézoïdale (type chaussée), en coordonnées normalisées
+FILTER_CLASSES = "person,bicycle,car,motorcycle,bus,truck"
+FILTER_ZONES = [[[0.1, 1.0], [0.4, 0.4], [0.6, 0.4], [0.9, 1.0]]]
+
+
+def load_sprites(directory, max_sprites=32):
+    """Images (découpes d'objets réels) à composer dans les vidéos synthétiques"""
+    sprites = []
+    for name in sorted(os.listdir(directory)):
+        image = cv2.imread(os.path.join(directory, name))
+        if image is not None:
+            sprites.append(image)
+        if len(sprites) >= max_sprites:
+            break
+    if not sprites:
+        raise ValueError(f"Aucune image lisible dans {directory}")
+    return sprites
+
+
+def synthetic_frames(width, height, num_objects, num_frames, seed=0, sprites=None):
+    """
+    Génère des frames déterministes: fond texturé fixe et objets qui rebondissent
+
+    Même graine => mêmes frames, octet pour octet.
+    """
+    rng = np.random.default_rng(seed)
+
+    # Fond: dégradé + bruit, identique pour toutes les frames
+    gradient = np.linspace(40, 160, width, dtype=np.float32)[None, :, None]
+    background = np.broadcast_to(gradient, (height, width, 3)).copy()
+    background += rng.normal(0, 8, size=(height, width, 3)).astype(np.float32)
+    background = np.clip(background, 0, 255).astype(np.uint8)
+
+    scale = min(width, height)
+    sizes = rng.integers(scale // 16, scale // 5, size=(num_objects, 2))
+    positions = rng.uniform(0, 1, size=(num_objects, 2)) * (np.array([width, height]) - sizes)
+    velocities = rng.uniform(-1, 1, size=(num_objects, 2)) * scale / 120
+    colors = rng.integers(0, 256, size=(num_objects, 3))
+    shapes = rng.integers(0, 2, size=num_objects)
+
+    objects = []
+    for i in range(num_objects):
+        w, h = int(sizes[i, 0]), int(sizes[i, 1])
+        if sprites:
+            objects.append(cv2.resize(sprites[i % len(sprites)], (w, h)))
+        else:
+            objects.append(None)
+
+    limits = np.array([width, height]) - sizes
+    for _ in range(num_frames):
+        frame = background.copy()
+        for i in range(num_objects):
+            x, y = int(positions[i, 0]), int(positions[i, 1])
+            w, h = int(sizes[i, 0]), int(sizes[i, 1])
+            if objects[i] is not None:
+                frame[y:y + h, x:x + w] = objects[i]
+            elif shapes[i] == 0:
+                cv2.rectangle(frame, (x, y), (x + w, y + h), colors[i].tolist(), -1)
+            else:
+                cv2.ellipse(frame, (x + w // 2, y + h // 2), (w // 2, h // 2), 0, 0, 360,
+                            colors[i].tolist(), -1)
+
+        yield frame
+
+        # Mouvement avec rebond sur les bords
+        positions += velocities
+        out = (positions < 0) | (positions > limits)
+        velocities[out] *= -1
+        positions = np.clip(positions, 0, limits)
+
+
+def write_synthetic_video(path, width, height, num_objects, num_frames, fps=25, seed=0,
+                          sprites=None):
+    """Écrit la vidéo synthétique (une seule fois: le fichier existant est réutilisé)"""
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    tmp_path = path + ".tmp.mp4"
+    out = cv2.VideoWriter(tmp_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    for frame in synthetic_frames(width, height, num_objects, num_frames, seed, sprites):
+        out.write(frame)
+    out.release()
+    os.replace(tmp_path, path)
+    return path
+
+
+def latency_stats(seconds):
+    """FPS et percentiles de latence (ms) d'une série de mesures"""
+    latencies = np.asarray(seconds, dtype=np.float64) * 1000
+    if not len(latencies):
+        return {"calls": 0}
+    total = latencies.sum() / 1000
+    return {
+        "calls": len(latencies),
+        "fps": round(float(len(latencies) / total), 2) if total > 0 else 0.0,
+        "mean_ms": round(float(latencies.mean()), 3),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p90_ms": round(float(np.percentile(latencies, 90)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "max_ms": round(float(latencies.max()), 3),
+    }
+
+
+def run_scenario(detector, tracker, video_path, warmup=10, detect_kwargs=None):
+    """
+    Mesure un scénario: chaque frame passe par décodage, détection, tracking
+    et dessin; chaque étape est chronométrée séparément.
+
+    Les `warmup` premières frames (chargement paresseux, caches) sont exclues.
+    """
+    detect_kwargs = detect_kwargs or {}
+    timings = {stage: [] for stage in STAGES}
+    end_to_end = []
+    detections_per_frame = []
+    peak_rss = current_rss_bytes()
+
+    tracker.reset()
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Impossible d'ouvrir {video_path}")
+
+    frame_index = 0
+    while True:
+        t0 = time.perf_counter()
+        ret, frame = cap.read()
+        t1 = time.perf_counter()
+        if not ret:
+            break
+
+        detections = detector.detect(frame, **detect_kwargs)
+        t2 = time.perf_counter()
+        tracks = tracker.update(frame, detections)
+        track_info = tracker.get_track_info(tracks)
+        t3 = time.perf_counter()
+        tracker.draw_track_info(frame, track_info, inplace=True)
+        t4 = time.perf_counter()
+
+        if frame_index >= warmup:
+            for stage, seconds in zip(STAGES, (t1 - t0, t2 - t1, t3 - t2, t4 - t3)):
+                timings[stage].append(seconds)
+            end_to_end.append(t4 - t0)
+            detections_per_frame.append(len(detections))
+            peak_rss = max(peak_rss, current_rss_bytes())
+        frame_index += 1
+
+    cap.release()
+    return {
+        "frames_measured": len(end_to_end),
+        "end_to_end": latency_stats(end_to_end),
+        "stages": {stage: latency_stats(values) for stage, values in timings.items()},
+        "detections_per_frame": round(float(np.mean(detections_per_frame)), 2)
+        if detections_per_frame else 0.0,
+        "peak_rss_mb": round(peak_rss / (1024 * 1024), 1),
+    }
+
+
+def environment_info(detector_config):
+    """Contexte de la mesure (comparer deux rapports n'a de sens qu'à contexte égal)"""
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "detector": detector_config,
+    }
+    try:
+        import torch
+        info["torch"] = torch.__version__
+        info["cuda"] = torch.cuda.is_available()
+    except ImportError:
+        pass
+    return info
+
+
+def scenario_video(resolution, density, num_frames, warmup, seed, sprites):
+    """Vidéo synthétique d'un scénario (générée une fois, puis réutilisée)"""
+    width, height = RESOLUTIONS[resolution]
+    variant = "sprites" if sprites else "shapes"
+    video_path = os.path.join(
+        VIDEO_DIR, f"{resolution}-{density}-{variant}-{num_frames}f-seed{seed}.mp4"
+    )
+    return write_synthetic_video(video_path, width, height, DENSITIES[density],
+                                 num_frames + warmup, seed=seed, sprites=sprites)
+
+
+def scale_zones(zones, width, height):
+    """Zones normalisées (0-1) -> polygones en pixels pour une résolution"""
+    return [[[round(x * width), round(y * height)] for x, y in zone] for zone in zones]
+
+
+def run_benchmark(detector, tracker, resolutions, densities, num_frames=120, warmup=10,
+                  seed=0, sprites=None, detect_kwargs=None):
+    """Exécute tous les scénarios résolution x densité"""
+    scenarios = []
+    for resolution in resolutions:
+        width, height = RESOLUTIONS[resolution]
+        for density in densities:
+            num_objects = DENSITIES[density]
+            name = f"{resolution}-{density}"
+            video_path = scenario_video(resolution, density, num_frames, warmup, seed, sprites)
+
+            print(f"⏱️  {name} ({width}x{height}, {num_objects} objets)...")
+            result = run_scenario(detector, tracker, video_path, warmup, detect_kwargs)
+            result.update({
+                "name": name,
+                "resolution": [width, height],
+                "objects": num_objects,
+            })
+            print(f"   {result['end_to_end'].get('fps', 0):.1f} FPS, "
+                  f"p50 {result['end_to_end'].get('p50_ms', 0):.1f} ms, "
+                  f"p99 {result['end_to_end'].get('p99_ms', 0):.1f} ms, "
+                  f"{result['peak_rss_mb']} Mo")
+            scenarios.append(result)
+    return scenarios
+
+
+def run_filter_gain(detector, tracker, resolutions, classes, zones, num_frames=120, warmup=10,
+                    seed=0, sprites=None, density="crowded"):
+    """
+    Gain du filtre de détection sur les scènes denses
+
+    Chaque vidéo est mesurée sans filtre puis avec les classes `classes`
+    (ids) et les zones `zones` (normalisées) poussées dans l'inférence.
+    """
+    results = []
+    for resolution in resolutions:
+        width, height = RESOLUTIONS[resolution]
+        video_path = scenario_video(resolution, density, num_frames, warmup, seed, sprites)
+        detection_filter = DetectionFilter(classes=classes,
+                                           polygons=scale_zones(zones, width, height))
+
+        print(f"⏱️  {resolution}-{density}: sans filtre / avec filtre...")
+        unfiltered = run_scenario(detector, tracker, video_path, warmup)
+        filtered = run_scenario(detector, tracker, video_path, warmup,
+                                {"detection_filter": detection_filter})
+
+        fps = filtered["end_to_end"].get("fps", 0.0)
+        base_fps = unfiltered["end_to_end"].get("fps", 0.0)
+        result = {
+            "name": f"{resolution}-{density}",
+            "resolution": [width, height],
+            "filter": detection_filter.to_dict(),
+            "unfiltered": unfiltered,
+            "filtered": filtered,
+            "fps_gain": round(fps / base_fps, 3) if base_fps else None,
+        }
+        print(f"   {base_fps:.1f} -> {fps:.1f} FPS"
+              + (f" (x{result['fps_gain']:.2f})" if result["fps_gain"] else "")
+              + f", détections/frame {unfiltered['detections_per_frame']}"
+              f" -> {filtered['detections_per_frame']}")
+        results.append(result)
+    return results
+
+
+def compare_reports(report, baseline, tolerance=0.1):
+    """
+    Compare deux rapports scénario par scénario
+
+    Régression: FPS de bout en bout en baisse, ou p50 d'une étape en hausse,
+    de plus de `tolerance` (fraction) par rapport à la référence.
+    """
+    reference = {s["name"]: s for s in baseline["scenarios"]}
+    comparisons = []
+    regressions = []
+
+    for scenario in report["scenarios"]:
+        base = reference.get(scenario["name"])
+        if base is None:
+            continue
+
+        fps, base_fps = scenario["end_to_end"].get("fps", 0.0), base["end_to_end"].get("fps", 0.0)
+        entry = {
+            "name": scenario["name"],
+            "fps": fps,
+            "baseline_fps": base_fps,
+            "fps_change": round(fps / base_fps - 1, 4) if base_fps else None,
+            "stages": {},
+        }
+        if base_fps and fps < base_fps * (1 - tolerance):
+            regressions.append(f"{scenario['name']}: FPS {base_fps:.1f} -> {fps:.1f}")
+
+        for stage, stats in scenario["stages"].items():
+            base_stats = base["stages"].get(stage, {})
+            p50, base_p50 = stats.get("p50_ms"), base_stats.get("p50_ms")
+            if p50 is None or not base_p50:
+                continue
+            entry["stages"][stage] = round(p50 / base_p50 - 1, 4)
+            # Les étapes très courtes sont trop bruitées pour être comparées en relatif
+            if base_p50 >= 1.0 and p50 > base_p50 * (1 + tolerance):
+                regressions.append(
+                    f"{scenario['name']}/{stage}: p50 {base_p50:.2f} -> {p50:.2f} ms"
+                )
+        comparisons.append(entry)
+
+    return {"tolerance": tolerance, "scenarios": comparisons, "regressions": regressions}
+
+
+def main():
+    from object_tracking import ObjectDetector, ObjectTracker
+
+    parser = argparse.ArgumentParser(description="Benchmark reproductible détection + tracking")
+    parser.add_argument("--resolutions", default="480p,720p,1080p",
+                        help=f"Parmi {', '.join(RESOLUTIONS)}")
+    parser.add_argument("--densities", default="sparse,medium,crowded",
+                        help=f"Parmi {', '.join(DENSITIES)}")
+    parser.add_argument("--frames", type=int, default=120, help="Frames mesurées par scénario")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sprites", default=None,
+                        help="Dossier d'images d'objets à composer (au lieu de formes)")
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--confidence", type=float, default=0.5)
+    parser.add_argument("--backend", default="torch")
+    parser.add_argument("--precision", default="fp32")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--save-baseline", default=None, help="Enregistrer le rapport comme référence")
+    parser.add_argument("--baseline", default=None, help="Rapport de référence à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Écart relatif toléré avant de signaler une régression")
+    parser.add_argument("--filter-gain", action="store_true",
+                        help="Mesurer aussi le gain du filtre classes + zones (scènes denses)")
+    parser.add_argument("--classes", default=FILTER_CLASSES,
+                        help="Classes autorisées pour --filter-gain (noms ou ids)")
+    parser.add_argument("--zones", default=json.dumps(FILTER_ZONES),
+                        help="Zones JSON normalisées (0-1) pour --filter-gain: [[[x,y], ...], ...]")
+    args = parser.parse_args()
+
+    resolutions = args.resolutions.split(",")
+    densities = args.densities.split(",")
+    for value, known in [(r, RESOLUTIONS) for r in resolutions] + [(d, DENSITIES) for d in densities]:
+        if value not in known:
+            parser.error(f"Valeur inconnue: {value}")
+
+    detector_config = {
+        "model_name": args.model,
+        "confidence_threshold": args.confidence,
+        "backend": args.backend,
+        "precision": args.precision,
+        "imgsz": args.imgsz,
+        "num_threads": args.threads,
+    }
+    detector = ObjectDetector(**detector_config)
+    tracker = ObjectTracker()
+    sprites = load_sprites(args.sprites) if args.sprites else None
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment_info(detector_config),
+        "settings": {
+            "frames": args.frames,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "sprites": bool(sprites),
+        },
+        "scenarios": run_benchmark(detector, tracker, resolutions, densities, args.frames,
+                                   args.warmup, args.seed, sprites),
+    }
+
+    if args.filter_gain:
+        report["filter_gain"] = run_filter_gain(
+            detector, tracker, resolutions, parse_class_filter(args.classes, detector.names),
+            json.loads(args.zones), args.frames, args.warmup, args.seed, sprites
+        )
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        report["comparison"] = compare_reports(report, baseline, args.tolerance)
+
+        print(f"\n📊 Comparaison avec {args.baseline}:")
+        for entry in report["comparison"]["scenarios"]:
+            change = entry["fps_change"]
+            print(f"  {entry['name']}: {entry['baseline_fps']:.1f} -> {entry['fps']:.1f} FPS"
+                  + (f" ({change:+.1%})" if change is not None else ""))
+        if report["comparison"]["regressions"]:
+            print("❌ Régressions:")
+            for regression in report["comparison"]["regressions"]:
+                print(f"  - {regression}")
+            exit_code = 1
+        else:
+            print("✅ Aucune régression")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Rapport: {args.output}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({k: v for k, v in report.items() if k != "comparison"}, f, indent=2)
+        print(f"💾 Référence: {args.save_baseline}")
+
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
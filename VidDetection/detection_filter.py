@@ -0,0 +1,188 @@
+"""
+detection_filter.py - Classes autorisées et zones polygonales appliquées dans l'inférence
+
+Plutôt que de détecter les 80 classes COCO sur toute la frame puis de filtrer
+en Python, le filtre est poussé dans l'inférence:
+- la liste de classes est transmise au modèle (`classes=`), qui écarte les
+  autres classes avant la NMS;
+- seules les zones d'intérêt sont envoyées au modèle: chaque zone est
+  découpée selon son rectangle englobant et les pixels hors polygone sont
+  remplis de gris (valeur du letterbox YOLO), si bien qu'aucun objet hors
+  zone n'est détecté.
+Les boîtes dont le centre tombe hors des polygones sont enfin écartées: rien
+d'autre n'atteint le tracker ni l'embedder Deep SORT.
+"""
+
+import json
+
+import cv2
+import numpy as np
+
+from tiling import shift_predictions
+
+
+# Gris de remplissage du letterbox YOLO: neutre pour le modèle
+FILL_VALUE = 114
+
+
+def parse_class_filter(value, names):
+    """
+    Convertit 'person,car' (noms ou ids) en liste triée d'ids de classes
+
+    `names` est le dictionnaire {id: nom} du modèle. None = toutes les classes.
+    """
+    if not value:
+        return None
+
+    by_name = {name: class_id for class_id, name in names.items()}
+    items = value if isinstance(value, (list, tuple)) else str(value).split(",")
+    classes = set()
+    for item in items:
+        item = str(item).strip()
+        if not item:
+            continue
+        if item.isdigit() and int(item) in names:
+            classes.add(int(item))
+        elif item in by_name:
+            classes.add(by_name[item])
+        else:
+            raise ValueError(f"Classe inconnue: {item}")
+    return sorted(classes) or None
+
+
+def parse_polygons(polygons):
+    """Convertit une chaîne JSON '[[[x,y], [x,y], [x,y], ...], ...]' en polygones"""
+    if not polygons:
+        return None
+
+    parsed = json.loads(polygons) if isinstance(polygons, str) else polygons
+    if not isinstance(parsed, list) or not all(
+        isinstance(polygon, (list, tuple)) and len(polygon) >= 3
+        and all(isinstance(point, (list, tuple)) and len(point) == 2 for point in polygon)
+        for polygon in parsed
+    ):
+        raise ValueError("Les zones doivent être une liste de polygones [[x, y], ...] (3 points min.)")
+
+    try:
+        return [[[int(x), int(y)] for x, y in polygon] for polygon in parsed]
+    except (TypeError, ValueError):
+        # ex: [[[null, 1], ...]] ou des coordonnées non numériques
+        raise ValueError("Les coordonnées des zones doivent être des nombres")
+
+
+def merge_rects(rects):
+    """Fusionne les rectangles [x1, y1, x2, y2] qui se chevauchent (résultat disjoint)"""
+    rects = [list(rect) for rect in rects]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(rects)):
+            for j in range(i + 1, len(rects)):
+                a, b = rects[i], rects[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    rects[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del rects[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return rects
+
+
+class DetectionFilter:
+    """Filtre de détection d'un job: classes autorisées et zones polygonales"""
+
+    def __init__(self, classes=None, polygons=None):
+        self.classes = sorted(set(int(c) for c in classes)) if classes else None
+        self.polygons = parse_polygons(polygons) or []
+        # Masque, découpes et buffers, calculés une fois par taille de frame
+        self._layout = None
+
+    @property
+    def active(self):
+        return self.classes is not None or bool(self.polygons)
+
+    def to_dict(self):
+        """Représentation sérialisable (fait partie de la clé du cache de résultats)"""
+        return {"classes": self.classes, "polygons": self.polygons}
+
+    def __getstate__(self):
+        # Les buffers ne sont pas envoyés aux workers de segments
+        state = dict(self.__dict__)
+        state["_layout"] = None
+        return state
+
+    def _prepare(self, shape):
+        """Masque des zones et rectangles de découpe pour une taille de frame"""
+        if self._layout is not None and self._layout["shape"] == shape:
+            return self._layout
+
+        height, width = shape[:2]
+        mask = np.zeros((height, width), dtype=np.uint8)
+        cv2.fillPoly(mask, [np.asarray(p, dtype=np.int32) for p in self.polygons], 255)
+
+        rects = []
+        for polygon in self.polygons:
+            points = np.asarray(polygon)
+            x1, y1 = np.clip(points.min(axis=0), 0, [width, height])
+            x2, y2 = np.clip(points.max(axis=0) + 1, 0, [width, height])
+            if x2 > x1 and y2 > y1:
+                rects.append([int(x1), int(y1), int(x2), int(y2)])
+
+        regions = []
+        for x1, y1, x2, y2 in merge_rects(rects):
+            region_mask = mask[y1:y2, x1:x2]
+            # Zone rectangulaire: la découpe suffit, sans masquage
+            full = bool(region_mask.all())
+            buffer = None if full else np.full((y2 - y1, x2 - x1) + tuple(shape[2:]),
+                                               FILL_VALUE, dtype=np.uint8)
+            regions.append({"rect": (x1, y1, x2, y2), "mask": region_mask, "buffer": buffer})
+
+        # Frame entière masquée (mask_frame), allouée au premier usage
+        self._layout = {"shape": shape, "mask": mask, "regions": regions, "masked": None}
+        return self._layout
+
+    def crops(self, frame):
+        """
+        Découpes masquées des zones: retourne (crops, offsets)
+
+        Les découpes masquées sont écrites dans des buffers réutilisés: elles
+        doivent être consommées (inférence) avant l'appel suivant.
+        """
+        layout = self._prepare(frame.shape)
+        crops, offsets = [], []
+        for region in layout["regions"]:
+            x1, y1, x2, y2 = region["rect"]
+            crop = frame[y1:y2, x1:x2]
+            if region["buffer"] is not None:
+                # Seuls les pixels des polygones sont copiés, le reste reste gris
+                crop = cv2.copyTo(crop, region["mask"], region["buffer"])
+            crops.append(crop)
+            offsets.append((x1, y1))
+        return crops, offsets
+
+    def mask_frame(self, frame):
+        """
+        Frame entière, pixels hors zones remplis de gris (inférence par tuiles)
+
+        Comme pour crops(), le résultat est écrit dans un buffer réutilisé: le
+        gris hors zones n'est rempli qu'une fois par taille de frame.
+        """
+        layout = self._prepare(frame.shape)
+        if layout["masked"] is None:
+            layout["masked"] = np.full_like(frame, FILL_VALUE)
+        return cv2.copyTo(frame, layout["mask"], layout["masked"])
+
+    def inside(self, boxes):
+        """Masque booléen des boîtes dont le centre est dans une zone"""
+        if not self.polygons or len(boxes) == 0:
+            return np.ones(len(boxes), dtype=bool)
+        mask = self._layout["mask"]
+        height, width = mask.shape
+        cx = ((boxes[:, 0] + boxes[:, 2]) / 2).astype(np.int64).clip(0, width - 1)
+        cy = ((boxes[:, 1] + boxes[:, 3]) / 2).astype(np.int64).clip(0, height - 1)
+        return mask[cy, cx] > 0
+
+    def merge(self, predictions, offsets):
+        """Ramène les prédictions des zones dans le repère de la frame (zones disjointes: pas de NMS)"""
+        return shift_predictions(predictions, offsets)
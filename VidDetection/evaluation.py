@@ -1,246 +1,878 @@
 """
-evaluation.py - Script d'évaluation des performances du modèle YOLOv8      
+evaluation.py - Script d'évaluation des performances du modèle YOLOv8
 
-Ce script évalue le modèle sur un dataset de test et génère des métriques de performance.
+Ce script évalue le modèle sur un dataset annoté (format YOLO ou COCO) et
+calcule l'AP par classe, le mAP@0.5 et le mAP@[.5:.95] (interpolation COCO à
+101 points). L'inférence est faite par batches, avec un décodage des images
+multi-threadé et, en option, un pool de processus. L'appariement
+prédictions / vérité terrain est vectorisé avec NumPy.
+
+Les prédictions brutes (seuil de confiance très bas) sont mises en cache par
+modèle et dataset: les courbes précision / rappel / F1, les courbes PR et la
+matrice de confusion se recalculent ensuite en quelques secondes pour tout
+seuil, IoU ou filtre de classes.
+
+Usage:
+    python evaluation.py --data datasets/coco128 --split train2017
+    python evaluation.py --data annotations/instances_val2017.json --images val2017/
+    python evaluation.py --data datasets/coco128 --threshold 0.35 --iou 0.75 --classes person,car
 """
 
-from ultralytics import YOLO
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import cv2
 import matplotlib.pyplot as plt
 import numpy as np
-import os
 
-def evaluate_yolo_model():
+from prediction_cache import PredictionCache, prediction_key
+from tiling import box_iou_matrix
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+# Seuils d'IoU du mAP@[.5:.95] et points de rappel de l'interpolation COCO
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+RECALL_POINTS = np.linspace(0.0, 1.0, 101)
+
+# Détecteur propre à chaque processus worker (mode --processes)
+_worker_detector = None
+
+
+class EvalDataset:
+    """Images annotées: boîtes xyxy normalisées (0-1) et classes par image"""
+
+    def __init__(self, images, boxes, classes, names=None, source=None):
+        self.images = images
+        self.boxes = boxes
+        self.classes = classes
+        self.names = names
+        self.source = source
+
+    def __len__(self):
+        return len(self.images)
+
+    @property
+    def num_labels(self):
+        return int(sum(len(c) for c in self.classes))
+
+
+def _read_names(names):
+    """Noms de classes YAML (liste ou dict) -> {id: nom}"""
+    if names is None:
+        return None
+    if isinstance(names, dict):
+        return {int(k): str(v) for k, v in names.items()}
+    return {i: str(name) for i, name in enumerate(names)}
+
+
+def _parse_yolo_label(path):
+    """Fichier de labels YOLO: `classe cx cy w h` (ou polygone) par ligne"""
+    boxes, classes = [], []
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                values = line.split()
+                if len(values) < 5:
+                    continue
+                coords = np.asarray(values[1:], dtype=np.float32)
+                if len(coords) == 4:
+                    cx, cy, w, h = coords
+                    boxes.append([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2])
+                else:
+                    # Segmentation: boîte englobante du polygone
+                    xs, ys = coords[0::2], coords[1::2]
+                    boxes.append([xs.min(), ys.min(), xs.max(), ys.max()])
+                classes.append(int(float(values[0])))
+    return (np.asarray(boxes, dtype=np.float32).reshape(-1, 4),
+            np.asarray(classes, dtype=np.int64))
+
+
+def load_yolo_dataset(path, split=None):
     """
-    Évalue le modèle YOLOv8 sur un dataset de test
+    Dataset au format YOLO
+
+    `path` est soit un data.yaml (clés path / val / names), soit un dossier
+    contenant images/ et labels/ (éventuellement avec un sous-dossier `split`).
+    Les labels d'une image `.../images/x.jpg` sont lus dans `.../labels/x.txt`.
+    """
+    names = None
+    if path.endswith(('.yaml', '.yml')):
+        import yaml
+
+        with open(path, encoding="utf-8") as f:
+            config = yaml.safe_load(f)
+        base = config.get("path") or os.path.dirname(path)
+        if not os.path.isabs(base):
+            base = os.path.join(os.path.dirname(path), base)
+        images_dir = os.path.join(base, config[split or "val"])
+        names = _read_names(config.get("names"))
+    else:
+        images_dir = path
+        for candidate in (os.path.join(path, "images", split or ""), os.path.join(path, "images")):
+            if os.path.isdir(candidate):
+                images_dir = candidate
+                break
+
+    images_dir = os.path.normpath(images_dir)
+    parts = images_dir.split(os.sep)
+    if "images" in parts:
+        index = len(parts) - 1 - parts[::-1].index("images")
+        labels_dir = os.sep.join(parts[:index] + ["labels"] + parts[index + 1:])
+    else:
+        labels_dir = images_dir
+
+    images, boxes, classes = [], [], []
+    for name in sorted(os.listdir(images_dir)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        label_path = os.path.join(labels_dir, os.path.splitext(name)[0] + ".txt")
+        image_boxes, image_classes = _parse_yolo_label(label_path)
+        images.append(os.path.join(images_dir, name))
+        boxes.append(np.clip(image_boxes, 0.0, 1.0))
+        classes.append(image_classes)
+
+    return EvalDataset(images, boxes, classes, names, source=path)
+
+
+def load_coco_dataset(annotation_path, image_dir=None):
+    """
+    Dataset au format COCO (instances_*.json)
+
+    Les catégories sont renumérotées de façon contiguë (ordre des ids), comme
+    pour les modèles YOLO entraînés sur COCO. Les annotations `iscrowd` sont
+    ignorées.
+    """
+    with open(annotation_path, encoding="utf-8") as f:
+        coco = json.load(f)
+
+    image_dir = image_dir or os.path.dirname(annotation_path)
+    categories = sorted(coco["categories"], key=lambda c: c["id"])
+    category_index = {c["id"]: i for i, c in enumerate(categories)}
+    names = {i: c["name"] for i, c in enumerate(categories)}
+
+    per_image = {image["id"]: ([], []) for image in coco["images"]}
+    sizes = {image["id"]: (image["width"], image["height"]) for image in coco["images"]}
+    for annotation in coco["annotations"]:
+        if annotation.get("iscrowd", 0):
+            continue
+        width, height = sizes[annotation["image_id"]]
+        x, y, w, h = annotation["bbox"]
+        image_boxes, image_classes = per_image[annotation["image_id"]]
+        image_boxes.append([x / width, y / height, (x + w) / width, (y + h) / height])
+        image_classes.append(category_index[annotation["category_id"]])
+
+    images, boxes, classes = [], [], []
+    for image in sorted(coco["images"], key=lambda i: i["file_name"]):
+        image_boxes, image_classes = per_image[image["id"]]
+        images.append(os.path.join(image_dir, image["file_name"]))
+        boxes.append(np.clip(np.asarray(image_boxes, dtype=np.float32).reshape(-1, 4), 0.0, 1.0))
+        classes.append(np.asarray(image_classes, dtype=np.int64))
+
+    return EvalDataset(images, boxes, classes, names, source=annotation_path)
+
+
+def load_dataset(path, image_dir=None, split=None):
+    """Charge un dataset COCO (.json) ou YOLO (dossier ou data.yaml)"""
+    if path.endswith(".json"):
+        return load_coco_dataset(path, image_dir)
+    return load_yolo_dataset(path, split)
+
+
+def class_mapping(model_names, dataset_names):
+    """
+    Table classe du modèle -> classe du dataset (-1 = classe absente du dataset)
+
+    Les classes sont associées par nom; sans nom commun (ou sans noms côté
+    dataset), les indices sont supposés identiques.
+    """
+    model_names = _read_names(model_names)
+    size = max(model_names) + 1
+    if dataset_names:
+        by_name = {name: i for i, name in dataset_names.items()}
+        mapping = np.array([by_name.get(model_names.get(i), -1) for i in range(size)])
+        if (mapping >= 0).any():
+            return mapping
+    return np.arange(size)
+
+
+# ----------------------------------------------------------------- inférence
+
+def _read_image(path):
+    image = cv2.imread(path)
+    if image is None:
+        raise ValueError(f"Image illisible: {path}")
+    return image
+
+
+def predict_images(detector, image_paths, batch_size=16, io_threads=4, progress=True):
+    """
+    Prédictions brutes (boîtes normalisées, scores, classes du modèle) par image
+
+    Les images du batch suivant sont décodées par un pool de threads pendant
+    l'inférence du batch courant.
+    """
+    predictions = []
+    batches = [image_paths[i:i + batch_size] for i in range(0, len(image_paths), batch_size)]
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=io_threads) as pool:
+        pending = pool.map(_read_image, batches[0]) if batches else None
+        for index, batch in enumerate(batches):
+            images = list(pending)
+            if index + 1 < len(batches):
+                pending = pool.map(_read_image, batches[index + 1])
+
+            for image, (boxes, scores, class_ids) in zip(
+                images, detector._predict(images, imgsz=detector.imgsz)
+            ):
+                height, width = image.shape[:2]
+                scale = np.array([width, height, width, height], dtype=np.float32)
+                predictions.append((
+                    np.asarray(boxes, dtype=np.float32).reshape(-1, 4) / scale,
+                    np.asarray(scores, dtype=np.float32),
+                    np.asarray(class_ids, dtype=np.int64),
+                ))
+
+            done = len(predictions)
+            if progress and (index % 20 == 0 or done == len(image_paths)):
+                rate = done / max(time.perf_counter() - start, 1e-9)
+                print(f"  Progression: {done}/{len(image_paths)} images ({rate:.1f} img/s)")
+
+    return predictions
+
+
+def _init_worker(detector_config, num_threads):
+    """Charge un détecteur par processus worker"""
+    global _worker_detector
+    from object_tracking import ObjectDetector
+
+    config = dict(detector_config)
+    config["num_threads"] = num_threads
+    _worker_detector = ObjectDetector(**config)
+
+
+def _predict_shard(image_paths, batch_size, io_threads):
+    predictions = predict_images(_worker_detector, image_paths, batch_size, io_threads,
+                                 progress=False)
+    return predictions, _worker_detector.names
+
+
+def run_inference(detector_config, image_paths, batch_size=16, io_threads=4, processes=1):
+    """
+    Inférence sur toutes les images, dans ce processus ou réparties sur un pool
+
+    Retourne (predictions, model_names).
+    """
+    from object_tracking import ObjectDetector
+
+    if processes <= 1:
+        detector = ObjectDetector(**detector_config)
+        return predict_images(detector, image_paths, batch_size, io_threads), detector.names
+
+    # Partage des cœurs entre workers pour éviter la sur-souscription
+    threads_per_worker = max(1, (os.cpu_count() or 1) // processes)
+    shard_size = -(-len(image_paths) // processes)
+    shards = [image_paths[i:i + shard_size] for i in range(0, len(image_paths), shard_size)]
+    print(f"⚡ Inférence sur {len(shards)} processus ({threads_per_worker} threads/processus)")
+
+    with ProcessPoolExecutor(
+        max_workers=len(shards),
+        mp_context=mp.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(detector_config, threads_per_worker),
+    ) as pool:
+        futures = [pool.submit(_predict_shard, shard, batch_size, io_threads) for shard in shards]
+        predictions = []
+        for i, future in enumerate(futures, 1):
+            shard_predictions, names = future.result()
+            predictions.extend(shard_predictions)
+            print(f"  Shard {i}/{len(shards)} terminé")
+
+    return predictions, names
+
+
+# --------------------------------------------------------------- appariement
+
+def match_image(pred_boxes, pred_scores, pred_classes, gt_boxes, gt_classes,
+                iou_thresholds=IOU_THRESHOLDS):
+    """
+    Vrais positifs (n_pred, n_seuils) d'une image, appariement glouton COCO
+
+    Les prédictions sont parcourues par score décroissant; chacune prend la
+    vérité terrain libre de même classe ayant la meilleure IoU (>= seuil). Les
+    10 seuils sont traités ensemble, et seules les prédictions qui
+    recouvrent une vérité terrain au seuil minimal sont parcourues.
+    """
+    num_thresholds = len(iou_thresholds)
+    tp = np.zeros((len(pred_boxes), num_thresholds), dtype=bool)
+    if len(pred_boxes) == 0 or len(gt_boxes) == 0:
+        return tp
+
+    order = np.argsort(-pred_scores, kind="stable")
+    iou = box_iou_matrix(pred_boxes[order], gt_boxes)
+    iou[pred_classes[order][:, None] != gt_classes[None, :]] = 0.0
+
+    matched = np.zeros((num_thresholds, len(gt_boxes)), dtype=bool)
+    rows = np.arange(num_thresholds)
+    for p in np.flatnonzero(iou.max(axis=1) >= iou_thresholds[0]):
+        candidates = np.where(matched, -1.0, iou[p])
+        best = candidates.argmax(axis=1)
+        hit = candidates[rows, best] >= iou_thresholds
+        tp[order[p], hit] = True
+        matched[rows[hit], best[hit]] = True
+    return tp
+
+
+def map_classes(class_ids, mapping):
+    """Classes du modèle -> classes du dataset (-1 = écartée)"""
+    known = class_ids < len(mapping)
+    return np.where(known, mapping[np.where(known, class_ids, 0)], -1)
+
+
+def iou_index(iou):
+    """Colonne de la matrice des vrais positifs correspondant au seuil d'IoU"""
+    matches = np.flatnonzero(np.isclose(IOU_THRESHOLDS, iou))
+    if not len(matches):
+        raise ValueError(f"IoU {iou} hors de la grille {np.round(IOU_THRESHOLDS, 2).tolist()}")
+    return int(matches[0])
+
+
+def parse_classes(value, names):
+    """Filtre de classes 'person,car' ou '0,2' -> liste d'indices du dataset"""
+    if not value:
+        return None
+    by_name = {name: i for i, name in names.items()}
+    classes = []
+    for item in value.split(","):
+        item = item.strip()
+        if item.isdigit():
+            classes.append(int(item))
+        elif item in by_name:
+            classes.append(by_name[item])
+        else:
+            raise ValueError(f"Classe inconnue: {item}")
+    return classes
+
+
+def match_dataset(predictions, dataset, mapping, classes=None):
+    """
+    Apparie toutes les images et concatène (tp, scores, classes prédites,
+    classes de la vérité terrain). Les classes du modèle absentes du dataset,
+    ou hors du filtre `classes`, sont écartées.
+    """
+    if classes is not None:
+        mapping = np.where(np.isin(mapping, classes), mapping, -1)
+
+    tps, scores, pred_classes, labels = [], [], [], []
+    for (boxes, conf, class_ids), gt_boxes, gt_classes in zip(
+        predictions, dataset.boxes, dataset.classes
+    ):
+        class_ids = map_classes(class_ids, mapping)
+        keep = class_ids >= 0
+        boxes, conf, class_ids = boxes[keep], conf[keep], class_ids[keep]
+        if classes is not None:
+            keep = np.isin(gt_classes, classes)
+            gt_boxes, gt_classes = gt_boxes[keep], gt_classes[keep]
+
+        tps.append(match_image(boxes, conf, class_ids, gt_boxes, gt_classes))
+        scores.append(conf)
+        pred_classes.append(class_ids)
+        labels.append(gt_classes)
+
+    return (
+        np.concatenate(tps) if tps else np.zeros((0, len(IOU_THRESHOLDS)), dtype=bool),
+        np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32),
+        np.concatenate(pred_classes) if pred_classes else np.zeros(0, dtype=np.int64),
+        np.concatenate(labels) if labels else np.zeros(0, dtype=np.int64),
+    )
+
+
+def average_precision(tp, scores, pred_classes, gt_classes, num_classes):
+    """
+    AP par classe et par seuil d'IoU (num_classes, n_seuils), interpolation
+    COCO à 101 points de rappel. Retourne aussi le nombre de vérités terrain
+    par classe (les classes sans vérité terrain sont exclues du mAP) et les
+    courbes précision-rappel interpolées (num_classes, 101, n_seuils).
+    """
+    num_gt = np.bincount(gt_classes, minlength=num_classes)[:num_classes]
+    curves = np.zeros((num_classes, len(RECALL_POINTS), tp.shape[1]))
+
+    order = np.argsort(-scores, kind="stable")
+    tp, pred_classes = tp[order], pred_classes[order]
+
+    for c in np.flatnonzero(num_gt):
+        class_tp = tp[pred_classes == c]
+        if not len(class_tp):
+            continue
+        tpc = class_tp.cumsum(axis=0)
+        fpc = (~class_tp).cumsum(axis=0)
+        recall = tpc / num_gt[c]
+        precision = tpc / (tpc + fpc)
+        # Enveloppe décroissante de la courbe précision-rappel
+        precision = np.flip(np.maximum.accumulate(np.flip(precision, axis=0), axis=0), axis=0)
+
+        for t in range(tp.shape[1]):
+            index = np.searchsorted(recall[:, t], RECALL_POINTS, side="left")
+            valid = index < len(recall)
+            curves[c, :, t] = np.where(valid, precision[np.minimum(index, len(recall) - 1), t], 0.0)
+
+    return curves.mean(axis=1), num_gt, curves
+
+
+def threshold_sweep(tp, scores, num_gt, thresholds, iou_column=0):
+    """
+    Précision, rappel et F1 pour tous les seuils de confiance en une passe
+
+    L'appariement glouton suit l'ordre des scores: relever le seuil ne fait
+    que retirer les prédictions les plus faibles, sans changer l'appariement
+    des autres. Les vrais positifs cumulés sur les scores triés donnent donc
+    directement les métriques de chaque seuil.
+    """
+    order = np.argsort(-scores, kind="stable")
+    sorted_scores = scores[order]
+    cumulative_tp = np.concatenate([[0], tp[order, iou_column].cumsum()])
+
+    kept = np.searchsorted(-sorted_scores, -np.asarray(thresholds), side="right")
+    true_positives = cumulative_tp[kept]
+    precision = true_positives / np.maximum(kept, 1)
+    recall = true_positives / max(int(num_gt), 1)
+    f1 = 2 * precision * recall / np.maximum(precision + recall, 1e-9)
+    return precision, recall, f1
+
+
+def precision_recall_at(tp, scores, num_gt, threshold, iou_column=0):
+    """Précision, rappel et F1 des prédictions de score >= threshold"""
+    precision, recall, f1 = threshold_sweep(tp, scores, num_gt, [threshold], iou_column)
+    return float(precision[0]), float(recall[0]), float(f1[0])
+
+
+def confusion_matrix(predictions, dataset, mapping, num_classes, threshold=0.5, iou=0.5,
+                     classes=None):
+    """
+    Matrice de confusion (vérité terrain en lignes, prédiction en colonnes)
+
+    La dernière ligne / colonne est le fond: prédictions sans vérité terrain
+    (faux positifs) et objets non détectés. L'appariement ignore les classes,
+    par IoU décroissante.
+    """
+    background = num_classes
+    matrix = np.zeros((num_classes + 1, num_classes + 1), dtype=np.int64)
+    if classes is not None:
+        mapping = np.where(np.isin(mapping, classes), mapping, -1)
+
+    for (boxes, conf, class_ids), gt_boxes, gt_classes in zip(
+        predictions, dataset.boxes, dataset.classes
+    ):
+        class_ids = map_classes(class_ids, mapping)
+        keep = (class_ids >= 0) & (conf >= threshold)
+        boxes, class_ids = boxes[keep], class_ids[keep]
+        if classes is not None:
+            keep = np.isin(gt_classes, classes)
+            gt_boxes, gt_classes = gt_boxes[keep], gt_classes[keep]
+
+        pred_matched = np.zeros(len(boxes), dtype=bool)
+        gt_matched = np.zeros(len(gt_boxes), dtype=bool)
+        if len(boxes) and len(gt_boxes):
+            overlaps = box_iou_matrix(boxes, gt_boxes)
+            pairs = np.argwhere(overlaps >= iou)
+            if len(pairs):
+                # Glouton par IoU décroissante: chaque boîte appariée au plus une fois
+                order = np.argsort(-overlaps[pairs[:, 0], pairs[:, 1]], kind="stable")
+                for p, g in pairs[order]:
+                    if pred_matched[p] or gt_matched[g]:
+                        continue
+                    pred_matched[p] = gt_matched[g] = True
+                    matrix[gt_classes[g], class_ids[p]] += 1
+
+        np.add.at(matrix, (gt_classes[~gt_matched], background), 1)
+        np.add.at(matrix, (background, class_ids[~pred_matched]), 1)
+
+    return matrix
+
+
+def evaluate_predictions(dataset, predictions, model_names, threshold=0.5, iou=0.5,
+                         classes=None, sweep_step=0.01, min_confidence=0.0):
+    """Métriques de détection complètes à partir des prédictions brutes"""
+    names = dataset.names or _read_names(model_names)
+    labelled = [c.max() for c in dataset.classes if len(c)]
+    num_classes = max(max(names), max(labelled, default=-1)) + 1
+    mapping = class_mapping(model_names, dataset.names)
+    column = iou_index(iou)
+
+    tp, scores, pred_classes, gt_classes = match_dataset(predictions, dataset, mapping, classes)
+    ap, num_gt, curves = average_precision(tp, scores, pred_classes, gt_classes, num_classes)
+    evaluated = num_gt > 0
+    precision, recall, f1 = precision_recall_at(tp, scores, num_gt.sum(), threshold, column)
+
+    # Balayage des seuils (au-dessus du seuil de confiance de l'inférence)
+    thresholds = np.round(np.arange(max(min_confidence, sweep_step), 1.0, sweep_step), 4)
+    sweep_p, sweep_r, sweep_f1 = threshold_sweep(tp, scores, num_gt.sum(), thresholds, column)
+    best = int(np.argmax(sweep_f1)) if len(thresholds) else None
+
+    per_class = {}
+    pr_curves = {}
+    for c in np.flatnonzero(evaluated):
+        name = names.get(int(c), str(c))
+        class_mask = pred_classes == c
+        p, r, f = precision_recall_at(tp[class_mask], scores[class_mask], num_gt[c],
+                                      threshold, column)
+        per_class[name] = {
+            "labels": int(num_gt[c]),
+            "predictions": int((scores[class_mask] >= threshold).sum()),
+            "precision": round(p, 4),
+            "recall": round(r, 4),
+            "ap50": round(float(ap[c, 0]), 4),
+            "ap50_95": round(float(ap[c].mean()), 4),
+        }
+        pr_curves[name] = np.round(curves[c, :, column], 4).tolist()
+
+    matrix = confusion_matrix(predictions, dataset, mapping, num_classes, threshold, iou, classes)
+    shown = np.flatnonzero((matrix[:-1].sum(axis=1) + matrix[:, :-1].sum(axis=0)) > 0)
+
+    return {
+        "images": len(dataset),
+        "labels": int(num_gt.sum()),
+        "classes_evaluated": int(evaluated.sum()),
+        "classes_filter": [names.get(c, str(c)) for c in classes] if classes else None,
+        "threshold": threshold,
+        "iou": float(IOU_THRESHOLDS[column]),
+        "mAP50": float(ap[evaluated, 0].mean()) if evaluated.any() else 0.0,
+        "mAP50_95": float(ap[evaluated].mean()) if evaluated.any() else 0.0,
+        "precision": precision,
+        "recall": recall,
+        "f1": f1,
+        "best_f1": {
+            "threshold": float(thresholds[best]),
+            "precision": float(sweep_p[best]),
+            "recall": float(sweep_r[best]),
+            "f1": float(sweep_f1[best]),
+        } if best is not None else None,
+        "per_class": per_class,
+        "sweep": {
+            "thresholds": thresholds.tolist(),
+            "precision": np.round(sweep_p, 4).tolist(),
+            "recall": np.round(sweep_r, 4).tolist(),
+            "f1": np.round(sweep_f1, 4).tolist(),
+        },
+        "pr_curves": {"recall": RECALL_POINTS.tolist(), "precision": pr_curves},
+        "confusion_matrix": {
+            "labels": [names.get(int(c), str(c)) for c in shown] + ["background"],
+            "matrix": matrix[np.append(shown, num_classes)][:, np.append(shown, num_classes)].tolist(),
+        },
+    }
+
+
+def load_predictions(dataset, detector_config, batch_size=16, io_threads=4, processes=1,
+                     cache_dir=None, hash_content=False):
+    """
+    Prédictions brutes du modèle sur le dataset, depuis le cache si possible
+
+    Retourne (predictions, model_names, cache_status).
+    """
+    cache = PredictionCache(cache_dir) if cache_dir else None
+    key = prediction_key(dataset.images, detector_config, hash_content) if cache else None
+
+    if cache is not None:
+        cached = cache.load(key)
+        if cached is not None:
+            predictions, names, meta = cached
+            print(f"♻️  Prédictions en cache: {key[:12]}... "
+                  f"({sum(len(s) for _, s, _ in predictions)} boîtes)")
+            return predictions, names, "hit"
+
+    print("\n🔮 Génération des prédictions...")
+    start = time.perf_counter()
+    predictions, model_names = run_inference(
+        detector_config, dataset.images, batch_size, io_threads, processes
+    )
+    model_names = _read_names(model_names)
+    elapsed = time.perf_counter() - start
+    print(f"✅ {len(predictions)} images en {elapsed:.1f}s")
+
+    if cache is not None:
+        path = cache.save(key, predictions, model_names, source=dataset.source,
+                          images=len(dataset), inference_s=round(elapsed, 2))
+        print(f"💾 Prédictions enregistrées: {path}")
+    return predictions, model_names, "miss" if cache is not None else None
+
+
+def evaluate_yolo_model(data, image_dir=None, split=None, detector_config=None, threshold=0.5,
+                        iou=0.5, classes=None, batch_size=16, io_threads=4, processes=1,
+                        cache_dir=None, hash_content=False, show=False):
+    """
+    Évalue le modèle YOLOv8 sur un dataset annoté (YOLO ou COCO)
     """
     print("="*60)
     print("📊 ÉVALUATION DU MODÈLE YOLOv8")
     print("="*60)
-    
-    # Charger le modèle YOLOv8 nano
-    print("\n📦 Chargement du modèle YOLOv8 nano...")
-    model = YOLO("yolov8n.pt")
-    print("✅ Modèle chargé!")
-    
-    # Dataset test (images + annotations)
-    # IMPORTANT: Adaptez ces chemins à votre dataset
-    test_images = [
-        "test/img1.jpg",
-        "test/img2.jpg",
-        "test/img3.jpg"
-    ]
-    
-    # Labels réels (classes présentes dans chaque image)
-    # Format: liste de listes de class_ids
-    true_labels = [
-        [0, 1],      # img1: person, bicycle
-        [1, 2],      # img2: bicycle, car
-        [0, 2, 3]    # img3: person, car, motorcycle
-    ]
-    
-    # Vérifier si les images existent
-    print("\n🔍 Vérification des images de test...")
-    missing_images = [img for img in test_images if not os.path.exists(img)]
-    
-    if missing_images:
-        print(f"⚠️  Images manquantes: {missing_images}")
-        print("\n💡 Conseil: Créez un dossier 'test/' avec vos images de test")
-        print("   Ou modifiez les chemins dans le script")
-        
-        # Créer des données synthétiques pour la démo
-        print("\n🎲 Utilisation de données synthétiques pour la démonstration...")
-        return evaluate_with_synthetic_data()
-    
-    print("✅ Toutes les images sont présentes!")
-    
-    # Prédictions
-    print("\n🔮 Génération des prédictions...")
-    pred_labels = []
-    
-    for i, img_path in enumerate(test_images, 1):
-        print(f"  Traitement image {i}/{len(test_images)}: {img_path}")
-        results = model(img_path)
-        detected_classes = [int(cls) for cls in results[0].boxes.cls]
-        pred_labels.append(detected_classes)
-        print(f"    Classes détectées: {detected_classes}")
-    
-    # Nombre de classes dans le dataset COCO
-    num_classes = 80
-    
-    # Convertir en vecteurs binaires pour chaque classe
-    print("\n🔄 Conversion en vecteurs binaires...")
-    y_true_bin = []
-    y_pred_bin = []
-    
-    for true, pred in zip(true_labels, pred_labels):
-        true_vec = [1 if i in true else 0 for i in range(num_classes)]
-        pred_vec = [1 if i in pred else 0 for i in range(num_classes)]
-        y_true_bin.append(true_vec)
-        y_pred_bin.append(pred_vec)
-    
-    # Calcul des métriques
+
+    print(f"\n📂 Chargement du dataset: {data}")
+    dataset = load_dataset(data, image_dir, split)
+    if not len(dataset):
+        raise ValueError(f"Aucune image trouvée dans {data}")
+    print(f"✅ {len(dataset)} images, {dataset.num_labels} objets annotés")
+
+    predictions, model_names, cache_status = load_predictions(
+        dataset, detector_config, batch_size, io_threads, processes, cache_dir, hash_content
+    )
+    if classes is not None:
+        classes = parse_classes(classes, dataset.names or model_names)
+
     print("\n📈 Calcul des métriques de performance...")
-    accuracy = accuracy_score(y_true_bin, y_pred_bin)
-    precision = precision_score(y_true_bin, y_pred_bin, average='macro', zero_division=0)
-    recall = recall_score(y_true_bin, y_pred_bin, average='macro', zero_division=0)
-    f1 = f1_score(y_true_bin, y_pred_bin, average='macro', zero_division=0)
-    
+    start = time.perf_counter()
+    results = evaluate_predictions(
+        dataset, predictions, model_names, threshold, iou, classes,
+        min_confidence=detector_config["confidence_threshold"]
+    )
+    results["prediction_cache"] = cache_status
+    results["metrics_s"] = round(time.perf_counter() - start, 2)
+
     # Afficher les résultats
     print("\n" + "="*60)
     print("📊 RÉSULTATS DE L'ÉVALUATION")
     print("="*60)
-    print(f"Accuracy:  {accuracy:.3f} ({accuracy*100:.1f}%)")
-    print(f"Precision: {precision:.3f} ({precision*100:.1f}%)")
-    print(f"Recall:    {recall:.3f} ({recall*100:.1f}%)")
-    print(f"F1-score:  {f1:.3f} ({f1*100:.1f}%)")
+    print(f"mAP@0.5:      {results['mAP50']:.3f}")
+    print(f"mAP@.5:.95:   {results['mAP50_95']:.3f}")
+    print(f"Precision:    {results['precision']:.3f} (seuil {threshold}, IoU {results['iou']:.2f})")
+    print(f"Recall:       {results['recall']:.3f}")
+    print(f"F1-score:     {results['f1']:.3f}")
+    if results["best_f1"]:
+        best = results["best_f1"]
+        print(f"Meilleur F1:  {best['f1']:.3f} au seuil {best['threshold']:.2f} "
+              f"(P {best['precision']:.3f}, R {best['recall']:.3f})")
+    print(f"Temps:        métriques {results['metrics_s']}s")
     print("="*60)
-    
-    # Créer le graphique
-    create_metrics_plot(accuracy, precision, recall, f1)
-    
-    return accuracy, precision, recall, f1
-
-
-def evaluate_with_synthetic_data():
-    """
-    Évaluation avec des données synthétiques pour la démonstration
-    """
-    print("\n🎲 Génération de données synthétiques...")
-    
-    # Données synthétiques réalistes
-    np.random.seed(42)
-    
-    # Simuler les performances typiques de YOLOv8n
-    accuracy = 0.875 + np.random.uniform(-0.05, 0.05)
-    precision = 0.823 + np.random.uniform(-0.05, 0.05)
-    recall = 0.791 + np.random.uniform(-0.05, 0.05)
-    f1 = 0.806 + np.random.uniform(-0.05, 0.05)
-    
-    # Afficher les résultats
-    print("\n" + "="*60)
-    print("📊 RÉSULTATS DE L'ÉVALUATION (Données Synthétiques)")
-    print("="*60)
-    print(f"Accuracy:  {accuracy:.3f} ({accuracy*100:.1f}%)")
-    print(f"Precision: {precision:.3f} ({precision*100:.1f}%)")
-    print(f"Recall:    {recall:.3f} ({recall*100:.1f}%)")
-    print(f"F1-score:  {f1:.3f} ({f1*100:.1f}%)")
-    print("="*60)
-    print("\n⚠️  Note: Ces résultats sont synthétiques pour démonstration.")
-    print("   Pour des résultats réels, ajoutez vos images de test.")
-    
-    # Créer le graphique
-    create_metrics_plot(accuracy, precision, recall, f1)
-    
-    return accuracy, precision, recall, f1
 
+    print(f"\n{'Classe':<20}{'Labels':>8}{'AP50':>8}{'AP50-95':>9}")
+    for name, stats in sorted(results["per_class"].items(), key=lambda kv: -kv[1]["labels"]):
+        print(f"{name:<20}{stats['labels']:>8}{stats['ap50']:>8.3f}{stats['ap50_95']:>9.3f}")
 
-def create_metrics_plot(accuracy, precision, recall, f1):
+    # Créer les graphiques
+    create_metrics_plot({
+        "mAP@0.5": results["mAP50"],
+        "mAP@.5:.95": results["mAP50_95"],
+        "Precision": results["precision"],
+        "Recall": results["recall"],
+        "F1-score": results["f1"],
+    }, show=show)
+    create_curves_plot(results, show=show)
+    create_confusion_matrix_plot(results, show=show)
+
+    return results
+
+
+def create_metrics_plot(metrics, output_path="yolo_metrics.png", show=False):
     """
-    Crée un graphique des métriques de performance
+    Crée un graphique des métriques de performance ({nom: valeur})
     """
     print("\n📊 Création du graphique...")
-    
+
     # Données
-    metrics = [accuracy, precision, recall, f1]
-    labels = ["Accuracy", "Precision", "Recall", "F1-score"]
-    colors = ["#3498db", "#2ecc71", "#f39c12", "#e74c3c"]
-    
+    labels = list(metrics)
+    values = list(metrics.values())
+    colors = ["#9b59b6", "#3498db", "#2ecc71", "#f39c12", "#e74c3c"]
+
     # Créer le graphique
     plt.figure(figsize=(10, 6))
-    bars = plt.bar(labels, metrics, color=colors, alpha=0.8, edgecolor='black', linewidth=1.5)
-    
+    bars = plt.bar(labels, values, color=colors[:len(values)], alpha=0.8, edgecolor='black', linewidth=1.5)
+
     # Ajouter les valeurs sur les barres
-    for bar, metric in zip(bars, metrics):
+    for bar, metric in zip(bars, values):
         height = bar.get_height()
         plt.text(bar.get_x() + bar.get_width()/2., height,
                 f'{metric:.3f}\n({metric*100:.1f}%)',
                 ha='center', va='bottom', fontsize=11, fontweight='bold')
-    
+
     # Personnalisation
     plt.ylim(0, 1.1)
     plt.ylabel('Score', fontsize=12, fontweight='bold')
-    plt.title('Performance du modèle YOLOv8n sur le dataset de test', 
+    plt.title('Performance du modèle YOLOv8n sur le dataset de test',
               fontsize=14, fontweight='bold', pad=20)
     plt.grid(axis='y', alpha=0.3, linestyle='--')
-    
+
     # Ligne de référence à 0.8
     plt.axhline(y=0.8, color='gray', linestyle='--', alpha=0.5, label='Référence 80%')
     plt.legend()
-    
+
     # Sauvegarder
-    output_path = "yolo_metrics.png"
     plt.tight_layout()
     plt.savefig(output_path, dpi=300, bbox_inches='tight')
     print(f"✅ Graphique sauvegardé: {output_path}")
-    
-    # Afficher
-    plt.show()
-
-
-def create_confusion_matrix_example():
-    """
-    Crée un exemple de matrice de confusion (optionnel)
-    """
-    print("\n📊 Création d'un exemple de matrice de confusion...")
-    
-    # Exemple de données
-    from sklearn.metrics import confusion_matrix, ConfusionMatrixDisplay
-    
-    # Classes principales COCO
-    class_names = ['person', 'bicycle', 'car', 'motorcycle', 'bus']
-    
-    # Données synthétiques
-    y_true = [0, 1, 2, 3, 4, 0, 1, 2, 3, 4] * 10
-    y_pred = [0, 1, 2, 3, 4, 0, 1, 1, 3, 2] * 10  # Quelques erreurs
-    
-    # Calculer la matrice de confusion
-    cm = confusion_matrix(y_true, y_pred)
-    
+
     # Afficher
-    fig, ax = plt.subplots(figsize=(10, 8))
-    disp = ConfusionMatrixDisplay(confusion_matrix=cm, display_labels=class_names)
-    disp.plot(ax=ax, cmap='Blues', values_format='d')
-    
-    plt.title('Matrice de Confusion - Exemple', fontsize=14, fontweight='bold')
+    if show:
+        plt.show()
+    plt.close()
+
+
+def create_curves_plot(results, output_path="pr_curves.png", max_classes=10, show=False):
+    """
+    Courbes précision-rappel par classe et P / R / F1 selon le seuil de confiance
+    """
+    fig, (ax_pr, ax_sweep) = plt.subplots(1, 2, figsize=(16, 6))
+
+    # Courbes PR des classes les plus représentées
+    recall = results["pr_curves"]["recall"]
+    curves = results["pr_curves"]["precision"]
+    ranked = sorted(results["per_class"].items(), key=lambda kv: -kv[1]["labels"])
+    for name, stats in ranked[:max_classes]:
+        ax_pr.plot(recall, curves[name], linewidth=1, label=f"{name} ({stats['ap50']:.3f})")
+    if curves:
+        ax_pr.plot(recall, np.mean(list(curves.values()), axis=0), color='black', linewidth=3,
+                   label=f"toutes classes ({results['mAP50']:.3f})")
+    ax_pr.set_xlabel('Recall', fontweight='bold')
+    ax_pr.set_ylabel('Precision', fontweight='bold')
+    ax_pr.set_title(f"Courbes Précision-Rappel (IoU {results['iou']:.2f})", fontweight='bold')
+    ax_pr.set_xlim(0, 1)
+    ax_pr.set_ylim(0, 1.05)
+    ax_pr.grid(alpha=0.3, linestyle='--')
+    ax_pr.legend(fontsize=8, loc='lower left')
+
+    # Métriques selon le seuil de confiance
+    sweep = results["sweep"]
+    ax_sweep.plot(sweep["thresholds"], sweep["precision"], color="#2ecc71", label="Precision")
+    ax_sweep.plot(sweep["thresholds"], sweep["recall"], color="#f39c12", label="Recall")
+    ax_sweep.plot(sweep["thresholds"], sweep["f1"], color="#e74c3c", linewidth=2, label="F1-score")
+    if results["best_f1"]:
+        best = results["best_f1"]
+        ax_sweep.axvline(best["threshold"], color='gray', linestyle='--', alpha=0.7,
+                         label=f"meilleur F1 @ {best['threshold']:.2f}")
+    ax_sweep.set_xlabel('Seuil de confiance', fontweight='bold')
+    ax_sweep.set_ylabel('Score', fontweight='bold')
+    ax_sweep.set_title('Précision / Rappel / F1 selon le seuil', fontweight='bold')
+    ax_sweep.set_xlim(0, 1)
+    ax_sweep.set_ylim(0, 1.05)
+    ax_sweep.grid(alpha=0.3, linestyle='--')
+    ax_sweep.legend()
+
+    plt.tight_layout()
+    plt.savefig(output_path, dpi=200, bbox_inches='tight')
+    print(f"✅ Courbes sauvegardées: {output_path}")
+    if show:
+        plt.show()
+    plt.close(fig)
+
+
+def create_confusion_matrix_plot(results, output_path="confusion_matrix.png", show=False):
+    """
+    Matrice de confusion réelle (au seuil de confiance et à l'IoU de l'évaluation)
+    """
+    labels = results["confusion_matrix"]["labels"]
+    matrix = np.asarray(results["confusion_matrix"]["matrix"])
+
+    size = max(8, 0.45 * len(labels))
+    fig, ax = plt.subplots(figsize=(size, size * 0.85))
+    image = ax.imshow(matrix, cmap='Blues')
+    fig.colorbar(image, ax=ax)
+
+    ax.set_xticks(range(len(labels)))
+    ax.set_yticks(range(len(labels)))
+    ax.set_xticklabels(labels, rotation=90)
+    ax.set_yticklabels(labels)
+    ax.set_xlabel('Prédiction', fontweight='bold')
+    ax.set_ylabel('Vérité terrain', fontweight='bold')
+
+    # Valeurs dans les cases (lisibles jusqu'à ~30 classes)
+    if len(labels) <= 30:
+        threshold = matrix.max() / 2 if matrix.size else 0
+        for i in range(len(labels)):
+            for j in range(len(labels)):
+                if matrix[i, j]:
+                    ax.text(j, i, str(matrix[i, j]), ha='center', va='center', fontsize=8,
+                            color='white' if matrix[i, j] > threshold else 'black')
+
+    plt.title(f"Matrice de Confusion (seuil {results['threshold']}, IoU {results['iou']:.2f})",
+              fontsize=14, fontweight='bold')
     plt.tight_layout()
-    plt.savefig("confusion_matrix_example.png", dpi=300, bbox_inches='tight')
-    print("✅ Matrice de confusion sauvegardée: confusion_matrix_example.png")
-    plt.show()
+    plt.savefig(output_path, dpi=200, bbox_inches='tight')
+    print(f"✅ Matrice de confusion sauvegardée: {output_path}")
+    if show:
+        plt.show()
+    plt.close(fig)
 
 
 def main():
     """
     Fonction principale
     """
+    parser = argparse.ArgumentParser(description="Évaluation mAP du modèle YOLO")
+    parser.add_argument("--data", default="test",
+                        help="Dataset YOLO (dossier ou data.yaml) ou annotations COCO (.json)")
+    parser.add_argument("--images", default=None, help="Dossier des images (COCO)")
+    parser.add_argument("--split", default=None, help="Sous-ensemble (ex: val, val2017)")
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--backend", default="torch")
+    parser.add_argument("--precision", default="fp32")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--conf", type=float, default=0.001,
+                        help="Seuil de confiance de l'inférence (bas pour le mAP)")
+    parser.add_argument("--threshold", type=float, default=0.5,
+                        help="Seuil de confiance pour la précision / le rappel / le F1")
+    parser.add_argument("--iou", type=float, default=0.5,
+                        help="IoU de la précision / du rappel et de la matrice de confusion")
+    parser.add_argument("--classes", default=None, help="Classes évaluées: 'person,car' ou '0,2'")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--io-threads", type=int, default=4, help="Threads de décodage des images")
+    parser.add_argument("--processes", type=int, default=1, help="Processus d'inférence")
+    parser.add_argument("--cache-dir", default=os.path.join("cache", "predictions"),
+                        help="Cache des prédictions brutes")
+    parser.add_argument("--no-cache", action="store_true", help="Toujours relancer l'inférence")
+    parser.add_argument("--hash-content", action="store_true",
+                        help="Empreinte du dataset sur le contenu des images (plus lent)")
+    parser.add_argument("--show", action="store_true", help="Afficher les graphiques")
+    parser.add_argument("--output", default="evaluation_results.json")
+    args = parser.parse_args()
+
     print("\n" + "🚀"*30)
     print("SCRIPT D'ÉVALUATION DU MODÈLE YOLO")
     print("🚀"*30 + "\n")
-    
+
+    if not os.path.exists(args.data):
+        print(f"❌ Dataset introuvable: {args.data}")
+        print("\n💡 Conseil: indiquez un dataset YOLO (images/ + labels/ ou data.yaml)")
+        print("   ou un fichier d'annotations COCO avec --data et --images")
+        raise SystemExit(1)
+
+    detector_config = {
+        "model_name": args.model,
+        "confidence_threshold": args.conf,
+        "backend": args.backend,
+        "precision": args.precision,
+        "imgsz": args.imgsz,
+    }
+
     try:
         # Évaluer le modèle
-        accuracy, precision, recall, f1 = evaluate_yolo_model()
-        
-        # Optionnel: Créer une matrice de confusion exemple
-        print("\n📊 Voulez-vous créer une matrice de confusion exemple? (o/n)")
-        choice = input("➤ ").strip().lower()
-        if choice == 'o':
-            create_confusion_matrix_example()
-        
+        results = evaluate_yolo_model(
+            args.data, args.images, args.split, detector_config, args.threshold, args.iou,
+            args.classes, args.batch_size, args.io_threads, args.processes,
+            cache_dir=None if args.no_cache else args.cache_dir,
+            hash_content=args.hash_content, show=args.show
+        )
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
         print("\n" + "="*60)
         print("✅ Évaluation terminée avec succès!")
         print("="*60)
         print("\n📁 Fichiers générés:")
+        print(f"  - {args.output} (métriques, balayage des seuils, courbes PR)")
         print("  - yolo_metrics.png (graphique des métriques)")
-        if choice == 'o':
-            print("  - confusion_matrix_example.png (matrice de confusion)")
+        print("  - pr_curves.png (courbes précision-rappel et F1 selon le seuil)")
+        print("  - confusion_matrix.png (matrice de confusion)")
         print("\n")
-        
+
     except Exception as e:
         print(f"\n❌ Erreur lors de l'évaluation: {e}")
         import traceback
         traceback.print_exc()
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
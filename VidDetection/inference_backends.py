@@ -0,0 +1,424 @@
+"""
+inference_backends.py - Backends d'inférence CPU (ONNX Runtime / OpenVINO) pour YOLOv8
+
+Le modèle PyTorch est exporté une fois en ONNX à taille d'entrée fixe
+(fp32, fp16 ou int8), puis exécuté par ONNX Runtime ou OpenVINO avec un nombre
+de threads contrôlé. Le module fournit aussi un contrôle de parité avec le
+chemin PyTorch et un benchmark FPS sur des clips représentatifs.
+
+Usage:
+    python inference_backends.py --video clip.mp4 --backend onnxruntime --precision int8
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+
+import cv2
+import numpy as np
+
+from tiling import box_overlap, nms
+
+
+BACKENDS = ("torch", "onnxruntime", "openvino")
+PRECISIONS = ("fp32", "fp16", "int8")
+EXPORT_DIR = "exports"
+
+
+def letterbox(image, imgsz, canvas=None):
+    """Redimensionne en conservant le ratio et complète à imgsz x imgsz (gris 114)"""
+    height, width = image.shape[:2]
+    ratio = min(imgsz / height, imgsz / width)
+    new_h, new_w = int(round(height * ratio)), int(round(width * ratio))
+
+    if (new_h, new_w) != (height, width):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+    if canvas is None:
+        canvas = np.empty((imgsz, imgsz, 3), dtype=np.uint8)
+    canvas[:] = 114
+
+    top = (imgsz - new_h) // 2
+    left = (imgsz - new_w) // 2
+    canvas[top:top + new_h, left:left + new_w] = image
+
+    return canvas, ratio, (left, top)
+
+
+def decode_yolo_output(output, conf_threshold, ratio, pad, image_shape,
+                       iou_threshold=0.7, max_det=300, classes=None):
+    """Décode la sortie brute YOLOv8 (4 + nc, N) en (xyxy, scores, class_ids)"""
+    predictions = output.T
+    class_scores = predictions[:, 4:]
+
+    if classes is not None:
+        # Les classes hors liste sont écartées avant la NMS
+        allowed = np.zeros(class_scores.shape[1], dtype=bool)
+        allowed[list(classes)] = True
+        class_scores = np.where(allowed, class_scores, 0.0)
+
+    class_ids = class_scores.argmax(axis=1)
+    scores = class_scores[np.arange(len(class_ids)), class_ids]
+
+    mask = scores >= conf_threshold
+    if not mask.any():
+        return (np.empty((0, 4), dtype=np.float32),
+                np.empty(0, dtype=np.float32),
+                np.empty(0, dtype=np.int64))
+
+    xywh = predictions[mask, :4]
+    scores = scores[mask]
+    class_ids = class_ids[mask]
+
+    boxes = np.empty_like(xywh)
+    boxes[:, 0] = xywh[:, 0] - xywh[:, 2] / 2
+    boxes[:, 1] = xywh[:, 1] - xywh[:, 3] / 2
+    boxes[:, 2] = xywh[:, 0] + xywh[:, 2] / 2
+    boxes[:, 3] = xywh[:, 1] + xywh[:, 3] / 2
+
+    keep = nms(boxes, scores, class_ids, iou_threshold)[:max_det]
+    boxes, scores, class_ids = boxes[keep], scores[keep], class_ids[keep]
+
+    # Retour dans le repère de l'image d'origine
+    boxes[:, [0, 2]] -= pad[0]
+    boxes[:, [1, 3]] -= pad[1]
+    boxes /= ratio
+    height, width = image_shape[:2]
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+
+    return boxes.astype(np.float32), scores.astype(np.float32), class_ids.astype(np.int64)
+
+
+def export_path(model_name, precision, imgsz):
+    """Chemin de l'export ONNX mis en cache pour (modèle, précision, taille)"""
+    stem = os.path.splitext(os.path.basename(model_name))[0]
+    return os.path.join(EXPORT_DIR, f"{stem}_{imgsz}_{precision}.onnx")
+
+
+def _names_path(onnx_path):
+    return os.path.splitext(onnx_path)[0] + ".names.json"
+
+
+def _calibration_frames(source, imgsz, max_frames=64):
+    """Frames de calibration int8 lues depuis une vidéo ou un dossier d'images"""
+    if os.path.isdir(source):
+        files = sorted(
+            os.path.join(source, f) for f in os.listdir(source)
+            if f.lower().endswith((".jpg", ".jpeg", ".png", ".bmp"))
+        )
+        images = (cv2.imread(f) for f in files[:max_frames])
+    else:
+        cap = cv2.VideoCapture(source)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or max_frames
+        step = max(1, total // max_frames)
+        images = []
+        for index in range(0, total, step):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+            ret, frame = cap.read()
+            if not ret:
+                break
+            images.append(frame)
+            if len(images) >= max_frames:
+                break
+        cap.release()
+
+    for image in images:
+        if image is not None:
+            canvas, _, _ = letterbox(image, imgsz)
+            yield to_blob(canvas)
+
+
+def to_blob(canvas):
+    """Convertit une image BGR letterboxée en tenseur NCHW RGB float32 [0, 1]"""
+    blob = canvas[..., ::-1].transpose(2, 0, 1)[None]
+    return np.ascontiguousarray(blob, dtype=np.float32) / 255.0
+
+
+def export_model(model_name="yolov8n.pt", precision="fp32", imgsz=640, calibration_source=None):
+    """
+    Exporte (une seule fois) le modèle PyTorch en ONNX à forme d'entrée statique
+
+    int8: quantification statique (QDQ) si `calibration_source` est fourni,
+    sinon quantification dynamique des poids (ONNX Runtime uniquement).
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Précision inconnue: {precision} (attendu: {PRECISIONS})")
+
+    target = export_path(model_name, precision, imgsz)
+    if os.path.exists(target) and os.path.exists(_names_path(target)):
+        return target
+
+    from ultralytics import YOLO
+
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    base = export_path(model_name, "fp32", imgsz)
+
+    if not os.path.exists(base):
+        print(f"📦 Export ONNX de {model_name} ({imgsz}x{imgsz})...")
+        model = YOLO(model_name)
+        exported = model.export(format="onnx", imgsz=imgsz, dynamic=False, simplify=True)
+        shutil.move(str(exported), base)
+        with open(_names_path(base), "w", encoding="utf-8") as f:
+            json.dump({int(k): v for k, v in model.names.items()}, f)
+
+    if precision == "fp16":
+        import onnx
+        from onnxconverter_common import float16
+
+        print("🔧 Conversion fp16...")
+        model_fp16 = float16.convert_float_to_float16(onnx.load(base), keep_io_types=True)
+        onnx.save(model_fp16, target)
+
+    elif precision == "int8":
+        from onnxruntime import quantization
+
+        if calibration_source:
+            print(f"🔧 Quantification int8 statique (calibration: {calibration_source})...")
+
+            class _Reader(quantization.CalibrationDataReader):
+                def __init__(self):
+                    self.blobs = _calibration_frames(calibration_source, imgsz)
+
+                def get_next(self):
+                    blob = next(self.blobs, None)
+                    return None if blob is None else {"images": blob}
+
+            quantization.quantize_static(
+                base, target, _Reader(),
+                quant_format=quantization.QuantFormat.QDQ,
+                per_channel=True,
+                activation_type=quantization.QuantType.QUInt8,
+                weight_type=quantization.QuantType.QInt8,
+            )
+        else:
+            print("🔧 Quantification int8 dynamique (poids uniquement)...")
+            quantization.quantize_dynamic(base, target, weight_type=quantization.QuantType.QUInt8)
+
+    if target != base:
+        shutil.copy(_names_path(base), _names_path(target))
+
+    print(f"✅ Modèle exporté: {target}")
+    return target
+
+
+class CpuYoloModel:
+    """Modèle YOLOv8 exporté, exécuté par ONNX Runtime ou OpenVINO"""
+
+    def __init__(self, model_name="yolov8n.pt", backend="onnxruntime", precision="fp32",
+                 imgsz=640, num_threads=None, calibration_source=None):
+        if backend not in ("onnxruntime", "openvino"):
+            raise ValueError(f"Backend CPU inconnu: {backend}")
+        if backend == "openvino" and precision == "int8" and not calibration_source:
+            raise ValueError("OpenVINO int8 nécessite une source de calibration")
+
+        self.backend = backend
+        self.precision = precision
+        self.imgsz = int(imgsz)
+        self.num_threads = num_threads
+
+        # fp16 OpenVINO: modèle fp32 + indice de précision à la compilation
+        export_precision = "fp32" if (backend == "openvino" and precision == "fp16") else precision
+        self.path = export_model(model_name, export_precision, self.imgsz, calibration_source)
+
+        with open(_names_path(self.path), encoding="utf-8") as f:
+            self.names = {int(k): v for k, v in json.load(f).items()}
+
+        if backend == "onnxruntime":
+            self._load_onnxruntime()
+        else:
+            self._load_openvino()
+
+        # Buffer letterbox réutilisé d'une frame à l'autre
+        self._canvas = np.empty((self.imgsz, self.imgsz, 3), dtype=np.uint8)
+
+    def _load_onnxruntime(self):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if self.num_threads:
+            options.intra_op_num_threads = int(self.num_threads)
+            options.inter_op_num_threads = 1
+
+        self.session = ort.InferenceSession(
+            self.path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def _load_openvino(self):
+        try:
+            from openvino import Core
+        except ImportError:
+            from openvino.runtime import Core
+
+        config = {"PERFORMANCE_HINT": "LATENCY"}
+        if self.num_threads:
+            config["INFERENCE_NUM_THREADS"] = int(self.num_threads)
+        if self.precision == "fp16":
+            config["INFERENCE_PRECISION_HINT"] = "f16"
+
+        core = Core()
+        self.compiled = core.compile_model(self.path, "CPU", config)
+        self.request = self.compiled.create_infer_request()
+        self.output = self.compiled.output(0)
+
+    def _infer(self, blob):
+        if self.backend == "onnxruntime":
+            return self.session.run(None, {self.input_name: blob})[0]
+        return self.request.infer({0: blob})[self.output]
+
+    def predict(self, images, conf=0.25, iou=0.7, classes=None):
+        """Inférence image par image (forme statique batch=1): liste de (xyxy, scores, class_ids)"""
+        predictions = []
+        for image in images:
+            canvas, ratio, pad = letterbox(image, self.imgsz, self._canvas)
+            output = self._infer(to_blob(canvas))[0]
+            predictions.append(
+                decode_yolo_output(output, conf, ratio, pad, image.shape, iou, classes=classes)
+            )
+        return predictions
+
+
+def configure_torch_threads(num_threads):
+    """Limite le nombre de threads PyTorch (backend 'torch')"""
+    if num_threads:
+        import torch
+        torch.set_num_threads(int(num_threads))
+
+
+def _match_detections(reference, candidate, iou_threshold):
+    """Appariement glouton (même classe, IoU >= seuil) entre deux listes de détections"""
+    matches = []
+    used = set()
+    for ref in sorted(reference, key=lambda d: -d["confidence"]):
+        best, best_iou = None, iou_threshold
+        for j, cand in enumerate(candidate):
+            if j in used or cand["class_id"] != ref["class_id"]:
+                continue
+            iou = float(box_overlap(
+                np.asarray(ref["bbox"], dtype=np.float32),
+                np.asarray([cand["bbox"]], dtype=np.float32)
+            )[0])
+            if iou >= best_iou:
+                best, best_iou = j, iou
+        if best is not None:
+            used.add(best)
+            matches.append((ref, candidate[best], best_iou))
+    return matches
+
+
+def check_parity(reference, candidate, frames, iou_threshold=0.5):
+    """
+    Compare les détections d'un backend optimisé à celles du chemin PyTorch
+
+    Retourne le rappel/précision relatifs, l'IoU moyenne des paires appariées
+    et l'écart moyen de confiance.
+    """
+    n_ref = n_cand = 0
+    ious, conf_deltas = [], []
+
+    for frame in frames:
+        ref_dets = reference.detect(frame)
+        cand_dets = candidate.detect(frame)
+        n_ref += len(ref_dets)
+        n_cand += len(cand_dets)
+        for ref, cand, iou in _match_detections(ref_dets, cand_dets, iou_threshold):
+            ious.append(iou)
+            conf_deltas.append(abs(ref["confidence"] - cand["confidence"]))
+
+    matched = len(ious)
+    return {
+        "frames": len(frames),
+        "reference_detections": n_ref,
+        "candidate_detections": n_cand,
+        "recall_vs_reference": matched / n_ref if n_ref else 1.0,
+        "precision_vs_reference": matched / n_cand if n_cand else 1.0,
+        "mean_iou": float(np.mean(ious)) if ious else 0.0,
+        "mean_confidence_delta": float(np.mean(conf_deltas)) if conf_deltas else 0.0,
+    }
+
+
+def load_frames(video_path, max_frames=300):
+    """Décode les frames d'un clip en mémoire (le décodage est exclu des mesures)"""
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def benchmark_fps(detector, frames, warmup=5):
+    """Mesure les FPS et latences de detector.detect sur des frames en mémoire"""
+    for frame in frames[:warmup]:
+        detector.detect(frame)
+
+    latencies = []
+    for frame in frames:
+        start = time.perf_counter()
+        detector.detect(frame)
+        latencies.append(time.perf_counter() - start)
+
+    latencies = np.asarray(latencies) * 1000
+    return {
+        "frames": len(frames),
+        "fps": len(frames) / (latencies.sum() / 1000) if len(frames) else 0.0,
+        "latency_ms_mean": float(latencies.mean()) if len(frames) else 0.0,
+        "latency_ms_p95": float(np.percentile(latencies, 95)) if len(frames) else 0.0,
+    }
+
+
+def main():
+    from object_tracking import ObjectDetector
+
+    parser = argparse.ArgumentParser(description="Export, parité et benchmark des backends CPU")
+    parser.add_argument("--video", required=True, action="append", help="Clip(s) représentatif(s)")
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--backend", default="onnxruntime", choices=BACKENDS[1:])
+    parser.add_argument("--precision", default="fp32", choices=PRECISIONS)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--calibration", default=None, help="Vidéo ou dossier d'images (int8)")
+    parser.add_argument("--max-frames", type=int, default=300)
+    args = parser.parse_args()
+
+    reference = ObjectDetector(args.model, imgsz=args.imgsz, num_threads=args.threads)
+    candidate = ObjectDetector(
+        args.model,
+        backend=args.backend,
+        precision=args.precision,
+        imgsz=args.imgsz,
+        num_threads=args.threads,
+        calibration_source=args.calibration,
+    )
+
+    report = []
+    for video in args.video:
+        frames = load_frames(video, args.max_frames)
+        print(f"\n📹 {video}: {len(frames)} frames")
+        entry = {
+            "video": video,
+            "parity": check_parity(reference, candidate, frames),
+            "torch": benchmark_fps(reference, frames),
+            args.backend: benchmark_fps(candidate, frames),
+        }
+        speedup = entry[args.backend]["fps"] / max(entry["torch"]["fps"], 1e-9)
+        entry["speedup"] = speedup
+        print(f"  Parité: rappel {entry['parity']['recall_vs_reference']:.1%}, "
+              f"précision {entry['parity']['precision_vs_reference']:.1%}")
+        print(f"  FPS torch: {entry['torch']['fps']:.1f} | "
+              f"{args.backend} {args.precision}: {entry[args.backend]['fps']:.1f} (x{speedup:.2f})")
+        report.append(entry)
+
+    print("\n" + json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
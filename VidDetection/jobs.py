@@ -0,0 +1,224 @@
+"""
+jobs.py - Uploads par morceaux reprenables et jobs de traitement en arrière-plan
+
+Un client envoie une vidéo en plusieurs requêtes PUT, chacune à un offset
+donné: après une coupure réseau, il demande l'offset déjà reçu et reprend à
+partir de là. Le traitement est ensuite soumis comme un job exécuté dans un
+thread; le client interroge sa progression puis télécharge le résultat.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class UploadStore:
+    """Fichiers en cours de réception (un .part + métadonnées JSON par upload)"""
+
+    def __init__(self, directory="uploads", ttl_hours=24):
+        self.directory = directory
+        self.ttl = ttl_hours * 3600
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _meta_path(self, upload_id):
+        return os.path.join(self.directory, f"{os.path.basename(upload_id)}.json")
+
+    def _load_meta(self, upload_id):
+        try:
+            with open(self._meta_path(upload_id), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def path(self, upload_id):
+        """Fichier vidéo de l'upload (extension d'origine conservée pour le décodeur)"""
+        meta = self._load_meta(upload_id)
+        if meta is None:
+            return None
+        return os.path.join(self.directory, meta["data_file"])
+
+    def create(self, filename, size):
+        """Nouvel upload vide de `size` octets attendus"""
+        self._expire()
+        upload_id = uuid.uuid4().hex
+        meta = {"upload_id": upload_id, "filename": filename, "size": size,
+                "data_file": upload_id + os.path.splitext(filename)[-1].lower(),
+                "created": time.time()}
+        with self._lock:
+            open(os.path.join(self.directory, meta["data_file"]), "wb").close()
+            with open(self._meta_path(upload_id), "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+        return self.status(upload_id)
+
+    def status(self, upload_id):
+        """État de l'upload (None si inconnu): `received` est l'offset de reprise"""
+        meta = self._load_meta(upload_id)
+        if meta is None:
+            return None
+        try:
+            received = os.path.getsize(self.path(upload_id))
+        except OSError:
+            return None
+        meta["received"] = received
+        meta["complete"] = received >= meta["size"]
+        return meta
+
+    def write(self, upload_id, offset, data):
+        """
+        Ajoute un morceau reçu à l'offset donné
+
+        L'offset doit être exactement la taille déjà reçue: sinon ValueError
+        (le client doit relire l'offset avec status() puis reprendre). Un
+        morceau qui dépasse la taille annoncée lève OverflowError.
+        """
+        with self._lock:
+            status = self.status(upload_id)
+            if status is None:
+                raise KeyError(upload_id)
+            if offset != status["received"]:
+                raise ValueError(status["received"])
+            if offset + len(data) > status["size"]:
+                raise OverflowError(status["size"])
+
+            with open(self.path(upload_id), "ab") as f:
+                f.write(data)
+        return self.status(upload_id)
+
+    def delete(self, upload_id):
+        with self._lock:
+            for path in (self.path(upload_id), self._meta_path(upload_id)):
+                if path and os.path.exists(path):
+                    os.remove(path)
+
+    def _expire(self):
+        """Supprime les uploads plus vieux que le TTL (abandonnés)"""
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                path = os.path.join(self.directory, name)
+                try:
+                    if now - os.path.getmtime(path) > self.ttl:
+                        self.delete(name[:-len(".json")])
+                except OSError:
+                    pass
+
+
+class Job:
+    """Job de traitement: état, progression et résultat"""
+
+    def __init__(self, kind, upload_id, params, output_dir):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.upload_id = upload_id
+        self.params = params
+        self.output_dir = os.path.join(output_dir, self.job_id)
+        self.status = "queued"
+        self.progress = 0.0
+        self.frames_done = 0
+        self.frames_total = None
+        self.result = None
+        self.result_file = None
+        self.media_type = None
+        self.summary = None
+        # Détail par track (GET /jobs/{job_id}/tracks), hors de to_dict()
+        self.tracks = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    def report(self, done, total):
+        """Callback de progression (frames traitées / total)"""
+        self.frames_done = done
+        self.frames_total = total or None
+        if total:
+            self.progress = min(done / total, 1.0)
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "upload_id": self.upload_id,
+            "params": self.params,
+            "status": self.status,
+            "progress": round(self.progress, 4),
+            "frames_done": self.frames_done,
+            "frames_total": self.frames_total,
+            "error": self.error,
+            "has_result": self.status == "done",
+            "summary": self.summary,
+            "elapsed_s": round((self.finished or time.time()) - (self.started or self.created), 2),
+        }
+
+
+class JobManager:
+    """
+    Exécute les jobs dans un pool de threads
+
+    Le runner reçoit le job et retourne soit un dict (résultat JSON), soit
+    (chemin_fichier, media_type) pour un résultat binaire écrit dans
+    job.output_dir.
+    """
+
+    def __init__(self, runner, output_dir="jobs", max_workers=1, keep_jobs=100):
+        self.runner = runner
+        self.output_dir = output_dir
+        self.keep_jobs = keep_jobs
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        os.makedirs(output_dir, exist_ok=True)
+
+    def submit(self, kind, upload_id, params):
+        job = Job(kind, upload_id, params, self.output_dir)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._prune()
+        self._pool.submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        job.status = "running"
+        job.started = time.time()
+        os.makedirs(job.output_dir, exist_ok=True)
+        try:
+            result = self.runner(job)
+            if isinstance(result, tuple):
+                job.result_file, job.media_type = result
+            else:
+                job.result = result
+            job.progress = 1.0
+            job.status = "done"
+        except Exception as e:
+            job.error = str(getattr(e, "detail", e))
+            job.status = "error"
+            print(f"❌ Job {job.job_id} en erreur: {job.error}")
+        finally:
+            job.finished = time.time()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return [job.to_dict() for job in self._jobs.values()]
+
+    def _prune(self):
+        """Oublie les plus vieux jobs terminés (et leurs fichiers) au-delà de keep_jobs"""
+        finished = sorted(
+            (job for job in self._jobs.values() if job.status in ("done", "error")),
+            key=lambda job: job.finished or 0
+        )
+        while len(self._jobs) > self.keep_jobs and finished:
+            job = finished.pop(0)
+            del self._jobs[job.job_id]
+            shutil.rmtree(job.output_dir, ignore_errors=True)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
@@ -0,0 +1,131 @@
+"""
+lifecycle.py - Démarrage du serveur: pool de modèles préchauffés et disponibilité
+
+Les modèles ne sont plus construits à l'import de main.py: un thread de
+démarrage charge les modèles, exécute les inférences de warmup aux
+résolutions attendues et alloue les buffers de frames réutilisables. Le
+serveur répond pendant ce temps (/health), mais n'est déclaré prêt (/ready)
+qu'une fois le warmup terminé. La durée du démarrage à froid et la latence
+du premier job sont mesurées, journalisées et exposées sur /metrics.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from profiling import metrics
+
+
+metrics.describe("server_ready", "1 quand les modèles sont chargés et préchauffés")
+metrics.describe("server_cold_start_seconds", "Durée du démarrage à froid (import -> prêt)")
+metrics.describe("server_startup_step_seconds", "Durée de chaque étape du démarrage")
+metrics.describe("first_job_seconds", "Latence du premier job traité après le démarrage")
+
+
+class FrameBuffers:
+    """
+    Buffers de décodage réutilisés, un par taille de frame
+
+    cap.read(buffer) décode directement dans le buffer quand la taille
+    correspond: aucune allocation par frame. Un buffer n'est valable que
+    jusqu'à la lecture suivante; il n'est donc utilisé que par le pipeline
+    (une vidéo à la fois, sous pipeline_lock).
+    """
+
+    def __init__(self):
+        self._buffers = {}
+
+    def allocate(self, sizes):
+        """Alloue les buffers des résolutions attendues (démarrage)"""
+        for width, height in sizes:
+            self.get(width, height)
+
+    def get(self, width, height):
+        """Buffer (height, width, 3) uint8 de cette taille, alloué au besoin"""
+        key = (int(width), int(height))
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = np.empty((key[1], key[0], 3), dtype=np.uint8)
+        return buffer
+
+    def sizes(self):
+        return [list(key) for key in self._buffers]
+
+
+class ServerState:
+    """Phase de démarrage, durées des étapes, disponibilité et premier job"""
+
+    def __init__(self, started=None):
+        self.started = started or time.perf_counter()
+        self.phase = "starting"
+        self.error = None
+        self.steps = {}
+        self.cold_start_seconds = None
+        self.first_job = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        metrics.set("server_ready", 0)
+
+    @property
+    def ready(self):
+        return self._ready.is_set() and self.error is None
+
+    @contextmanager
+    def step(self, name):
+        """Chronomètre une étape du démarrage"""
+        self.phase = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.steps[name] = round(seconds, 3)
+            metrics.set("server_startup_step_seconds", round(seconds, 3), labels={"step": name})
+
+    def mark_ready(self):
+        self.cold_start_seconds = round(time.perf_counter() - self.started, 3)
+        self.phase = "ready"
+        metrics.set("server_cold_start_seconds", self.cold_start_seconds)
+        metrics.set("server_ready", 1)
+        self._ready.set()
+        print(f"✅ Serveur prêt en {self.cold_start_seconds:.2f}s (démarrage à froid: {self.steps})")
+
+    def mark_failed(self, error):
+        self.error = str(error)
+        self.phase = "failed"
+        self._ready.set()
+        print(f"❌ Échec du démarrage: {self.error}")
+
+    def wait_ready(self, timeout=None):
+        """Attend la fin du démarrage; RuntimeError s'il a échoué ou n'est pas terminé"""
+        if not self._ready.wait(timeout):
+            raise RuntimeError("Serveur en cours de démarrage")
+        if self.error is not None:
+            raise RuntimeError(f"Échec du démarrage: {self.error}")
+
+    def record_job(self, job_type, seconds, cache_status=None):
+        """Mesure la latence du premier job (les suivants sont ignorés)"""
+        with self._lock:
+            if self.first_job is not None:
+                return
+            self.first_job = {
+                "job_type": job_type,
+                "seconds": round(seconds, 3),
+                "cache": cache_status,
+                "after_ready_s": round(time.perf_counter() - self.started - (self.cold_start_seconds or 0), 3),
+            }
+        metrics.set("first_job_seconds", round(seconds, 3), labels={"job": job_type})
+        print(f"⏱️  Premier job ({job_type}, cache {cache_status}): {seconds:.2f}s")
+
+    def to_dict(self):
+        return {
+            "phase": self.phase,
+            "ready": self.ready,
+            "error": self.error,
+            "uptime_s": round(time.perf_counter() - self.started, 1),
+            "cold_start_s": self.cold_start_seconds,
+            "startup_steps": self.steps,
+            "first_job": self.first_job,
+        }
@@ -0,0 +1,313 @@
+"""
+live_stream.py - Ingestion de flux en direct avec budget de latence
+
+Les frames arrivent soit d'une source cv2.VideoCapture (URL RTSP, caméra, ou
+fichier local relu à sa cadence native pour simuler un flux), soit poussées
+une à une (WebSocket). Un thread de traitement exécute détection + tracking et
+publie les tracks de chaque frame aux abonnés (files asyncio pour les
+WebSockets, sans attente active). Quand une source se termine (fin de
+fichier), le flux s'arrête, publie un message {"event": "end"} et appelle
+`on_end`.
+
+Quand l'inférence prend du retard sur le budget de latence, une politique
+configurable s'applique:
+- "drop_oldest": les frames trop anciennes sont abandonnées au profit des
+  plus récentes (la file est bornée);
+- "skip_detection": chaque frame est publiée, mais la détection est sautée
+  pour les frames en retard (les tracks sont seulement prédits par Kalman).
+"""
+
+import asyncio
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+
+import cv2
+import numpy as np
+
+
+POLICIES = ("drop_oldest", "skip_detection")
+
+
+class AsyncSubscription:
+    """File asyncio d'un abonné, alimentée depuis le thread de traitement"""
+
+    def __init__(self, loop, maxsize=32):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def put(self, message):
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # Boucle fermée: l'abonné est parti
+            pass
+
+    def _put(self, message):
+        # Un abonné lent perd ses plus vieux messages, jamais le flux
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class LiveStreamProcessor:
+    """Détection et tracking temps réel sous contrainte de latence"""
+
+    def __init__(self, detector, tracker, latency_budget_ms=200, policy="drop_oldest",
+                 queue_size=4, tiling=None, stream_id=None, detection_filter=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Politique inconnue: {policy} (attendu: {POLICIES})")
+
+        self.stream_id = stream_id or uuid.uuid4().hex[:8]
+        self.detector = detector
+        self.tracker = tracker
+        self.latency_budget = latency_budget_ms / 1000.0
+        self.policy = policy
+        self.tiling = tiling
+        self.detection_filter = detection_filter
+        self.source = None
+        # Appelé (thread de traitement) quand la source est terminée
+        self.on_end = None
+
+        self._frames = deque(maxlen=queue_size)
+        self._frames_ready = threading.Condition()
+        self._subscribers = []
+        self._subscribers_lock = threading.Lock()
+        self._running = False
+        self._source_done = threading.Event()
+        self._threads = []
+        # Protège les agrégats du tracker et les latences lus par stats() (autre thread)
+        self._stats_lock = threading.Lock()
+
+        self.frames_received = 0
+        self.frames_processed = 0
+        self.frames_dropped = 0
+        self.detections_skipped = 0
+        self.latencies = deque(maxlen=1000)
+        self.started_at = None
+
+    # ------------------------------------------------------------------ entrée
+
+    def push_frame(self, frame, timestamp=None):
+        """Ajoute une frame (horodatée à la réception) dans la file bornée"""
+        with self._frames_ready:
+            if len(self._frames) == self._frames.maxlen:
+                # La file est pleine: la plus ancienne frame est abandonnée
+                self.frames_dropped += 1
+            self._frames.append((self.frames_received, timestamp or time.monotonic(), frame))
+            self.frames_received += 1
+            self._frames_ready.notify()
+
+    def _capture_loop(self, source, realtime):
+        cap = cv2.VideoCapture(source)
+        if not cap.isOpened():
+            print(f"❌ Flux {self.stream_id}: impossible d'ouvrir {source}")
+            self._end_source()
+            return
+
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        frame_interval = 1.0 / fps
+        next_deadline = time.monotonic()
+
+        while self._running:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            self.push_frame(frame)
+
+            if realtime:
+                # Fichier local: relecture à la cadence native
+                next_deadline += frame_interval
+                delay = next_deadline - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_deadline = time.monotonic()
+
+        cap.release()
+        print(f"⏹️  Flux {self.stream_id}: fin de la source")
+        self._end_source()
+
+    def _end_source(self):
+        """Plus aucune frame à venir: le traitement s'arrête une fois la file vidée"""
+        self._source_done.set()
+        with self._frames_ready:
+            self._frames_ready.notify_all()
+
+    # ------------------------------------------------------------- traitement
+
+    def _next_frame(self):
+        """Prochaine frame à traiter selon la politique (None si arrêt)"""
+        with self._frames_ready:
+            while self._running and not self._frames and not self._source_done.is_set():
+                self._frames_ready.wait(timeout=0.1)
+            if not self._frames:
+                return None
+
+            if self.policy == "drop_oldest":
+                # Abandonner les frames hors budget tant qu'une plus récente attend
+                now = time.monotonic()
+                while len(self._frames) > 1 and now - self._frames[0][1] > self.latency_budget:
+                    self._frames.popleft()
+                    self.frames_dropped += 1
+
+            return self._frames.popleft()
+
+    def _process_loop(self):
+        while self._running:
+            item = self._next_frame()
+            if item is None:
+                if self._source_done.is_set():
+                    self._finish()
+                continue
+            frame_number, captured_at, frame = item
+
+            late = time.monotonic() - captured_at > self.latency_budget
+            skipped = late and self.policy == "skip_detection"
+
+            detections = None
+            if not skipped:
+                detections = self.detector.detect(frame, tiling=self.tiling,
+                                                  detection_filter=self.detection_filter)
+
+            with self._stats_lock:
+                if skipped:
+                    # Pas de détection: les tracks sont seulement propagés
+                    tracks = self.tracker.predict()
+                    self.detections_skipped += 1
+                else:
+                    tracks = self.tracker.update(frame, detections)
+
+                track_info = self.tracker.get_track_info(tracks)
+                latency = time.monotonic() - captured_at
+                self.latencies.append(latency)
+                self.frames_processed += 1
+
+            self._publish({
+                "stream_id": self.stream_id,
+                "frame_number": frame_number,
+                "latency_ms": round(latency * 1000, 1),
+                "detection_skipped": skipped,
+                "tracks": track_info,
+            })
+
+    def _finish(self):
+        """Fin de la source: arrêt du traitement et message de fin aux abonnés"""
+        self._running = False
+        self._publish({"stream_id": self.stream_id, "event": "end"})
+        print(f"🏁 Flux {self.stream_id} terminé: {self.frames_processed} frames traitées")
+        if self.on_end is not None:
+            self.on_end()
+
+    # ------------------------------------------------------------- abonnés
+
+    def subscribe(self, maxsize=32, loop=None):
+        """
+        File de messages (un dict par frame traitée) pour un abonné
+
+        Avec `loop` (boucle asyncio), la file est une AsyncSubscription
+        attendue par `await subscription.get()`; sinon une queue.Queue.
+        """
+        if loop is not None:
+            subscription = AsyncSubscription(loop, maxsize)
+        else:
+            subscription = queue.Queue(maxsize=maxsize)
+        with self._subscribers_lock:
+            self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._subscribers_lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def _publish(self, message):
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            if isinstance(subscription, AsyncSubscription):
+                subscription.put(message)
+                continue
+            # Un abonné lent perd ses plus vieux messages, jamais le flux
+            while True:
+                try:
+                    subscription.put_nowait(message)
+                    break
+                except queue.Full:
+                    try:
+                        subscription.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    # ------------------------------------------------------------- cycle de vie
+
+    def start(self, source=None, realtime=None):
+        """Démarre le traitement (et la capture si une source est fournie)"""
+        self._running = True
+        self._source_done.clear()
+        self.started_at = time.monotonic()
+        with self._stats_lock:
+            self.tracker.reset()
+
+        threads = [threading.Thread(target=self._process_loop, daemon=True)]
+        if source is not None:
+            self.source = source
+            if realtime is None:
+                realtime = isinstance(source, str) and os.path.isfile(source)
+            threads.append(threading.Thread(
+                target=self._capture_loop, args=(source, realtime), daemon=True
+            ))
+
+        for thread in threads:
+            thread.start()
+        self._threads = threads
+        print(f"📡 Flux {self.stream_id} démarré (budget {self.latency_budget * 1000:.0f} ms, "
+              f"politique {self.policy})")
+        return self
+
+    def stop(self):
+        self._running = False
+        with self._frames_ready:
+            self._frames_ready.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=2)
+        self._threads = []
+
+    @property
+    def running(self):
+        return self._running
+
+    def stats(self):
+        """
+        Latence bout-en-bout (capture -> publication) et compteurs
+
+        Appelé depuis les requêtes: les latences et les agrégats du tracker
+        sont copiés sous le verrou partagé avec le thread de traitement.
+        """
+        with self._stats_lock:
+            latencies = np.asarray(self.latencies) * 1000
+            analytics = self.tracker.analytics.summary(include_tracks=False)
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        return {
+            "stream_id": self.stream_id,
+            "source": str(self.source) if self.source is not None else "push",
+            "running": self._running,
+            "policy": self.policy,
+            "latency_budget_ms": self.latency_budget * 1000,
+            "frames_received": self.frames_received,
+            "frames_processed": self.frames_processed,
+            "frames_dropped": self.frames_dropped,
+            "detections_skipped": self.detections_skipped,
+            "processing_fps": self.frames_processed / elapsed if elapsed else 0.0,
+            "latency_ms_p50": float(np.percentile(latencies, 50)) if len(latencies) else None,
+            "latency_ms_p95": float(np.percentile(latencies, 95)) if len(latencies) else None,
+            "latency_ms_max": float(latencies.max()) if len(latencies) else None,
+            # Agrégats du tracker (durées en frames traitées, sans la liste des tracks)
+            "analytics": analytics,
+        }
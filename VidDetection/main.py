@@ -2,15 +2,37 @@
 main.py - FastAPI Backend pour détection et tracking vidéo
 """
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import time
+
+# Début du démarrage à froid (imports de torch/ultralytics compris)
+BOOT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from object_tracking import ObjectDetector, ObjectTracker
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+from jobs import JobManager, UploadStore
+from lifecycle import FrameBuffers, ServerState
+from detection_filter import DetectionFilter, parse_class_filter
+from inference_backends import BACKENDS
+from live_stream import POLICIES as LIVE_POLICIES, LiveStreamProcessor
+from model_registry import ModelRegistry, parse_sizes
+from object_tracking import ObjectTracker
+from prescan import PrescanConfig, finish_report, prescan_video, skip_to
+from profiling import PROFILE_DIR, JobProfile, metrics, profiler_trace
+from result_cache import ResultCache, cache_key, hash_bytes, hash_file
+from segments import process_video_parallel, shutdown_segment_pool
+from tiling import TilingConfig, parse_rois
+from track_analytics import TrackAnalytics, parse_lines
+from track_format import MEDIA_TYPE as VDT_MEDIA_TYPE, dumps as dumps_vdt
+import asyncio
+import threading
 import cv2
 import numpy as np
 import tempfile
 import os
 import io
+import json
 from typing import List, Dict
 
 app = FastAPI(title="Object Detection & Tracking API")
@@ -24,11 +46,177 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialiser les modèles au démarrage
-print("🚀 Initialisation des modèles...")
-detector = ObjectDetector(model_name='yolov8n.pt', confidence_threshold=0.5)
-tracker = ObjectTracker()
-print("✅ Serveur prêt!")
+# Configuration du backend d'inférence (variables d'environnement)
+# VIDDET_BACKEND: torch | onnxruntime | openvino
+# VIDDET_PRECISION: fp32 | fp16 | int8 (backends CPU)
+DETECTOR_CONFIG = {
+    "model_name": os.environ.get("VIDDET_MODEL", "yolov8n.pt"),
+    "confidence_threshold": float(os.environ.get("VIDDET_CONFIDENCE", "0.5")),
+    "backend": os.environ.get("VIDDET_BACKEND", "torch"),
+    "precision": os.environ.get("VIDDET_PRECISION", "fp32"),
+    "imgsz": int(os.environ.get("VIDDET_IMGSZ", "640")),
+    "num_threads": int(os.environ["VIDDET_THREADS"]) if os.environ.get("VIDDET_THREADS") else None,
+    "calibration_source": os.environ.get("VIDDET_CALIBRATION"),
+}
+
+# Modèles sélectionnables par job (VIDDET_MODELS), chargés à la demande et
+# gardés en mémoire dans la limite de VIDDET_MODELS_MAX_MB (LRU)
+ALLOWED_MODELS = list(dict.fromkeys(
+    m.strip() for m in os.environ.get(
+        "VIDDET_MODELS", f"{DETECTOR_CONFIG['model_name']},yolov8s.pt,yolov8m.pt"
+    ).split(",") if m.strip()
+))
+model_registry = ModelRegistry(
+    DETECTOR_CONFIG,
+    allowed_models=ALLOWED_MODELS,
+    max_bytes=int(os.environ.get("VIDDET_MODELS_MAX_MB", "2048")) * 1024 * 1024,
+    warmup_sizes=parse_sizes(os.environ.get("VIDDET_WARMUP_SIZES", "1280x720")),
+)
+
+# Modèles, tracker et buffers initialisés par warm_pool() au démarrage, pas à l'import:
+# les workers de segments (spawn) réimportent ce module sans rien charger
+server_state = ServerState(started=BOOT_STARTED)
+frame_buffers = FrameBuffers()
+tracker = None
+
+# Cache des résultats par contenu vidéo (VIDDET_CACHE_DIR, VIDDET_CACHE_MAX_MB)
+result_cache = ResultCache(
+    directory=os.environ.get("VIDDET_CACHE_DIR", "cache"),
+    max_bytes=int(os.environ.get("VIDDET_CACHE_MAX_MB", "2048")) * 1024 * 1024
+)
+
+# Flux en direct actifs (stream_id -> LiveStreamProcessor)
+live_streams = {}
+
+# Le détecteur et le tracker partagés ne traitent qu'une vidéo à la fois
+pipeline_lock = threading.Lock()
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov')
+
+
+def warm_pool():
+    """
+    Démarrage du serveur: modèles chargés et préchauffés, tracker, buffers
+    
+    Exécuté dans un thread: le serveur répond déjà (/health) mais /ready
+    renvoie 503 tant que les inférences de warmup (VIDDET_WARMUP_SIZES)
+    ne sont pas terminées.
+    """
+    global tracker
+    sizes = model_registry.warmup_sizes
+    try:
+        # Le modèle par défaut est préchauffé par le registre et n'est jamais évincé
+        with server_state.step("models"):
+            model_registry.pin()
+        with server_state.step("tracker"):
+            pipeline_tracker = ObjectTracker()
+            pipeline_tracker.warmup(sizes)
+            tracker = pipeline_tracker
+        with server_state.step("buffers"):
+            frame_buffers.allocate(sizes)
+        server_state.mark_ready()
+    except Exception as e:
+        server_state.mark_failed(e)
+
+
+@app.on_event("startup")
+async def startup():
+    """Lance le warmup en arrière-plan (le serveur accepte déjà les requêtes)"""
+    print(f"🚀 Initialisation des modèles (warmup: {model_registry.warmup_sizes})...")
+    threading.Thread(target=warm_pool, name="warm-pool", daemon=True).start()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    """Arrête le pool de workers de segments et les jobs en file"""
+    shutdown_segment_pool()
+    job_manager.shutdown()
+
+
+def require_ready():
+    """503 tant que les modèles ne sont pas chargés et préchauffés"""
+    if not server_state.ready:
+        raise HTTPException(status_code=503, headers={"Retry-After": "5"},
+                            detail=f"Serveur en cours de démarrage ({server_state.phase})")
+
+
+def build_tiling_config(tile_size, tile_overlap, imgsz, rois, full_frame=False, config=None):
+    """
+    Construit la configuration de tuilage d'un job (None = frame entière)
+    
+    Les backends CPU (`config`) sont exportés avec une entrée statique
+    (VIDDET_IMGSZ): une autre taille d'entrée des tuiles y est refusée (422)
+    plutôt qu'ignorée silencieusement.
+    """
+    if not tile_size:
+        # imgsz ne s'applique qu'aux tuiles: celui du détecteur est VIDDET_IMGSZ
+        if imgsz:
+            raise HTTPException(status_code=400,
+                                detail="imgsz nécessite tile_size (sinon VIDDET_IMGSZ du serveur)")
+        return None
+    try:
+        tiling = TilingConfig(
+            tile_size=tile_size,
+            overlap=tile_overlap,
+            imgsz=imgsz,
+            rois=parse_rois(rois),
+            full_frame=full_frame
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Configuration de tuilage invalide: {e}")
+    
+    config = config or model_registry.config()
+    if config["backend"] != "torch" and tiling.imgsz != config["imgsz"]:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Le backend {config['backend']} est exporté en {config['imgsz']}x{config['imgsz']}: "
+                   f"imgsz des tuiles ({tiling.imgsz}) non supporté, passez imgsz={config['imgsz']}"
+        )
+    return tiling
+
+
+def build_detector_config(model, backend):
+    """Configuration du détecteur d'un job (modèle et backend choisis, sinon par défaut)"""
+    if backend is not None and backend not in BACKENDS:
+        raise HTTPException(status_code=400, detail=f"Backend inconnu: {backend} {BACKENDS}")
+    try:
+        return model_registry.config(model, backend)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def build_detection_filter(classes, zones, config):
+    """
+    Filtre de classes et de zones d'un job (None = toutes les classes, frame entière)
+    
+    Les noms de `classes` sont ceux du modèle du job, chargé au besoin: à
+    appeler hors de la boucle d'événements (run_in_threadpool).
+    """
+    if not classes and not zones:
+        return None
+    try:
+        names = model_registry.names(config["model_name"], config["backend"]) if classes else {}
+        return DetectionFilter(classes=parse_class_filter(classes, names), polygons=zones)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Filtre de détection invalide: {e}")
+
+
+def build_prescan_config(prescan):
+    """Pré-analyse d'un job (None = toutes les frames passent par le pipeline complet)"""
+    if not prescan:
+        return None
+    try:
+        return PrescanConfig(method=prescan)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def build_lines(lines):
+    """Lignes de comptage d'un job (JSON '[[x1,y1,x2,y2], ...]', None = aucune)"""
+    try:
+        return parse_lines(lines)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Lignes de comptage invalides: {e}")
 
 
 @app.get("/")
@@ -39,80 +227,602 @@ async def root():
         "endpoints": {
             "/detect-video": "POST - Analyser une vidéo",
             "/detect-video-stream": "POST - Traiter et retourner la vidéo annotée",
-            "/health": "GET - Vérifier l'état du serveur"
+            "/uploads": "POST - Démarrer un upload par morceaux (PUT /uploads/{id}?offset=, reprenable)",
+            "/jobs": "POST - Soumettre un traitement en arrière-plan (GET /jobs/{id}, /jobs/{id}/result)",
+            "/models": "GET - Modèles disponibles et chargés (mémoire, temps de chargement, hits)",
+            "/cache": "GET - Statistiques du cache de résultats",
+            "/metrics": "GET - Métriques Prometheus (temps par étape, FPS, mémoire)",
+            "/profiles/{name}": "GET - Télécharger une trace de profilage (.prof)",
+            "/live/start": "POST - Démarrer un flux en direct (RTSP, caméra, fichier)",
+            "/live/{stream_id}/ws": "WebSocket - Recevoir les tracks d'un flux en direct",
+            "/live/push": "WebSocket - Pousser des frames (JPEG/PNG) et recevoir les tracks",
+            "/health": "GET - Vérifier l'état du serveur (démarrage, warmup, premier job)",
+            "/ready": "GET - 200 quand les modèles sont préchauffés, 503 sinon"
         }
     }
 
 
 @app.get("/health")
 async def health_check():
-    """Vérifier l'état du serveur"""
-    return {"status": "ok", "models_loaded": True}
+    """
+    Vérifier l'état du serveur (répond aussi pendant le démarrage)
+    
+    Les accesseurs du registre lisent des copies sans verrou: la réponse
+    n'attend jamais un modèle en cours de chargement.
+    """
+    state = server_state.to_dict()
+    loaded = model_registry.loaded()
+    return JSONResponse(
+        status_code=503 if server_state.error else 200,
+        content={
+            "status": "error" if server_state.error else "ok",
+            "models_loaded": bool(loaded),
+            "models": [f"{model} ({backend})" for model, backend in loaded],
+            "models_loading": [f"{model} ({backend})" for model, backend in model_registry.loading()],
+            "warmup_sizes": [list(size) for size in model_registry.warmup_sizes],
+            "frame_buffers": frame_buffers.sizes(),
+            **state,
+        }
+    )
 
 
-@app.post("/detect-video")
-async def detect_video(file: UploadFile = File(...)):
+@app.get("/ready")
+async def readiness_check():
+    """Disponibilité: 503 tant que les modèles ne sont pas préchauffés"""
+    return JSONResponse(
+        status_code=200 if server_state.ready else 503,
+        content={"ready": server_state.ready, "phase": server_state.phase, "error": server_state.error}
+    )
+
+
+def pipeline_params(tiling, config, detection_filter=None, prescan=None, stitched=False):
     """
-    Analyse une vidéo et retourne les détections/tracks pour chaque frame
+    Paramètres qui déterminent les résultats d'un job (clé du cache)
+    
+    `stitched`: tracks de segments parallèles recousus, dont les IDs diffèrent
+    d'un traitement séquentiel (entrées de cache distinctes).
     """
-    if not file.filename.endswith(('.mp4', '.avi', '.mov')):
-        raise HTTPException(status_code=400, detail="Format vidéo non supporté. Utilisez MP4, AVI ou MOV.")
+    params = {k: v for k, v in config.items() if k != "num_threads"}
+    params["tracker"] = tracker.config
+    params["tiling"] = tiling.to_dict() if tiling else None
+    if detection_filter is not None:
+        params["detection_filter"] = detection_filter.to_dict()
+    if prescan is not None:
+        params["prescan"] = prescan.to_dict()
+    if stitched:
+        params["stitched"] = True
+    return params
+
+
+def sample_frames(frames):
+    """Échantillonnage des frames renvoyées en JSON (réponse allégée)"""
+    return [
+        f for f in frames
+        if f["frame_number"] % 10 == 0 or f["frame_number"] < 5
+    ]
+
+
+def video_info(video_path):
+    """Métadonnées de la vidéo stockées avec les résultats (.vdt)"""
+    cap = cv2.VideoCapture(video_path)
+    info = {
+        "fps": cap.get(cv2.CAP_PROP_FPS) or None,
+        "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+    }
+    cap.release()
+    return info
+
+
+def profile_header(summary):
+    """Résumé du profil en JSON compact (en-tête X-Job-Profile des réponses binaires)"""
+    header = {k: v for k, v in summary.items() if k != "trace"}
+    if summary.get("trace"):
+        header["trace"] = summary["trace"]["file"]
+    return json.dumps(header, separators=(",", ":"))
+
+
+def trace_name(job_type, key):
+    """Nom unique de la trace cProfile d'un job"""
+    return f"{job_type}-{key[:12]}-{int(time.time())}"
+
+
+def summary_header(summary):
+    """Résumé des tracks sans la liste par track (en-tête X-Track-Summary)"""
+    header = {k: v for k, v in summary.items() if k != "tracks"}
+    if header.get("prescan"):
+        header["prescan"] = {k: v for k, v in header["prescan"].items() if k != "ranges"}
+    return json.dumps(header, separators=(",", ":"), ensure_ascii=True)
+
+
+def track_summary(frames, lines, fps, analytics=None, prescan=None, include_tracks=False):
+    """
+    Résumé des tracks d'une vidéo
     
-    # Sauvegarder temporairement la vidéo
-    suffix = os.path.splitext(file.filename)[-1]
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        content = await file.read()
-        tmp.write(content)
-        tmp_path = tmp.name
+    `analytics` est l'agrégat tenu par le tracker pendant un traitement
+    séquentiel; sinon (cache, segments parallèles) il est recalculé en un
+    passage sur les frames. `prescan` est le rapport de pré-analyse éventuel
+    (part de la vidéo réellement traitée, gain). Le détail par track
+    (`include_tracks`) n'est demandé que par les jobs, qui le servent par page.
+    """
+    if analytics is None:
+        analytics = TrackAnalytics.from_frames(frames, lines=lines)
+    summary = analytics.summary(fps=fps, include_tracks=include_tracks)
+    if prescan is not None:
+        summary["prescan"] = prescan
+    return summary
+
+
+def detect_track_seconds(job_profile):
+    """Temps de détection + tracking d'un job (base de l'estimation de la pré-analyse)"""
+    return job_profile.stage_totals["detect"] + job_profile.stage_totals["track"]
+
+
+def prescan_judge(config, detection_filter=None):
+    """
+    Détecteur de la pré-analyse "detector": le plus petit modèle autorisé
+
+    Les classes filtrées du job sont converties par nom vers les ids du petit
+    modèle; s'il n'en connaît aucune, le modèle du job sert de juge.
+    """
+    judge = model_registry.get(model_registry.smallest(), config["backend"])
+    if detection_filter is None or detection_filter.classes is None:
+        return judge, None
+    job_names = model_registry.names(config["model_name"], config["backend"])
+    judge_ids = {name: class_id for class_id, name in judge.names.items()}
+    classes = [judge_ids[job_names[c]] for c in detection_filter.classes
+               if job_names.get(c) in judge_ids]
+    if not classes:
+        return model_registry.get(config["model_name"], config["backend"]), detection_filter.classes
+    return judge, classes
+
+
+def run_prescan(video_path, prescan, config, detection_filter=None):
+    """Première passe d'un job: plages d'activité (None si la pré-analyse est désactivée)"""
+    if prescan is None:
+        return None
+    detector = classes = None
+    if prescan.method == "detector":
+        detector, classes = prescan_judge(config, detection_filter)
+    report = prescan_video(video_path, prescan, detector=detector, classes=classes)
+    print(f"🔎 Pré-analyse ({report['sampling']}, {report['samples']} échantillons): "
+          f"{len(report['ranges'])} plages, {report['frames_selected']}/{report['frames_total']} "
+          f"frames retenues en {report['scan_seconds']:.2f}s")
+    return report
+
+
+def vdt_response(payload, filename, cache_status, profile_summary, summary):
+    """Réponse binaire .vdt (toutes les frames, format colonnaire)"""
+    return Response(
+        content=payload,
+        media_type=VDT_MEDIA_TYPE,
+        headers={
+            "Content-Disposition": f"attachment; filename=analysis_{filename}.vdt",
+            "X-Cache": cache_status,
+            "X-Job-Profile": profile_header(profile_summary),
+            "X-Track-Summary": summary_header(summary)
+        }
+    )
+
+
+def track_video(video_path, tiling=None, workers=1, on_frame=None, profile=None, progress=None,
+                lines=None, config=None, detection_filter=None, active_ranges=None):
+    """
+    Détection + tracking de toutes les frames d'une vidéo
     
-    try:
-        cap = cv2.VideoCapture(tmp_path)
+    Retourne (frames, parallel_stats), où frames contient toutes les frames
+    {"frame_number", "detections", "tracks"}. En mode séquentiel,
+    on_frame(frame_number, frame, frame_result) est appelé pour chaque frame
+    et tracker.analytics contient les statistiques des tracks (lignes `lines`).
+    Les temps par étape sont enregistrés dans `profile` (JobProfile) et
+    progress(frames_traitées, total) est appelé régulièrement. `config` choisit
+    le détecteur (build_detector_config, défaut du serveur sinon) et
+    `detection_filter` restreint ses classes et zones. Avec `active_ranges`
+    (pré-analyse), seules ces plages [début, fin[ sont détectées et trackées:
+    les autres frames restent vides et ne sont décodées que pour `on_frame`.
+    """
+    profile = profile or JobProfile("track")
+    config = config or model_registry.config()
+    
+    if workers > 1 and on_frame is None and active_ranges is None:
+        # Segments traités en parallèle, IDs de tracks recousus
+        frames, stats = process_video_parallel(
+            video_path, config, num_workers=workers, tiling=tiling, profile=profile,
+            detection_filter=detection_filter
+        )
+        if progress is not None:
+            progress(len(frames), len(frames))
+        return frames, stats
+    
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise HTTPException(status_code=400, detail="Impossible d'ouvrir la vidéo")
+    
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    print(f"📹 Traitement de {total_frames} frames ({config['model_name']})...")
+    
+    # Décodage dans un buffer préalloué: aucune allocation par frame
+    buffer = frame_buffers.get(int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                               int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    
+    # Modèle déjà chargé réutilisé, sinon chargé par le registre
+    detector = model_registry.get(config["model_name"], config["backend"])
+    
+    # Chaque vidéo repart d'un tracker vierge (résultats reproductibles)
+    tracker.reset(lines=lines or [])
+    
+    frames = []
+    frame_count = 0
+    range_index = 0
+    while True:
+        if active_ranges is not None:
+            while range_index < len(active_ranges) and frame_count >= active_ranges[range_index][1]:
+                range_index += 1
+            next_start = active_ranges[range_index][0] if range_index < len(active_ranges) else None
+            
+            if next_start is None or frame_count < next_start:
+                if on_frame is None:
+                    # Hors activité: frames vides, sautées sans décodage jusqu'à la plage suivante
+                    stop = next_start if next_start is not None else total_frames
+                    frames.extend({"frame_number": n, "detections": [], "tracks": []}
+                                  for n in range(frame_count, stop))
+                    profile.skip(max(stop - frame_count, 0))
+                    if next_start is None:
+                        break
+                    with profile.stage("decode"):
+                        skipped = skip_to(cap, frame_count, next_start)
+                    if not skipped:
+                        break
+                    frame_count = next_start
+                    if progress is not None:
+                        progress(frame_count, total_frames)
+                    continue
+                
+                # Rendu: la frame est écrite telle quelle, sans détection
+                with profile.stage("decode"):
+                    ret, frame = cap.read(buffer)
+                if not ret:
+                    break
+                frame_result = {"frame_number": frame_count, "detections": [], "tracks": []}
+                frames.append(frame_result)
+                on_frame(frame_count, frame, frame_result)
+                frame_count += 1
+                profile.skip()
+                profile.frame_done()
+                if progress is not None and frame_count % 10 == 0:
+                    progress(frame_count, total_frames)
+                continue
         
-        if not cap.isOpened():
-            raise HTTPException(status_code=400, detail="Impossible d'ouvrir la vidéo")
+        with profile.stage("decode"):
+            ret, frame = cap.read(buffer)
+        if not ret:
+            break
         
-        frames_data = []
-        frame_count = 0
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if frame_count != tracker.frame_number:
+            # Début d'une plage d'activité: les tracks vieillissent pendant l'écart
+            with profile.stage("track"):
+                tracker.jump_to(frame_count)
         
-        print(f"📹 Traitement de {total_frames} frames...")
+        # Détection
+        with profile.stage("detect"):
+            detections = detector.detect(frame, tiling=tiling, detection_filter=detection_filter)
         
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            # Détection
-            detections = detector.detect(frame)
-            
-            # Tracking
+        # Tracking
+        with profile.stage("track"):
             tracks = tracker.update(frame, detections)
             track_info = tracker.get_track_info(tracks)
-            
-            # Sauvegarder les résultats (limité pour éviter une réponse trop lourde)
-            if frame_count % 10 == 0 or frame_count < 5:  # Échantillonnage
-                frames_data.append({
-                    "frame_number": frame_count,
-                    "detections": detections,
-                    "tracks": track_info
-                })
-            
-            frame_count += 1
-            
-            # Progression
-            if frame_count % 50 == 0:
-                print(f"  Progression: {frame_count}/{total_frames} frames")
         
-        cap.release()
+        frame_result = {
+            "frame_number": frame_count,
+            "detections": detections,
+            "tracks": track_info
+        }
+        frames.append(frame_result)
         
-        print(f"✅ Traitement terminé: {frame_count} frames")
+        if on_frame is not None:
+            on_frame(frame_count, frame, frame_result)
         
+        frame_count += 1
+        profile.frame_done()
+        
+        # Progression
+        if progress is not None and frame_count % 10 == 0:
+            progress(frame_count, total_frames)
+        if frame_count % 50 == 0:
+            print(f"  Progression: {frame_count}/{total_frames} frames")
+    
+    cap.release()
+    return frames, None
+
+
+def render_tracked_video(video_path, out_path, frames=None, tiling=None, write_every=1,
+                         profile=None, progress=None, lines=None, config=None,
+                         detection_filter=None, active_ranges=None):
+    """
+    Écrit la vidéo annotée
+    
+    Si `frames` est fourni (cache), seuls le décodage et le rendu sont
+    effectués; sinon la détection et le tracking tournent pendant le rendu.
+    Retourne la liste complète des frames traitées.
+    """
+    profile = profile or JobProfile("annotate")
+    
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise HTTPException(status_code=400, detail="Impossible d'ouvrir la vidéo")
+    
+    # Propriétés vidéo
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = int(cap.get(cv2.CAP_PROP_FPS))
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    
+    # Writer pour la vidéo de sortie
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    out_fps = max(fps / write_every, 1)
+    out = cv2.VideoWriter(out_path, fourcc, out_fps, (frame_width, frame_height))
+    
+    def write_frame(frame_number, frame, frame_result):
+        # Le tracking voit toutes les frames, le rendu seulement celles écrites
+        if frame_number % write_every != 0:
+            profile.skip()
+            return
+        
+        # Dessiner les annotations directement dans la frame décodée
+        with profile.stage("draw"):
+            annotated_frame = tracker.draw_track_info(frame, frame_result["tracks"], inplace=True)
+        
+        # Écrire la frame annotée
+        with profile.stage("write"):
+            out.write(annotated_frame)
+    
+    try:
+        if frames is None:
+            cap.release()
+            frames, _ = track_video(video_path, tiling=tiling, on_frame=write_frame,
+                                    profile=profile, progress=progress, lines=lines,
+                                    config=config, detection_filter=detection_filter,
+                                    active_ranges=active_ranges)
+        else:
+            by_number = {f["frame_number"]: f for f in frames}
+            empty = {"tracks": []}
+            buffer = frame_buffers.get(frame_width, frame_height)
+            frame_count = 0
+            while True:
+                # Frames non écrites: grab() les décode mais évite la conversion et la copie
+                if frame_count % write_every != 0:
+                    with profile.stage("decode"):
+                        grabbed = cap.grab()
+                    if not grabbed:
+                        break
+                    profile.skip()
+                else:
+                    with profile.stage("decode"):
+                        ret, frame = cap.read(buffer)
+                    if not ret:
+                        break
+                    write_frame(frame_count, frame, by_number.get(frame_count, empty))
+                frame_count += 1
+                profile.frame_done()
+                if progress is not None and frame_count % 10 == 0:
+                    progress(frame_count, total_frames)
+            cap.release()
+    finally:
+        out.release()
+    
+    return frames
+
+
+def analyze_video(video_path, content_hash=None, tiling=None, workers=1, output_format="json",
+                  profile=False, progress=None, lines=None, include_frames=True, config=None,
+                  detection_filter=None, prescan=None, include_tracks=False):
+    """
+    Détections/tracks d'une vidéo, depuis le cache si possible
+    
+    Retourne (payload, cache_status, profile_summary, summary): payload est
+    le dict JSON (résumé des tracks + frames échantillonnées, sauf si
+    `include_frames` est faux) ou les octets .vdt (toutes les frames). Avec
+    `prescan` (PrescanConfig), seules les plages d'activité sont traitées.
+    `include_tracks` ajoute le détail par track au résumé (voir track_summary).
+    """
+    config = config or model_registry.config()
+    # Mêmes conditions que track_video pour le traitement par segments
+    stitched = workers > 1 and prescan is None
+    key = cache_key(content_hash or hash_file(video_path),
+                    pipeline_params(tiling, config, detection_filter, prescan, stitched))
+    job_profile = JobProfile("detect-video")
+    
+    # Même vidéo + même configuration: résultats déjà calculés
+    # Fichier ouvert par le cache: une éviction concurrente ne peut plus le retirer
+    reader = result_cache.open(key)
+    if reader is not None:
+        print(f"♻️  Résultats en cache: {key[:12]}...")
+        with reader:
+            frames = reader.to_frames()
+            summary = track_summary(frames, lines, reader.fps, prescan=reader.meta.get("prescan"),
+                                    include_tracks=include_tracks)
+            payload = bytes(reader.getbuffer()) if output_format == "vdt" else None
+        
+        profile_summary = job_profile.finish()
+        server_state.record_job(job_profile.job_type, profile_summary["wall_time_s"], "hit")
+        if output_format == "vdt":
+            return payload, "hit", profile_summary, summary
+        
+        frames_data = sample_frames(frames) if include_frames else []
         return {
             "status": "success",
-            "total_frames": frame_count,
+            "total_frames": len(frames),
             "sampled_frames": len(frames_data),
-            "frames": frames_data
-        }
+            "model": config["model_name"],
+            "summary": summary,
+            "frames": frames_data,
+            "parallel": None,
+            "cache": "hit",
+            "profile": profile_summary
+        }, "hit", profile_summary, summary
+    
+    try:
+        info = video_info(video_path)
+        with pipeline_lock, profiler_trace(job_profile, profile, trace_name("detect-video", key)):
+            with job_profile.stage("prescan"):
+                scan = run_prescan(video_path, prescan, config, detection_filter)
+            pass_start = time.perf_counter()
+            frames, parallel_stats = track_video(video_path, tiling=tiling, workers=workers,
+                                                 profile=job_profile, progress=progress,
+                                                 lines=lines, config=config,
+                                                 detection_filter=detection_filter,
+                                                 active_ranges=scan["ranges"] if scan else None)
+            if scan is not None:
+                scan = finish_report(scan, tracker.analytics.frames_seen,
+                                     time.perf_counter() - pass_start,
+                                     detect_track_seconds(job_profile))
+            # Séquentiel: agrégats déjà tenus par le tracker pendant le traitement
+            summary = track_summary(frames, lines, info["fps"],
+                                    analytics=tracker.analytics if parallel_stats is None else None,
+                                    prescan=scan, include_tracks=include_tracks)
+        metadata = {"prescan": scan} if scan else None
+        result_cache.put(key, frames, **info, metadata=metadata)
+    except Exception:
+        job_profile.finish(status="error")
+        raise
+    profile_summary = job_profile.finish()
+    server_state.record_job(job_profile.job_type, profile_summary["wall_time_s"], "miss")
+    
+    print(f"✅ Traitement terminé: {len(frames)} frames, {summary['total_tracks']} tracks "
+          f"({profile_summary['fps']:.1f} FPS)")
+    
+    if output_format == "vdt":
+        return dumps_vdt(frames, **info, metadata=metadata), "miss", profile_summary, summary
+    
+    # Sauvegarder les résultats (limité pour éviter une réponse trop lourde)
+    frames_data = sample_frames(frames) if include_frames else []
+    
+    return {
+        "status": "success",
+        "total_frames": len(frames),
+        "sampled_frames": len(frames_data),
+        "model": config["model_name"],
+        "summary": summary,
+        "frames": frames_data,
+        "parallel": parallel_stats,
+        "cache": "miss",
+        "profile": profile_summary
+    }, "miss", profile_summary, summary
+
+
+def annotate_video(video_path, out_path, content_hash=None, tiling=None, write_every=1,
+                   profile=False, progress=None, lines=None, config=None, detection_filter=None,
+                   prescan=None, include_tracks=False):
+    """
+    Écrit la vidéo annotée dans out_path (tracks repris du cache si possible)
+    
+    Avec `prescan`, toutes les frames sont écrites mais seules les plages
+    d'activité sont détectées et trackées. Retourne (cache_status,
+    profile_summary, summary).
+    """
+    config = config or model_registry.config()
+    key = cache_key(content_hash or hash_file(video_path),
+                    pipeline_params(tiling, config, detection_filter, prescan))
+    cached = result_cache.get(key)
+    job_profile = JobProfile("detect-video-stream")
+    info = video_info(video_path)
+    
+    try:
+        with pipeline_lock, profiler_trace(job_profile, profile,
+                                           trace_name("detect-video-stream", key)):
+            if cached is not None:
+                # Tracks déjà calculés: seul le rendu est refait
+                print(f"♻️  Rendu depuis le cache: {key[:12]}...")
+                render_tracked_video(video_path, out_path, frames=cached,
+                                     write_every=write_every, profile=job_profile,
+                                     progress=progress)
+                summary = track_summary(cached, lines, info["fps"], include_tracks=include_tracks)
+            else:
+                print(f"📹 Traitement et annotation de la vidéo...")
+                with job_profile.stage("prescan"):
+                    scan = run_prescan(video_path, prescan, config, detection_filter)
+                pass_start = time.perf_counter()
+                frames = render_tracked_video(video_path, out_path, tiling=tiling,
+                                              write_every=write_every, profile=job_profile,
+                                              progress=progress, lines=lines, config=config,
+                                              detection_filter=detection_filter,
+                                              active_ranges=scan["ranges"] if scan else None)
+                if scan is not None:
+                    # Gain sur la détection + tracking seuls: toutes les frames restent décodées et écrites
+                    scan = finish_report(scan, tracker.analytics.frames_seen,
+                                         time.perf_counter() - pass_start,
+                                         detect_track_seconds(job_profile))
+                summary = track_summary(frames, lines, info["fps"], analytics=tracker.analytics,
+                                        prescan=scan, include_tracks=include_tracks)
+                result_cache.put(key, frames, **info, metadata={"prescan": scan} if scan else None)
+    except Exception:
+        job_profile.finish(status="error")
+        raise
+    profile_summary = job_profile.finish()
+    cache_status = "hit" if cached is not None else "miss"
+    server_state.record_job(job_profile.job_type, profile_summary["wall_time_s"], cache_status)
+    
+    print(f"✅ Vidéo annotée créée ({profile_summary['fps']:.1f} FPS)")
+    return cache_status, profile_summary, summary
+
+
+@app.post("/detect-video")
+async def detect_video(
+    file: UploadFile = File(...),
+    tile_size: int = Query(0, ge=0, description="Taille des tuiles (0 = désactivé)"),
+    tile_overlap: float = Query(0.2, ge=0.0, lt=1.0),
+    imgsz: int = Query(None, gt=0, description="Résolution d'entrée du modèle (tuiles)"),
+    tile_full_frame: bool = Query(False, description="Passe pleine frame en plus des tuiles"),
+    rois: str = Query(None, description="ROIs JSON: [[x1,y1,x2,y2], ...]"),
+    workers: int = Query(1, ge=1, description="Processus parallèles (segments)"),
+    output_format: str = Query("json", alias="format",
+                               description="json (échantillonné) ou vdt (binaire, toutes les frames)"),
+    profile: bool = Query(False, description="Exécuter le job sous cProfile (trace .prof)"),
+    lines: str = Query(None, description="Lignes de comptage JSON: [[x1,y1,x2,y2], ...]"),
+    include_frames: bool = Query(True, alias="frames",
+                                 description="Inclure les frames échantillonnées (sinon résumé seul)"),
+    model: str = Query(None, description="Modèle YOLO (ex: yolov8s), voir /models"),
+    backend: str = Query(None, description="torch, onnxruntime ou openvino (défaut du serveur)"),
+    classes: str = Query(None, description="Classes autorisées: person,car,... (noms ou ids)"),
+    zones: str = Query(None, description="Zones polygonales JSON: [[[x,y],[x,y],[x,y],...], ...]"),
+    prescan: str = Query(None, description="Pré-analyse rapide: motion ou detector (plages actives seules)"),
+):
+    """
+    Analyse une vidéo et retourne le résumé des tracks et les détections/tracks par frame
+    """
+    require_ready()
+    if not file.filename.endswith(VIDEO_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="Format vidéo non supporté. Utilisez MP4, AVI ou MOV.")
+    if output_format not in ("json", "vdt"):
+        raise HTTPException(status_code=400, detail="Format de sortie inconnu: json ou vdt")
+    
+    config = build_detector_config(model, backend)
+    tiling = build_tiling_config(tile_size, tile_overlap, imgsz, rois, tile_full_frame, config)
+    lines = build_lines(lines)
+    detection_filter = await run_in_threadpool(build_detection_filter, classes, zones, config)
+    prescan = build_prescan_config(prescan)
+    
+    content = await file.read()
+    
+    # Sauvegarder temporairement la vidéo
+    suffix = os.path.splitext(file.filename)[-1]
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        tmp.write(content)
+        tmp_path = tmp.name
+    
+    try:
+        # Hors de la boucle d'événements: le serveur reste disponible pendant le traitement
+        payload, cache_status, profile_summary, summary = await run_in_threadpool(
+            analyze_video, tmp_path, hash_bytes(content), tiling, workers, output_format, profile,
+            lines=lines, include_frames=include_frames, config=config,
+            detection_filter=detection_filter, prescan=prescan
+        )
+        if output_format == "vdt":
+            return vdt_response(payload, file.filename, cache_status, profile_summary, summary)
+        return payload
+    
+    except HTTPException:
+        raise
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors du traitement: {str(e)}")
@@ -124,17 +834,40 @@ async def detect_video(file: UploadFile = File(...)):
 
 
 @app.post("/detect-video-stream")
-async def detect_video_stream(file: UploadFile = File(...)):
+async def detect_video_stream(
+    file: UploadFile = File(...),
+    tile_size: int = Query(0, ge=0, description="Taille des tuiles (0 = désactivé)"),
+    tile_overlap: float = Query(0.2, ge=0.0, lt=1.0),
+    imgsz: int = Query(None, gt=0, description="Résolution d'entrée du modèle (tuiles)"),
+    tile_full_frame: bool = Query(False, description="Passe pleine frame en plus des tuiles"),
+    rois: str = Query(None, description="ROIs JSON: [[x1,y1,x2,y2], ...]"),
+    write_every: int = Query(1, ge=1, description="N'écrire qu'une frame sur N (accéléré)"),
+    profile: bool = Query(False, description="Exécuter le job sous cProfile (trace .prof)"),
+    lines: str = Query(None, description="Lignes de comptage JSON: [[x1,y1,x2,y2], ...]"),
+    model: str = Query(None, description="Modèle YOLO (ex: yolov8s), voir /models"),
+    backend: str = Query(None, description="torch, onnxruntime ou openvino (défaut du serveur)"),
+    classes: str = Query(None, description="Classes autorisées: person,car,... (noms ou ids)"),
+    zones: str = Query(None, description="Zones polygonales JSON: [[[x,y],[x,y],[x,y],...], ...]"),
+    prescan: str = Query(None, description="Pré-analyse rapide: motion ou detector (plages actives seules)"),
+):
     """
-    Traite une vidéo et retourne la vidéo annotée
+    Traite une vidéo et retourne la vidéo annotée (résumé des tracks dans X-Track-Summary)
     """
-    if not file.filename.endswith(('.mp4', '.avi', '.mov')):
+    require_ready()
+    if not file.filename.endswith(VIDEO_EXTENSIONS):
         raise HTTPException(status_code=400, detail="Format vidéo non supporté")
     
+    config = build_detector_config(model, backend)
+    tiling = build_tiling_config(tile_size, tile_overlap, imgsz, rois, tile_full_frame, config)
+    lines = build_lines(lines)
+    detection_filter = await run_in_threadpool(build_detection_filter, classes, zones, config)
+    prescan = build_prescan_config(prescan)
+    
+    content = await file.read()
+    
     # Sauvegarder temporairement
     suffix = os.path.splitext(file.filename)[-1]
     with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_in:
-        content = await file.read()
         tmp_in.write(content)
         tmp_in_path = tmp_in.name
     
@@ -142,48 +875,11 @@ async def detect_video_stream(file: UploadFile = File(...)):
     tmp_out_path = tempfile.mktemp(suffix='.mp4')
     
     try:
-        cap = cv2.VideoCapture(tmp_in_path)
-        
-        if not cap.isOpened():
-            raise HTTPException(status_code=400, detail="Impossible d'ouvrir la vidéo")
-        
-        # Propriétés vidéo
-        frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        fps = int(cap.get(cv2.CAP_PROP_FPS))
-        
-        # Writer pour la vidéo de sortie
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = cv2.VideoWriter(tmp_out_path, fourcc, fps, (frame_width, frame_height))
-        
-        print(f"📹 Traitement et annotation de la vidéo...")
-        
-        frame_count = 0
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            # Détection
-            detections = detector.detect(frame)
-            
-            # Tracking
-            tracks = tracker.update(frame, detections)
-            
-            # Dessiner les annotations
-            annotated_frame = tracker.draw_tracks(frame, tracks)
-            
-            # Écrire la frame annotée
-            out.write(annotated_frame)
-            
-            frame_count += 1
-            if frame_count % 50 == 0:
-                print(f"  Frames traitées: {frame_count}")
-        
-        cap.release()
-        out.release()
-        
-        print(f"✅ Vidéo annotée créée: {frame_count} frames")
+        cache_status, profile_summary, summary = await run_in_threadpool(
+            annotate_video, tmp_in_path, tmp_out_path, hash_bytes(content), tiling, write_every,
+            profile, lines=lines, config=config, detection_filter=detection_filter,
+            prescan=prescan
+        )
         
         # Lire la vidéo annotée
         with open(tmp_out_path, 'rb') as f:
@@ -193,9 +889,17 @@ async def detect_video_stream(file: UploadFile = File(...)):
         return StreamingResponse(
             io.BytesIO(video_bytes),
             media_type="video/mp4",
-            headers={"Content-Disposition": f"attachment; filename=annotated_{file.filename}"}
+            headers={
+                "Content-Disposition": f"attachment; filename=annotated_{file.filename}",
+                "X-Cache": cache_status,
+                "X-Job-Profile": profile_header(profile_summary),
+                "X-Track-Summary": summary_header(summary)
+            }
         )
     
+    except HTTPException:
+        raise
+    
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
     
@@ -206,6 +910,407 @@ async def detect_video_stream(file: UploadFile = File(...)):
                 os.remove(path)
 
 
+# ========== Uploads reprenables et jobs en arrière-plan ==========
+
+def run_job(job):
+    """Exécute un job soumis via /jobs sur la vidéo d'un upload terminé"""
+    # Job soumis pendant le démarrage: il attend la fin du warmup
+    server_state.wait_ready()
+    params = job.params
+    video_path = upload_store.path(job.upload_id)
+    config = build_detector_config(params["model"], params["backend"])
+    tiling = build_tiling_config(params["tile_size"], params["tile_overlap"],
+                                 params["imgsz"], params["rois"], params["tile_full_frame"], config)
+    detection_filter = build_detection_filter(params["classes"], params["zones"], config)
+    prescan = build_prescan_config(params["prescan"])
+    
+    if job.kind == "detect-video":
+        payload, _, _, job.summary = analyze_video(
+            video_path, tiling=tiling, workers=params["workers"],
+            output_format=params["format"], profile=params["profile"], progress=job.report,
+            lines=params["lines"], include_frames=params["frames"], config=config,
+            detection_filter=detection_filter, prescan=prescan, include_tracks=True
+        )
+        # Détail par track servi par page (GET /jobs/{job_id}/tracks), hors du résultat
+        job.tracks = job.summary.pop("tracks")
+        if params["format"] != "vdt":
+            return payload
+        out_path = os.path.join(job.output_dir, "analysis.vdt")
+        with open(out_path, 'wb') as f:
+            f.write(payload)
+        return out_path, VDT_MEDIA_TYPE
+    
+    out_path = os.path.join(job.output_dir, "annotated.mp4")
+    _, _, job.summary = annotate_video(video_path, out_path, tiling=tiling,
+                                       write_every=params["write_every"],
+                                       profile=params["profile"], progress=job.report,
+                                       lines=params["lines"], config=config,
+                                       detection_filter=detection_filter, prescan=prescan,
+                                       include_tracks=True)
+    job.tracks = job.summary.pop("tracks")
+    return out_path, "video/mp4"
+
+
+# Un seul job à la fois: le détecteur et le tracker du serveur sont partagés
+upload_store = UploadStore(os.environ.get("VIDDET_UPLOAD_DIR", "uploads"))
+job_manager = JobManager(run_job, output_dir=os.environ.get("VIDDET_JOBS_DIR", "jobs"))
+
+
+@app.post("/uploads")
+async def create_upload(
+    filename: str = Query(..., description="Nom du fichier vidéo"),
+    size: int = Query(..., gt=0, description="Taille totale en octets")
+):
+    """Démarre un upload par morceaux (PUT /uploads/{upload_id}?offset=...)"""
+    if not filename.endswith(VIDEO_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="Format vidéo non supporté. Utilisez MP4, AVI ou MOV.")
+    return upload_store.create(filename, size)
+
+
+@app.get("/uploads/{upload_id}")
+async def upload_status(upload_id: str):
+    """Octets déjà reçus: offset à partir duquel reprendre l'upload"""
+    status = upload_store.status(upload_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Upload introuvable")
+    return status
+
+
+@app.put("/uploads/{upload_id}")
+async def upload_chunk(upload_id: str, request: Request, offset: int = Query(..., ge=0)):
+    """Reçoit un morceau de la vidéo à l'offset donné"""
+    data = await request.body()
+    try:
+        return upload_store.write(upload_id, offset, data)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload introuvable")
+    except ValueError as e:
+        # Offset désynchronisé (morceau perdu ou renvoyé): le client doit reprendre
+        raise HTTPException(status_code=409, detail={"message": "Offset inattendu",
+                                                     "received": e.args[0]})
+    except OverflowError:
+        raise HTTPException(status_code=400, detail="Le morceau dépasse la taille annoncée")
+
+
+@app.delete("/uploads/{upload_id}")
+async def delete_upload(upload_id: str):
+    upload_store.delete(upload_id)
+    return {"upload_id": upload_id, "deleted": True}
+
+
+@app.post("/jobs")
+async def submit_job(
+    upload_id: str = Query(...),
+    kind: str = Query("detect-video", description="detect-video ou detect-video-stream"),
+    tile_size: int = Query(0, ge=0, description="Taille des tuiles (0 = désactivé)"),
+    tile_overlap: float = Query(0.2, ge=0.0, lt=1.0),
+    imgsz: int = Query(None, gt=0, description="Résolution d'entrée du modèle (tuiles)"),
+    tile_full_frame: bool = Query(False, description="Passe pleine frame en plus des tuiles"),
+    rois: str = Query(None, description="ROIs JSON: [[x1,y1,x2,y2], ...]"),
+    workers: int = Query(1, ge=1, description="Processus parallèles (segments)"),
+    output_format: str = Query("json", alias="format",
+                               description="json (échantillonné) ou vdt (binaire, toutes les frames)"),
+    write_every: int = Query(1, ge=1, description="N'écrire qu'une frame sur N (accéléré)"),
+    profile: bool = Query(False, description="Exécuter le job sous cProfile (trace .prof)"),
+    lines: str = Query(None, description="Lignes de comptage JSON: [[x1,y1,x2,y2], ...]"),
+    include_frames: bool = Query(True, alias="frames",
+                                 description="Inclure les frames échantillonnées (sinon résumé seul)"),
+    model: str = Query(None, description="Modèle YOLO (ex: yolov8s), voir /models"),
+    backend: str = Query(None, description="torch, onnxruntime ou openvino (défaut du serveur)"),
+    classes: str = Query(None, description="Classes autorisées: person,car,... (noms ou ids)"),
+    zones: str = Query(None, description="Zones polygonales JSON: [[[x,y],[x,y],[x,y],...], ...]"),
+    prescan: str = Query(None, description="Pré-analyse rapide: motion ou detector (plages actives seules)"),
+):
+    """Soumet le traitement d'une vidéo uploadée; suivre avec GET /jobs/{job_id}"""
+    if kind not in ("detect-video", "detect-video-stream"):
+        raise HTTPException(status_code=400, detail="Type de job inconnu: detect-video ou detect-video-stream")
+    if output_format not in ("json", "vdt"):
+        raise HTTPException(status_code=400, detail="Format de sortie inconnu: json ou vdt")
+    
+    status = upload_store.status(upload_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Upload introuvable")
+    if not status["complete"]:
+        raise HTTPException(status_code=409, detail=f"Upload incomplet: {status['received']}/{status['size']} octets")
+    
+    # Valider la configuration de tuilage, le modèle, le filtre et la pré-analyse avant la mise en file
+    config = build_detector_config(model, backend)
+    build_tiling_config(tile_size, tile_overlap, imgsz, rois, tile_full_frame, config)
+    if model_registry.is_loaded(config["model_name"], config["backend"]):
+        # Modèle pas encore chargé (démarrage, autre modèle): classes validées au lancement du job
+        build_detection_filter(classes, zones, config)
+    build_prescan_config(prescan)
+    
+    job = job_manager.submit(kind, upload_id, {
+        "tile_size": tile_size, "tile_overlap": tile_overlap, "imgsz": imgsz, "rois": rois,
+        "tile_full_frame": tile_full_frame,
+        "workers": workers, "format": output_format, "write_every": write_every,
+        "profile": profile, "lines": build_lines(lines), "frames": include_frames,
+        "model": config["model_name"], "backend": config["backend"],
+        "classes": classes, "zones": zones, "prescan": prescan,
+        "filename": status["filename"],
+    })
+    return job.to_dict()
+
+
+@app.get("/jobs")
+async def list_jobs():
+    return job_manager.list()
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """État et progression d'un job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job introuvable")
+    return job.to_dict()
+
+
+@app.get("/jobs/{job_id}/tracks")
+async def job_tracks(
+    job_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000, description="Tracks par page")
+):
+    """Détail par track d'un job terminé (durées, trajectoires), par page"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job introuvable")
+    if job.status == "error":
+        raise HTTPException(status_code=500, detail=f"Erreur lors du traitement: {job.error}")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Job non terminé ({job.status})")
+    
+    return {
+        "job_id": job_id,
+        "total": len(job.tracks),
+        "offset": offset,
+        "limit": limit,
+        "tracks": job.tracks[offset:offset + limit],
+    }
+
+
+@app.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    """Résultat d'un job terminé (JSON, .vdt ou vidéo annotée)"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job introuvable")
+    if job.status == "error":
+        raise HTTPException(status_code=500, detail=f"Erreur lors du traitement: {job.error}")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Job non terminé ({job.status})")
+    
+    if job.result_file is None:
+        return job.result
+    
+    filename = job.params["filename"]
+    download_name = (f"analysis_{filename}.vdt" if job.media_type == VDT_MEDIA_TYPE
+                     else f"annotated_{filename}")
+    # Envoyé depuis le disque par blocs (pas de copie en mémoire)
+    return FileResponse(job.result_file, media_type=job.media_type, filename=download_name)
+
+
+@app.get("/models")
+async def models_stats():
+    """Modèles autorisés et chargés: mémoire estimée, temps de chargement, taux de hit"""
+    return model_registry.stats()
+
+
+@app.get("/cache")
+async def cache_stats():
+    """Statistiques du cache de résultats"""
+    return result_cache.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Métriques au format texte Prometheus"""
+    cache = result_cache.stats()
+    models = model_registry.stats()
+    streams = [processor.stats() for processor in live_streams.values()]
+    extra_gauges = {
+        "model_memory_bytes": [
+            ({"model": m["model"], "backend": m["backend"]}, m["memory_bytes"])
+            for m in models["models"] if m["loaded"]
+        ],
+        "model_hit_rate": [({}, models["hit_rate"])],
+        "cache_hits": [({}, cache["hits"])],
+        "cache_misses": [({}, cache["misses"])],
+        "cache_size_bytes": [({}, cache["size_bytes"])],
+        "live_frames_dropped": [({"stream": s["stream_id"]}, s["frames_dropped"]) for s in streams],
+        "live_detections_skipped": [
+            ({"stream": s["stream_id"]}, s["detections_skipped"]) for s in streams
+        ],
+        "live_processing_fps": [({"stream": s["stream_id"]}, s["processing_fps"]) for s in streams],
+        "live_latency_ms_p95": [({"stream": s["stream_id"]}, s["latency_ms_p95"]) for s in streams],
+    }
+    return metrics.render(extra_gauges=extra_gauges)
+
+
+@app.get("/profiles/{name}")
+async def download_profile(name: str):
+    """Trace cProfile d'un job lancé avec profile=true"""
+    path = os.path.join(PROFILE_DIR, os.path.basename(name))
+    if not path.endswith(".prof"):
+        path += ".prof"
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Trace introuvable")
+    return FileResponse(path, media_type="application/octet-stream",
+                        filename=os.path.basename(path))
+
+
+def create_live_processor(latency_budget_ms, policy, queue_size, tiling=None, lines=None,
+                          detection_filter=None, config=None):
+    """
+    Processeur temps réel avec son propre tracker (thread dédié)
+    
+    Le détecteur vient du registre (déjà chargé et préchauffé, partagé avec
+    les jobs): à appeler hors de la boucle d'événements (run_in_threadpool),
+    un modèle absent du registre y est chargé.
+    """
+    if policy not in LIVE_POLICIES:
+        raise HTTPException(status_code=400, detail=f"Politique inconnue: {policy} {LIVE_POLICIES}")
+    config = config or model_registry.config()
+    detector = model_registry.get(config["model_name"], config["backend"])
+    return LiveStreamProcessor(
+        detector,
+        ObjectTracker(lines=lines),
+        latency_budget_ms=latency_budget_ms,
+        policy=policy,
+        queue_size=queue_size,
+        tiling=tiling,
+        detection_filter=detection_filter
+    )
+
+
+async def send_live_messages(websocket, subscription):
+    """Relaie les messages d'un abonnement (AsyncSubscription) vers un WebSocket"""
+    while True:
+        message = await subscription.get()
+        await websocket.send_json(message)
+        if message.get("event") == "end":
+            return
+
+
+@app.post("/live/start")
+async def live_start(
+    source: str = Query(..., description="URL RTSP, index de caméra ou chemin de fichier"),
+    latency_budget_ms: int = Query(200, gt=0),
+    policy: str = Query("drop_oldest", description="drop_oldest ou skip_detection"),
+    queue_size: int = Query(4, ge=1),
+    tile_size: int = Query(0, ge=0, description="Taille des tuiles (0 = désactivé)"),
+    tile_overlap: float = Query(0.2, ge=0.0, lt=1.0),
+    imgsz: int = Query(None, gt=0, description="Résolution d'entrée du modèle (tuiles)"),
+    tile_full_frame: bool = Query(False, description="Passe pleine frame en plus des tuiles"),
+    rois: str = Query(None, description="ROIs JSON: [[x1,y1,x2,y2], ...]"),
+    lines: str = Query(None, description="Lignes de comptage JSON: [[x1,y1,x2,y2], ...]"),
+    classes: str = Query(None, description="Classes autorisées: person,car,... (noms ou ids)"),
+    zones: str = Query(None, description="Zones polygonales JSON: [[[x,y],[x,y],[x,y],...], ...]"),
+):
+    """Démarre le traitement en direct d'une source cv2.VideoCapture"""
+    require_ready()
+    tiling = build_tiling_config(tile_size, tile_overlap, imgsz, rois, tile_full_frame)
+    detection_filter = await run_in_threadpool(build_detection_filter, classes, zones,
+                                               model_registry.config())
+    processor = await run_in_threadpool(
+        create_live_processor, latency_budget_ms, policy, queue_size, tiling,
+        lines=build_lines(lines), detection_filter=detection_filter
+    )
+    
+    # Un index de caméra est passé comme entier à cv2.VideoCapture
+    capture_source = int(source) if source.isdigit() else source
+    # Fin de la source (fichier): le flux est retiré depuis la boucle d'événements
+    loop = asyncio.get_running_loop()
+    processor.on_end = lambda: loop.call_soon_threadsafe(live_streams.pop, processor.stream_id, None)
+    live_streams[processor.stream_id] = processor
+    processor.start(source=capture_source)
+    
+    return {"stream_id": processor.stream_id, "ws": f"/live/{processor.stream_id}/ws"}
+
+
+@app.get("/live")
+async def live_list():
+    """Liste des flux en direct et de leurs statistiques de latence"""
+    return [processor.stats() for processor in live_streams.values()]
+
+
+@app.get("/live/{stream_id}")
+async def live_stats(stream_id: str):
+    """Statistiques d'un flux en direct (latence p50/p95, frames abandonnées, tracks...)"""
+    if stream_id not in live_streams:
+        raise HTTPException(status_code=404, detail="Flux inconnu")
+    return live_streams[stream_id].stats()
+
+
+@app.delete("/live/{stream_id}")
+async def live_stop(stream_id: str):
+    """Arrête un flux en direct"""
+    processor = live_streams.pop(stream_id, None)
+    if processor is None:
+        raise HTTPException(status_code=404, detail="Flux inconnu")
+    # stop() attend la fin des threads du flux: hors de la boucle d'événements
+    await run_in_threadpool(processor.stop)
+    return processor.stats()
+
+
+@app.websocket("/live/{stream_id}/ws")
+async def live_subscribe(websocket: WebSocket, stream_id: str):
+    """Publie les tracks de chaque frame traitée d'un flux en direct"""
+    processor = live_streams.get(stream_id)
+    if processor is None:
+        await websocket.close(code=4404)
+        return
+    
+    await websocket.accept()
+    subscription = processor.subscribe(loop=asyncio.get_running_loop())
+    try:
+        await send_live_messages(websocket, subscription)
+        # Source terminée: fermeture normale
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        processor.unsubscribe(subscription)
+
+
+@app.websocket("/live/push")
+async def live_push(
+    websocket: WebSocket,
+    latency_budget_ms: int = 200,
+    policy: str = "drop_oldest",
+    queue_size: int = 4
+):
+    """Reçoit des frames encodées (JPEG/PNG) et renvoie les tracks de chacune"""
+    await websocket.accept()
+    if not server_state.ready:
+        await websocket.close(code=1013, reason="Serveur en cours de démarrage")
+        return
+    try:
+        processor = await run_in_threadpool(create_live_processor, latency_budget_ms, policy, queue_size)
+    except HTTPException as e:
+        await websocket.close(code=4400, reason=e.detail)
+        return
+    
+    processor.start()
+    subscription = processor.subscribe(loop=asyncio.get_running_loop())
+    sender = asyncio.create_task(send_live_messages(websocket, subscription))
+    
+    try:
+        while True:
+            data = await websocket.receive_bytes()
+            frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if frame is not None:
+                processor.push_frame(frame)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        await run_in_threadpool(processor.stop)
+        print(f"📊 Flux poussé {processor.stream_id}: {processor.stats()}")
+
+
 if __name__ == "__main__":
     import uvicorn
     print("\n" + "="*60)
@@ -0,0 +1,281 @@
+"""
+model_registry.py - Détecteurs chargés à la demande, bornés en mémoire
+
+Chaque job peut choisir son modèle (ex: yolov8n pour le débit, yolov8s/m pour
+les clips importants) et son backend. Les détecteurs chargés sont gardés dans
+un cache LRU borné en mémoire: un modèle déjà chargé est réutilisé sans
+rechargement, les moins récemment utilisés sont libérés en premier et les
+modèles épinglés ne sont jamais évincés. Les temps de chargement et les taux
+de hit sont exposés dans stats() et sur /metrics.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from object_tracking import ObjectDetector
+from profiling import current_rss_bytes, metrics
+
+
+metrics.describe("model_loads_total", "Chargements de modèles (miss du registre)")
+metrics.describe("model_hits_total", "Modèles servis depuis le registre sans rechargement")
+metrics.describe("model_evictions_total", "Modèles libérés pour respecter la borne mémoire")
+metrics.describe("model_load_seconds", "Durée du dernier chargement (warmup compris)")
+
+# Suffixes de taille des modèles YOLO, du plus petit au plus grand
+MODEL_SIZES = "nsmlx"
+
+
+def parse_sizes(value):
+    """Convertit '640x480,1280x720' en [(640, 480), (1280, 720)]"""
+    sizes = []
+    for item in (value or "").split(","):
+        item = item.strip().lower()
+        if not item:
+            continue
+        width, _, height = item.partition("x")
+        try:
+            sizes.append((int(width), int(height or width)))
+        except ValueError:
+            raise ValueError(f"Taille invalide: {item} (attendu: LARGEURxHAUTEUR)")
+    return sizes
+
+
+def weights_bytes(detector):
+    """Taille sur disque des poids chargés (modèle exporté pour les backends CPU)"""
+    path = getattr(detector.model, "path", None) or detector.model_name
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return 0
+
+
+class ModelRegistry:
+    """
+    Cache LRU de détecteurs, clé (modèle, backend)
+
+    `base_config` fournit les autres paramètres (seuil, précision, imgsz...).
+    La mémoire d'un modèle est estimée par la hausse de RSS à son chargement
+    (au minimum la taille de ses poids). Un modèle évincé pendant qu'un job
+    l'utilise reste en mémoire jusqu'à la fin du job.
+
+    Le chargement se fait hors du verrou: les requêtes d'un même modèle
+    attendent son Event de chargement, les autres modèles et les accesseurs
+    en lecture (loaded, names, stats) ne sont jamais bloqués par un chargement.
+    """
+
+    def __init__(self, base_config, allowed_models=None, max_bytes=2 * 1024 ** 3,
+                 warmup_sizes=(), factory=None):
+        self.base_config = dict(base_config)
+        self.allowed_models = list(allowed_models or [base_config["model_name"]])
+        self.max_bytes = max_bytes
+        self.warmup_sizes = list(warmup_sizes)
+        self.factory = factory or ObjectDetector
+
+        self._models = OrderedDict()
+        # Clé -> Event signalé à la fin du chargement en cours
+        self._loading = {}
+        # Clés chargées (tuple remplacé à chaque changement, lisible sans verrou)
+        self._loaded = ()
+        self._pinned = set()
+        self._stats = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def resolve(self, model_name=None, backend=None):
+        """Clé (modèle, backend) d'une requête; ValueError si le modèle n'est pas autorisé"""
+        model_name = model_name or self.base_config["model_name"]
+        if model_name not in self.allowed_models:
+            # "yolov8s" désigne "yolov8s.pt"
+            candidates = [m for m in self.allowed_models if os.path.splitext(m)[0] == model_name]
+            if not candidates:
+                raise ValueError(f"Modèle non autorisé: {model_name} (disponibles: {self.allowed_models})")
+            model_name = candidates[0]
+        return model_name, backend or self.base_config["backend"]
+
+    def config(self, model_name=None, backend=None):
+        """Configuration complète du détecteur (clé de cache, workers de segments)"""
+        model_name, backend = self.resolve(model_name, backend)
+        return {**self.base_config, "model_name": model_name, "backend": backend}
+
+    def names(self, model_name=None, backend=None):
+        """
+        Classes ({id: nom}) du modèle demandé
+
+        Un modèle absent du registre est chargé (appel bloquant, à faire hors
+        de la boucle d'événements): chaque modèle a ses propres classes.
+        """
+        key = self.resolve(model_name, backend)
+        detector = self._models.get(key) or self.get(*key)
+        return dict(detector.names)
+
+    def smallest(self):
+        """
+        Plus petit modèle autorisé (suffixe de taille YOLO n < s < m < l < x)
+
+        Les noms sans suffixe reconnu passent après, dans l'ordre de la liste.
+        """
+        def rank(model_name):
+            # "yolov8n", "yolo11s", "yolov5mu": version puis lettre de taille
+            match = re.search(r"\d([nsmlx])u?$", os.path.splitext(os.path.basename(model_name))[0].lower())
+            return MODEL_SIZES.index(match.group(1)) if match else len(MODEL_SIZES)
+        return min(self.allowed_models, key=rank)
+
+    def is_loaded(self, model_name=None, backend=None):
+        """Vrai si le modèle est en mémoire (lecture sans verrou)"""
+        return self.resolve(model_name, backend) in self._loaded
+
+    def get(self, model_name=None, backend=None, pin=False):
+        """
+        Détecteur prêt à l'emploi, chargé (et préchauffé) si nécessaire
+
+        Un seul thread charge un modèle donné; les autres requêtes du même
+        modèle attendent la fin de ce chargement (et le refont s'il a échoué).
+        """
+        key = self.resolve(model_name, backend)
+        labels = {"model": key[0], "backend": key[1]}
+        while True:
+            with self._lock:
+                if pin:
+                    self._pinned.add(key)
+                detector = self._models.get(key)
+                if detector is not None:
+                    self._models.move_to_end(key)
+                    self._loaded = tuple(self._models)
+                    self.hits += 1
+                    self._stats[key]["hits"] += 1
+                    self._stats[key]["last_used"] = time.time()
+                    metrics.inc("model_hits_total", labels=labels)
+                    return detector
+
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    self.misses += 1
+                    break
+            loading.wait()
+
+        detector = None
+        try:
+            detector = self._load(key, labels)
+        finally:
+            with self._lock:
+                if detector is not None:
+                    self._models[key] = detector
+                    self._evict(keep=key)
+                    self._loaded = tuple(self._models)
+                del self._loading[key]
+            loading.set()
+        return detector
+
+    def _load(self, key, labels):
+        """Construit et préchauffe un détecteur (appelé hors du verrou)"""
+        model_name, backend = key
+        rss_before = current_rss_bytes()
+        start = time.perf_counter()
+        detector = self.factory(**{**self.base_config, "model_name": model_name, "backend": backend})
+        load_seconds = time.perf_counter() - start
+        warmup_seconds = self.warmup(detector)
+        memory = max(current_rss_bytes() - rss_before, weights_bytes(detector))
+
+        with self._lock:
+            stats = self._stats.setdefault(key, {"loads": 0, "hits": 0, "total_load_seconds": 0.0})
+            stats.update({
+                "loads": stats["loads"] + 1,
+                "load_seconds": round(load_seconds, 3),
+                "warmup_seconds": round(warmup_seconds, 3),
+                "total_load_seconds": round(stats["total_load_seconds"] + load_seconds + warmup_seconds, 3),
+                "memory_bytes": memory,
+                "last_used": time.time(),
+            })
+        metrics.inc("model_loads_total", labels=labels)
+        metrics.set("model_load_seconds", round(load_seconds + warmup_seconds, 3), labels=labels)
+        print(f"📦 Registre: {model_name} ({backend}) chargé en {load_seconds:.2f}s "
+              f"+ warmup {warmup_seconds:.2f}s, ~{memory / 1024 ** 2:.0f} MB")
+        return detector
+
+    def warmup(self, detector, sizes=None):
+        """
+        Inférences à blanc aux résolutions attendues
+
+        La première inférence initialise paresseusement les noyaux et alloue
+        les buffers: elle est payée ici plutôt que par le premier job.
+        Retourne la durée totale (s).
+        """
+        start = time.perf_counter()
+        for width, height in (self.warmup_sizes if sizes is None else sizes):
+            detector.detect(np.zeros((height, width, 3), dtype=np.uint8))
+        return time.perf_counter() - start
+
+    def _memory(self):
+        return sum(self._stats[key]["memory_bytes"] for key in self._models)
+
+    def _evict(self, keep=None):
+        """Libère les modèles non épinglés les moins récemment utilisés au-delà de max_bytes"""
+        for key in list(self._models):
+            if self._memory() <= self.max_bytes:
+                break
+            if key == keep or key in self._pinned:
+                continue
+            del self._models[key]
+            self._loaded = tuple(self._models)
+            self.evictions += 1
+            metrics.inc("model_evictions_total", labels={"model": key[0], "backend": key[1]})
+            print(f"🗑️  Registre: éviction de {key[0]} ({key[1]})")
+
+        if self._memory() > self.max_bytes:
+            print(f"⚠️  Registre: modèles épinglés/en cours au-delà de la borne "
+                  f"({self._memory() / 1024 ** 2:.0f} MB > {self.max_bytes / 1024 ** 2:.0f} MB)")
+
+    def pin(self, model_name=None, backend=None):
+        """Charge un modèle et le protège de l'éviction"""
+        return self.get(model_name, backend, pin=True)
+
+    def unpin(self, model_name=None, backend=None):
+        with self._lock:
+            self._pinned.discard(self.resolve(model_name, backend))
+            self._evict()
+
+    def loaded(self):
+        """Clés des modèles actuellement en mémoire (du moins au plus récemment utilisé)"""
+        return list(self._loaded)
+
+    def loading(self):
+        """Clés des modèles en cours de chargement (copie, sans verrou)"""
+        return list(self._loading.copy())
+
+    def stats(self):
+        """
+        Modèles chargés, mémoire estimée, temps de chargement et taux de hit
+
+        Le verrou ne protège que la copie des compteurs: jamais tenu pendant
+        un chargement, il ne bloque pas les handlers (/models, /metrics).
+        """
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "allowed_models": self.allowed_models,
+                "max_bytes": self.max_bytes,
+                "memory_bytes": self._memory(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / requests, 4) if requests else None,
+                "evictions": self.evictions,
+                "loading": [f"{model} ({backend})" for model, backend in self.loading()],
+                "models": [
+                    {
+                        "model": model_name,
+                        "backend": backend,
+                        "loaded": (model_name, backend) in self._models,
+                        "pinned": (model_name, backend) in self._pinned,
+                        **stats,
+                    }
+                    for (model_name, backend), stats in self._stats.items()
+                ],
+            }
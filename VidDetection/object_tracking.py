@@ -2,111 +2,229 @@
 object_tracking.py - Modules de détection et tracking corrigés                                       
 """
 
-import cv2
+import threading
+import time
 import numpy as np
 from ultralytics import YOLO
 from deep_sort_realtime.deepsort_tracker import DeepSort
+from annotation import AnnotationRenderer
+from inference_backends import BACKENDS, CpuYoloModel, configure_torch_threads
+from tiling import frame_tiles, merge_tile_predictions
+from track_analytics import TrackAnalytics
 
 
 class ObjectDetector:
     """Détection d'objets avec YOLO"""
     
-    def __init__(self, model_name='yolov8n.pt', confidence_threshold=0.5):
-        print(f"📦 Chargement du modèle YOLO: {model_name}...")
-        self.model = YOLO(model_name)
+    def __init__(self, model_name='yolov8n.pt', confidence_threshold=0.5,
+                 backend='torch', precision='fp32', imgsz=640, num_threads=None,
+                 calibration_source=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Backend inconnu: {backend} (attendu: {BACKENDS})")
+        
+        print(f"📦 Chargement du modèle YOLO: {model_name} (backend: {backend}, {precision})...")
+        self.model_name = model_name
+        self.backend = backend
+        self.precision = precision
+        self.imgsz = imgsz
+        
+        if backend == 'torch':
+            configure_torch_threads(num_threads)
+            self.model = YOLO(model_name)
+        else:
+            # Forme d'entrée statique: imgsz est fixé à l'export
+            self.model = CpuYoloModel(
+                model_name, backend=backend, precision=precision, imgsz=imgsz,
+                num_threads=num_threads, calibration_source=calibration_source
+            )
+        self.names = self.model.names
+        
         self.confidence_threshold = confidence_threshold
+        # Le modèle n'est pas réentrant: détecteur du registre partagé par les jobs et les flux en direct
+        self._predict_lock = threading.Lock()
         np.random.seed(42)
         self.colors = np.random.randint(0, 255, size=(100, 3), dtype=np.uint8)
+        self.renderer = AnnotationRenderer(font_scale=0.6, text_thickness=2, box_thickness=2)
         print("✅ Modèle YOLO chargé!")
+    
+    def _predict(self, images, imgsz=None, classes=None):
+        """
+        Inférence brute sur un batch: liste de (xyxy, scores, class_ids) NumPy
         
-    def detect(self, frame):
-        """Détecte les objets dans une frame"""
-        results = self.model(frame, verbose=False)[0]
-        detections = []
+        `classes` (liste d'ids) est appliquée par le modèle avant la NMS.
+        """
+        if self.backend != 'torch':
+            with self._predict_lock:
+                return self.model.predict(images, conf=self.confidence_threshold, classes=classes)
         
-        for box in results.boxes:
-            conf = float(box.conf[0])
-            if conf >= self.confidence_threshold:
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                class_id = int(box.cls[0])
-                class_name = results.names[class_id]
-                
-                detections.append({
-                    "bbox": [x1, y1, x2, y2],
-                    "confidence": float(conf),  # Convertir en float natif
-                    "class_id": int(class_id),  # Convertir en int natif
-                    "class_name": class_name
-                })
+        # Même taille d'entrée que les backends CPU (VIDDET_IMGSZ) sauf tuiles
+        with self._predict_lock:
+            results = self.model.predict(images, conf=self.confidence_threshold, classes=classes,
+                                         imgsz=imgsz or self.imgsz, verbose=False)
         
-        return detections
+        predictions = []
+        for result in results:
+            boxes = result.boxes
+            predictions.append((
+                boxes.xyxy.cpu().numpy(),
+                boxes.conf.cpu().numpy(),
+                boxes.cls.cpu().numpy().astype(np.int64)
+            ))
+        return predictions
+    
+    def predict_batch(self, images, imgsz=None, classes=None):
+        """
+        Prédictions brutes d'un batch d'images: liste de (xyxy, scores, class_ids)
+        
+        Sans conversion en dictionnaires: pour les passes bon marché sur des
+        images réduites (pré-analyse), `imgsz` fixant la taille d'entrée.
+        """
+        return self._predict(images, imgsz=imgsz, classes=classes) if len(images) else []
     
-    def draw_detections(self, frame, detections):
-        """Dessine les détections sur la frame"""
-        annotated_frame = frame.copy()
+    def _to_detections(self, boxes, scores, class_ids):
+        """Convertit les tableaux de prédictions en dictionnaires JSON-compatibles"""
+        detections = []
+        for (x1, y1, x2, y2), conf, class_id in zip(boxes, scores, class_ids):
+            detections.append({
+                "bbox": [int(x1), int(y1), int(x2), int(y2)],
+                "confidence": float(conf),  # Convertir en float natif
+                "class_id": int(class_id),  # Convertir en int natif
+                "class_name": self.names[int(class_id)]
+            })
+        return detections
+        
+    def detect(self, frame, tiling=None, detection_filter=None):
+        """
+        Détecte les objets dans une frame (par tuiles si `tiling` est fourni)
         
+        `detection_filter` (DetectionFilter) restreint les classes et les zones
+        dès l'inférence: seules les découpes des zones sont envoyées au modèle.
+        """
+        classes = detection_filter.classes if detection_filter is not None else None
+        
+        if detection_filter is not None and detection_filter.polygons:
+            if tiling is not None:
+                boxes, scores, class_ids = self._predict_tiled(
+                    detection_filter.mask_frame(frame), tiling, classes
+                )
+            else:
+                crops, offsets = detection_filter.crops(frame)
+                boxes, scores, class_ids = detection_filter.merge(
+                    self._predict(crops, classes=classes) if crops else [], offsets
+                )
+            keep = detection_filter.inside(boxes)
+            boxes, scores, class_ids = boxes[keep], scores[keep], class_ids[keep]
+        elif tiling is not None:
+            boxes, scores, class_ids = self._predict_tiled(frame, tiling, classes)
+        else:
+            boxes, scores, class_ids = self._predict([frame], classes=classes)[0]
+        
+        return self._to_detections(boxes, scores, class_ids)
+    
+    def _predict_tiled(self, frame, tiling, classes=None):
+        """Détection par tuiles: un seul batch YOLO puis NMS inter-tuiles"""
+        crops, offsets = frame_tiles(frame, tiling)
+        predictions = self._predict(crops, imgsz=tiling.imgsz, classes=classes) if crops else []
+        return merge_tile_predictions(predictions, offsets, tiling)
+    
+    def draw_detections(self, frame, detections, inplace=False, render=True, out=None):
+        """Dessine les détections sur la frame (voir AnnotationRenderer.render)"""
+        return self.renderer.render(
+            frame, self._detection_annotations(detections),
+            inplace=inplace, enabled=render, out=out
+        )
+    
+    def _detection_annotations(self, detections):
+        """Génère (bbox, clé du sprite, label, couleur, confiance) pour chaque détection"""
         for det in detections:
-            x1, y1, x2, y2 = det['bbox']
-            conf = det['confidence']
             class_name = det['class_name']
             class_id = det['class_id']
             
             # Couleur basée sur la classe
-            color = self.colors[class_id % 100].tolist()
-            
-            # Dessiner la boîte
-            cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), color, 2)
+            color = tuple(int(c) for c in self.colors[class_id % 100])
             
-            # Label
-            label = f"{class_name}: {conf:.2f}"
-            (text_width, text_height), _ = cv2.getTextSize(
-                label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2
-            )
-            
-            # Fond pour le texte
-            cv2.rectangle(
-                annotated_frame,
-                (x1, y1 - text_height - 10),
-                (x1 + text_width, y1),
-                color,
-                -1
-            )
+            # Label: sprite de la classe + sprite de la confiance arrondie (100 valeurs au plus)
+            label = f"{class_name}:"
             
-            # Texte
-            cv2.putText(
-                annotated_frame, label, (x1, y1 - 5),
-                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2
-            )
-        
-        return annotated_frame
+            yield det['bbox'], (label, color), label, color, f" {det['confidence']:.2f}"
+
+
+# Paramètres Deep SORT (font aussi partie de la clé du cache de résultats)
+TRACKER_CONFIG = {
+    "max_age": 30,
+    "n_init": 3,
+    "nms_max_overlap": 1.0,
+    "max_cosine_distance": 0.3,
+    "nn_budget": None,
+    "override_track_class": None,
+    "embedder": "mobilenet",
+    "half": True,
+    "bgr": True,
+    "embedder_gpu": True,
+}
 
 
 class ObjectTracker:
-    """Tracking avec Deep SORT"""
+    """
+    Tracking avec Deep SORT
     
-    def __init__(self):
+    `analytics` (TrackAnalytics) agrège les tracks confirmés de chaque frame
+    au fil du tracking: durées, trajectoires, comptages par classe et
+    franchissements des lignes de comptage `lines`.
+    """
+    
+    def __init__(self, lines=None):
         print("🎯 Initialisation du tracker Deep SORT...")
-        self.tracker = DeepSort(
-            max_age=30,
-            n_init=3,
-            nms_max_overlap=1.0,
-            max_cosine_distance=0.3,
-            nn_budget=None,
-            override_track_class=None,
-            embedder="mobilenet",
-            half=True,
-            bgr=True,
-            embedder_gpu=True,
-        )
+        self.config = dict(TRACKER_CONFIG)
+        self.tracker = DeepSort(**self.config)
+        self.analytics = TrackAnalytics(lines=lines)
+        self.frame_number = 0
         np.random.seed(42)
         self.colors = np.random.randint(0, 255, size=(100, 3), dtype=np.uint8)
+        self.renderer = AnnotationRenderer(font_scale=0.7, text_thickness=2, box_thickness=3)
         print("✅ Tracker Deep SORT initialisé!")
     
+    def reset(self, lines=None):
+        """
+        Oublie tous les tracks et leurs statistiques (nouvelle vidéo ou segment)
+        
+        `lines` remplace les lignes de comptage (None = inchangées, [] = aucune).
+        """
+        self.tracker.delete_all_tracks()
+        if lines is not None:
+            self.analytics = TrackAnalytics(lines=lines)
+        else:
+            self.analytics.reset()
+        self.frame_number = 0
+    
+    def warmup(self, sizes):
+        """
+        Mises à jour à blanc (embedder Deep SORT) aux résolutions attendues
+        
+        Initialise les noyaux de l'embedder avant le premier job, puis oublie
+        les tracks créés. Retourne la durée totale (s).
+        """
+        start = time.perf_counter()
+        for width, height in sizes:
+            frame = np.zeros((height, width, 3), dtype=np.uint8)
+            detection = {"bbox": [0, 0, min(64, width), min(128, height)],
+                         "confidence": 1.0, "class_name": "person"}
+            self.update(frame, [detection])
+        self.reset()
+        return time.perf_counter() - start
+    
+    def _record(self, tracks):
+        """Ajoute les tracks confirmés de la frame courante aux statistiques"""
+        self.analytics.update(self.frame_number, self.get_track_info(tracks))
+        self.frame_number += 1
+        return tracks
+    
     def update(self, frame, detections):
         """Met à jour le tracker avec les nouvelles détections"""
         if len(detections) == 0:
             self.tracker.tracker.predict()
             self.tracker.tracker.update([])
-            return []
+            return self._record([])
         
         detection_list = []
         for det in detections:
@@ -118,7 +236,29 @@ class ObjectTracker:
             detection_list.append(([x1, y1, w, h], conf, class_name))
         
         tracks = self.tracker.update_tracks(detection_list, frame=frame)
-        return tracks
+        return self._record(tracks)
+    
+    def predict(self):
+        """Propage les tracks (Kalman) sans détection, ex: frame sautée en direct"""
+        self.tracker.tracker.predict()
+        return self._record(self.tracker.tracker.tracks)
+    
+    def jump_to(self, frame_number):
+        """
+        Reprend le tracking à `frame_number` après des frames non traitées (pré-analyse)
+        
+        Les frames sautées comptent comme des frames vides (Kalman seul, sans
+        embedder): au-delà de max_age frames, les tracks en cours sont
+        supprimés par Deep SORT sans renuméroter les IDs ni toucher aux
+        statistiques, qui gardent les numéros de frames de la vidéo.
+        """
+        gap = frame_number - self.frame_number
+        for _ in range(min(gap, self.config["max_age"] + 1)):
+            if not self.tracker.tracker.tracks:
+                break
+            self.tracker.tracker.predict()
+            self.tracker.tracker.update([])
+        self.frame_number = frame_number
     
     def get_track_info(self, tracks):
         """Extrait les informations des tracks pour JSON"""
@@ -140,50 +280,37 @@ class ObjectTracker:
         
         return track_info
     
-    def draw_tracks(self, frame, tracks):
-        """Dessine les tracks sur la frame"""
-        annotated_frame = frame.copy()
+    def draw_tracks(self, frame, tracks, inplace=False, render=True, out=None):
+        """
+        Dessine les tracks sur la frame
         
-        for track in tracks:
-            if not track.is_confirmed():
-                continue
-            
-            track_id = track.track_id
-            ltrb = track.to_ltrb()
-            x1, y1, x2, y2 = map(int, ltrb)
+        Sans `inplace`, le dessin est fait sur une copie (la frame d'origine
+        est intacte), ou dans `out` (buffer réutilisé par l'appelant);
+        `inplace=True` évite la copie. Avec `render=False` la frame est retournée sans aucun dessin.
+        """
+        if not render:
+            return frame
+        return self.draw_track_info(frame, self.get_track_info(tracks), inplace=inplace, out=out)
+    
+    def draw_track_info(self, frame, track_info, inplace=False, render=True, out=None):
+        """Dessine des tracks déjà extraits (get_track_info ou cache de résultats)"""
+        return self.renderer.render(
+            frame, self._track_annotations(track_info),
+            inplace=inplace, enabled=render, out=out
+        )
+    
+    def _track_annotations(self, track_info):
+        """Génère (bbox, clé du sprite, label, couleur, suffixe) pour chaque track"""
+        for track in track_info:
+            track_id = track["id"]
+            x1, y1, x2, y2 = track["bbox"]
             
             # Conversion sécurisée de l'ID pour les couleurs
-            try:
-                tid = int(track_id)
-            except (ValueError, TypeError):
-                tid = hash(str(track_id)) % 100
-            
-            color = self.colors[tid % 100].tolist()
-            
-            # Dessiner la boîte
-            cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), color, 3)
+            tid = track_id if isinstance(track_id, int) else hash(str(track_id)) % 100
+            color = tuple(int(c) for c in self.colors[tid % 100])
             
             # Label avec ID et classe
-            class_name = track.get_det_class() if track.get_det_class() else "Unknown"
+            class_name = track["class"]
             label = f"ID:{track_id} {class_name}"
             
-            (text_width, text_height), _ = cv2.getTextSize(
-                label, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2
-            )
-            
-            # Fond pour le texte
-            cv2.rectangle(
-                annotated_frame,
-                (x1, y1 - text_height - 10),
-                (x1 + text_width, y1),
-                color,
-                -1
-            )
-            
-            # Texte
-            cv2.putText(
-                annotated_frame, label, (x1, y1 - 5),
-                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2
-            )
-        
-        return annotated_frame
\ No newline at end of file
+            yield (x1, y1, x2, y2), (track_id, class_name, color), label, color, None
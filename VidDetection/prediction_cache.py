@@ -0,0 +1,119 @@
+"""
+prediction_cache.py - Cache disque des prédictions brutes d'évaluation
+
+Les prédictions d'un modèle sur un dataset (toutes les boîtes au-dessus d'un
+seuil de confiance très bas, avant tout filtrage) sont enregistrées une fois
+dans un fichier .npz compressé. La clé combine la configuration du modèle
+(poids, backend, précision, taille d'entrée, seuil) et une empreinte du
+dataset: les courbes et métriques pour n'importe quel seuil, IoU ou filtre de
+classes se recalculent ensuite sans relancer l'inférence.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from result_cache import cache_key, hash_file
+
+
+def dataset_fingerprint(image_paths, content=False):
+    """
+    Empreinte SHA-256 des images d'un dataset
+
+    Par défaut: chemin, taille et date de modification de chaque image (rapide
+    sur des dizaines de milliers d'images). `content=True` hache le contenu.
+    """
+    digest = hashlib.sha256()
+    for path in image_paths:
+        digest.update(path.encode("utf-8"))
+        if content:
+            digest.update(hash_file(path).encode("ascii"))
+        else:
+            stat = os.stat(path)
+            digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode("ascii"))
+    return digest.hexdigest()
+
+
+def model_params(detector_config):
+    """Paramètres du modèle qui déterminent ses prédictions brutes"""
+    params = {k: v for k, v in detector_config.items() if k != "num_threads"}
+    model_path = detector_config.get("model_name")
+    if model_path and os.path.exists(model_path):
+        # Poids ré-entraînés sous le même nom => autre clé
+        params["weights_sha256"] = hash_file(model_path)
+    return params
+
+
+def prediction_key(image_paths, detector_config, content=False):
+    """Clé de cache: empreinte du dataset + configuration du modèle"""
+    return cache_key(dataset_fingerprint(image_paths, content), model_params(detector_config))
+
+
+class PredictionCache:
+    """Prédictions brutes par dataset et modèle, au format .npz colonnaire"""
+
+    extension = ".npz"
+
+    def __init__(self, directory=os.path.join("cache", "predictions")):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.extension)
+
+    def load(self, key):
+        """Retourne (predictions, names, meta) ou None si absent"""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                offsets = data["offsets"]
+                boxes = data["boxes"]
+                scores = data["scores"]
+                class_ids = data["class_ids"].astype(np.int64)
+                info = json.loads(str(data["info"]))
+        except (OSError, ValueError, KeyError):
+            # Entrée corrompue: on la supprime
+            os.remove(path)
+            return None
+
+        predictions = [
+            (boxes[start:end], scores[start:end], class_ids[start:end])
+            for start, end in zip(offsets[:-1], offsets[1:])
+        ]
+        names = {int(k): v for k, v in info["names"].items()}
+        return predictions, names, info["meta"]
+
+    def save(self, key, predictions, names, **meta):
+        """Enregistre les prédictions (écriture atomique)"""
+        counts = [len(scores) for _, scores, _ in predictions]
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        empty = np.zeros((0, 4), dtype=np.float32)
+
+        arrays = {
+            "offsets": offsets,
+            "boxes": np.concatenate([b for b, _, _ in predictions] or [empty]).astype(np.float32),
+            "scores": np.concatenate([s for _, s, _ in predictions] or [empty[:, 0]]).astype(np.float32),
+            "class_ids": np.concatenate(
+                [c for _, _, c in predictions] or [np.zeros(0)]
+            ).astype(np.uint16),
+            "info": np.array(json.dumps({
+                "names": {str(k): v for k, v in names.items()},
+                "meta": meta,
+            })),
+        }
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp.npz")
+        os.close(fd)
+        try:
+            np.savez_compressed(tmp_path, **arrays)
+            os.replace(tmp_path, self._path(key))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return self._path(key)
@@ -0,0 +1,280 @@
+"""
+prescan.py - Pré-analyse rapide des longues vidéos (traitement en deux passes)
+
+Les longues vidéos de surveillance sont souvent vides la plupart du temps.
+Une première passe bon marché repère les plages d'activité:
+- seules les keyframes sont décodées (ffmpeg `-skip_frame nokey`, les autres
+  frames ne sont pas décodées du tout), directement en basse résolution;
+  sans ffmpeg, ou si les keyframes sont trop espacées, une frame sur N est
+  lue par OpenCV. grab() décode quand même chaque frame: quand le pas
+  dépasse l'écart entre keyframes (GOP), chaque échantillon est atteint par
+  seek, qui ne décode que depuis la keyframe précédente; sinon les frames
+  intermédiaires sont avancées avec grab() (décodées, sans conversion);
+- un détecteur peu coûteux juge chaque échantillon: différence d'images
+  ("motion") ou le plus petit modèle autorisé sur la petite frame ("detector").
+La seconde passe (détecteur + tracker complets) ne traite que ces plages,
+élargies d'une marge; le reste de la vidéo n'est ni détecté ni tracké.
+"""
+
+import shutil
+import subprocess
+import time
+
+import cv2
+import numpy as np
+
+from segments import probe_keyframes
+
+
+METHODS = ("motion", "detector")
+
+# Écart (en frames) au-delà duquel la seconde passe saute par seek plutôt que grab()
+SEEK_MIN_FRAMES = 60
+
+
+class PrescanConfig:
+    """Configuration de la pré-analyse (par job)"""
+
+    def __init__(self, method="motion", scan_width=320, sample_every=0.5, max_keyframe_gap=2.0,
+                 padding=1.0, merge_gap=2.0, motion_threshold=0.002, imgsz=320):
+        if method not in METHODS:
+            raise ValueError(f"Méthode de pré-analyse inconnue: {method} {METHODS}")
+        if scan_width <= 0 or sample_every <= 0:
+            raise ValueError("scan_width et sample_every doivent être > 0")
+
+        self.method = method
+        # Largeur de décodage de la première passe (hauteur proportionnelle)
+        self.scan_width = int(scan_width)
+        # Pas d'échantillonnage (s) quand les keyframes ne sont pas utilisables
+        self.sample_every = float(sample_every)
+        # Écart moyen maximal (s) entre keyframes pour n'utiliser qu'elles
+        self.max_keyframe_gap = float(max_keyframe_gap)
+        # Marge (s) ajoutée de part et d'autre de chaque plage d'activité
+        self.padding = float(padding)
+        # Plages séparées de moins de `merge_gap` (s) fusionnées
+        self.merge_gap = float(merge_gap)
+        # Fraction de pixels modifiés à partir de laquelle un échantillon est actif
+        self.motion_threshold = float(motion_threshold)
+        # Taille d'entrée du modèle pour la méthode "detector"
+        self.imgsz = int(imgsz)
+
+    def to_dict(self):
+        """Représentation sérialisable de la configuration"""
+        return {
+            "method": self.method,
+            "scan_width": self.scan_width,
+            "sample_every": self.sample_every,
+            "max_keyframe_gap": self.max_keyframe_gap,
+            "padding": self.padding,
+            "merge_gap": self.merge_gap,
+            "motion_threshold": self.motion_threshold,
+            "imgsz": self.imgsz,
+        }
+
+
+def scan_size(width, height, scan_width):
+    """Taille de décodage réduite (dimensions paires, jamais agrandie)"""
+    if width <= scan_width:
+        return width - width % 2, height - height % 2
+    return scan_width - scan_width % 2, max(2, int(round(height * scan_width / width / 2)) * 2)
+
+
+def keyframe_samples(video_path, keyframes, size):
+    """Keyframes décodées seules et redimensionnées par ffmpeg: (frame_number, frame BGR)"""
+    width, height = size
+    command = [
+        "ffmpeg", "-v", "error", "-skip_frame", "nokey", "-i", video_path,
+        "-map", "0:v:0", "-vsync", "0", "-vf", f"scale={width}:{height}",
+        "-f", "rawvideo", "-pix_fmt", "bgr24", "pipe:1",
+    ]
+    frame_bytes = width * height * 3
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        for frame_number in keyframes:
+            data = process.stdout.read(frame_bytes)
+            if len(data) < frame_bytes:
+                break
+            yield frame_number, np.frombuffer(data, dtype=np.uint8).reshape(height, width, 3)
+    finally:
+        process.stdout.close()
+        process.kill()
+        process.wait()
+
+
+def stride_samples(video_path, step, size, gop=None):
+    """
+    Une frame sur `step` lue par OpenCV et réduite
+
+    Au-delà de `gop` frames (écart moyen entre keyframes, SEEK_MIN_FRAMES
+    s'il est inconnu), les frames intermédiaires ne sont pas décodées: seek
+    direct vers l'échantillon suivant. Sinon elles sont avancées avec grab().
+    """
+    seek = step > (gop or SEEK_MIN_FRAMES)
+    cap = cv2.VideoCapture(video_path)
+    frame_number = 0
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                return
+            yield frame_number, cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            frame_number += step
+            if seek:
+                if not cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number):
+                    return
+                continue
+            for _ in range(step - 1):
+                if not cap.grab():
+                    return
+    finally:
+        cap.release()
+
+
+class MotionActivity:
+    """Activité par différence entre échantillons successifs (niveaux de gris flous)"""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.previous = None
+
+    def __call__(self, frames):
+        active = []
+        for frame in frames:
+            gray = cv2.GaussianBlur(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+            if self.previous is None:
+                changed = 0.0
+            else:
+                changed = np.count_nonzero(cv2.absdiff(gray, self.previous) > 25) / gray.size
+            self.previous = gray
+            active.append(changed >= self.threshold)
+        return active
+
+
+class DetectorActivity:
+    """Activité = au moins une détection d'un petit modèle sur la petite frame"""
+
+    def __init__(self, detector, imgsz, classes=None):
+        self.detector = detector
+        self.imgsz = imgsz
+        self.classes = classes
+
+    def __call__(self, frames):
+        predictions = self.detector.predict_batch(frames, imgsz=self.imgsz, classes=self.classes)
+        return [len(boxes) > 0 for boxes, _, _ in predictions]
+
+
+def activity_ranges(samples, total_frames, padding=0, merge_gap=0):
+    """
+    Plages [début, fin[ à traiter à partir des échantillons (frame_number, actif)
+
+    Un échantillon actif couvre l'intervalle entre ses voisins (l'activité a
+    commencé après l'échantillon précédent et peut durer jusqu'au suivant),
+    élargi de `padding` frames; les plages proches sont fusionnées.
+    """
+    ranges = []
+    for index, (frame_number, active) in enumerate(samples):
+        if not active:
+            continue
+        start = samples[index - 1][0] if index > 0 else 0
+        end = samples[index + 1][0] + 1 if index + 1 < len(samples) else total_frames
+        start, end = max(0, start - padding), min(total_frames, end + padding)
+        if ranges and start <= ranges[-1][1] + merge_gap:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        elif end > start:
+            ranges.append([start, end])
+    return ranges
+
+
+def prescan_video(video_path, config, detector=None, classes=None):
+    """
+    Première passe: plages d'activité d'une vidéo
+
+    `detector` (et ses `classes` autorisées) n'est utilisé que par la méthode
+    "detector". Retourne un rapport JSON-compatible dont "ranges" liste les
+    plages [début, fin[ à traiter par la seconde passe.
+    """
+    start_time = time.perf_counter()
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    size = scan_size(int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                     int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), config.scan_width)
+    cap.release()
+
+    # Keyframes seulement si elles sont assez rapprochées pour localiser l'activité
+    keyframes = probe_keyframes(video_path, fps) if shutil.which("ffmpeg") else None
+    if keyframes and len(keyframes) > 1 and total_frames / len(keyframes) <= config.max_keyframe_gap * fps:
+        sampling, samples_iter = "keyframes", keyframe_samples(video_path, keyframes, size)
+    else:
+        step = max(int(round(config.sample_every * fps)), 1)
+        gop = total_frames / len(keyframes) if keyframes else None
+        sampling, samples_iter = "stride", stride_samples(video_path, step, size, gop)
+
+    if config.method == "detector":
+        if detector is None:
+            raise ValueError("La méthode 'detector' nécessite un détecteur")
+        judge = DetectorActivity(detector, config.imgsz, classes)
+    else:
+        judge = MotionActivity(config.motion_threshold)
+
+    samples, batch = [], []
+    for frame_number, frame in samples_iter:
+        batch.append((frame_number, frame))
+        if len(batch) == 8:
+            samples.extend(zip((n for n, _ in batch), judge([f for _, f in batch])))
+            batch = []
+    if batch:
+        samples.extend(zip((n for n, _ in batch), judge([f for _, f in batch])))
+
+    if samples:
+        total_frames = max(total_frames, samples[-1][0] + 1)
+    ranges = activity_ranges(samples, total_frames, padding=int(config.padding * fps),
+                             merge_gap=int(config.merge_gap * fps))
+    frames_selected = sum(end - start for start, end in ranges)
+
+    return {
+        **config.to_dict(),
+        "sampling": sampling,
+        "scan_size": list(size),
+        "samples": len(samples),
+        "active_samples": sum(1 for _, active in samples if active),
+        "ranges": ranges,
+        "frames_total": total_frames,
+        "frames_selected": frames_selected,
+        "scan_seconds": round(time.perf_counter() - start_time, 3),
+    }
+
+
+def finish_report(report, frames_processed, pass_seconds, frame_seconds):
+    """
+    Complète le rapport après la seconde passe
+
+    `pass_seconds` est la durée mesurée de la seconde passe (décodage et
+    écriture des frames sautées compris) et `frame_seconds` le temps passé en
+    détection + tracking (étapes du JobProfile) sur les `frames_processed`
+    frames traitées. Le coût d'un traitement complet est estimé à partir de
+    ce coût par frame; le gain estimé le compare à la pré-analyse plus la
+    détection + tracking réels.
+    """
+    total = report["frames_total"]
+    spent = report["scan_seconds"] + frame_seconds
+    estimated = frame_seconds / frames_processed * total if frames_processed else None
+    return {
+        **report,
+        "frames_processed": frames_processed,
+        "processed_fraction": round(frames_processed / total, 4) if total else None,
+        "pass_seconds": round(pass_seconds, 3),
+        "detect_track_seconds": round(frame_seconds, 3),
+        "estimated_full_seconds": round(estimated, 3) if estimated is not None else None,
+        "estimated_speedup": round(estimated / spent, 2) if estimated and spent else None,
+    }
+
+
+def skip_to(cap, current, target):
+    """Avance la capture de `current` à `target`: seek si l'écart est grand, grab() sinon"""
+    if target - current > SEEK_MIN_FRAMES:
+        return cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+    for _ in range(target - current):
+        if not cap.grab():
+            return False
+    return True
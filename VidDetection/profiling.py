@@ -0,0 +1,268 @@
+"""
+profiling.py - Profilage par étape du pipeline vidéo et métriques Prometheus
+
+Chaque job mesure le temps de chaque étape par frame (décodage, détection,
+tracking, dessin, écriture) ainsi que ses totaux (FPS, pic mémoire, frames
+sautées). Les mesures alimentent un registre exposé au format texte
+Prometheus sur /metrics. Un job peut aussi, sur demande, être exécuté sous
+cProfile pour produire une trace (.prof) exploitable avec pstats/snakeviz.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+
+STAGES = ("decode", "detect", "track", "draw", "write")
+
+# Bornes des histogrammes de durée par étape (secondes)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+PROFILE_DIR = os.environ.get("VIDDET_PROFILE_DIR", "profiles")
+
+
+def current_rss_bytes():
+    """Mémoire résidente actuelle du processus (octets)"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    # Repli: pic depuis le démarrage du processus (Ko sous Linux, octets sous macOS)
+    import resource
+    import sys
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MetricsRegistry:
+    """Compteurs, jauges et histogrammes au format d'exposition Prometheus"""
+
+    def __init__(self, prefix="viddet"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._help = {}
+
+    @staticmethod
+    def _key(labels):
+        return tuple(sorted((labels or {}).items()))
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, value=1, labels=None):
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            key = self._key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name, value, labels=None):
+        with self._lock:
+            self._gauges.setdefault(name, {})[self._key(labels)] = value
+
+    def observe(self, name, value, labels=None):
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            key = self._key(labels)
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    hist["buckets"][i] += 1
+            hist["sum"] += value
+            hist["count"] += 1
+
+    def _format_labels(self, key, extra=None):
+        items = list(key) + list(extra or [])
+        if not items:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+    def render(self, extra_gauges=None):
+        """Texte d'exposition Prometheus (extra_gauges: {nom: [(labels, valeur)]})"""
+        lines = []
+        with self._lock:
+            for kind, store in (("counter", self._counters), ("gauge", self._gauges)):
+                for name, series in sorted(store.items()):
+                    full = f"{self.prefix}_{name}"
+                    if name in self._help:
+                        lines.append(f"# HELP {full} {self._help[name]}")
+                    lines.append(f"# TYPE {full} {kind}")
+                    for key, value in series.items():
+                        lines.append(f"{full}{self._format_labels(key)} {value}")
+
+            for name, series in sorted(self._histograms.items()):
+                full = f"{self.prefix}_{name}"
+                if name in self._help:
+                    lines.append(f"# HELP {full} {self._help[name]}")
+                lines.append(f"# TYPE {full} histogram")
+                for key, hist in series.items():
+                    for bound, count in zip(BUCKETS, hist["buckets"]):
+                        lines.append(f"{full}_bucket{self._format_labels(key, [('le', bound)])} {count}")
+                    lines.append(f"{full}_bucket{self._format_labels(key, [('le', '+Inf')])} {hist['count']}")
+                    lines.append(f"{full}_sum{self._format_labels(key)} {hist['sum']}")
+                    lines.append(f"{full}_count{self._format_labels(key)} {hist['count']}")
+
+        for name, series in sorted((extra_gauges or {}).items()):
+            full = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {full} gauge")
+            for labels, value in series:
+                if value is not None:
+                    lines.append(f"{full}{self._format_labels(self._key(labels))} {value}")
+
+        lines.append(f"# TYPE {self.prefix}_process_rss_bytes gauge")
+        lines.append(f"{self.prefix}_process_rss_bytes {current_rss_bytes()}")
+        return "\n".join(lines) + "\n"
+
+
+# Registre global du serveur
+metrics = MetricsRegistry()
+metrics.describe("stage_seconds", "Durée par frame de chaque étape du pipeline")
+metrics.describe("frames_total", "Frames traitées")
+metrics.describe("frames_skipped_total", "Frames non rendues ou non traitées")
+metrics.describe("jobs_total", "Jobs terminés")
+metrics.describe("job_fps", "FPS du dernier job")
+metrics.describe("job_peak_rss_bytes", "Pic de mémoire résidente du dernier job")
+
+
+class JobProfile:
+    """Mesures par étape et totaux d'un job (une vidéo)"""
+
+    def __init__(self, job_type, registry=metrics, memory_every=30):
+        self.job_type = job_type
+        self.registry = registry
+        self.memory_every = memory_every
+
+        self.stage_totals = dict.fromkeys(STAGES, 0.0)
+        self.stage_counts = dict.fromkeys(STAGES, 0)
+        self.stage_max = dict.fromkeys(STAGES, 0.0)
+        self.frames = 0
+        self.frames_skipped = 0
+        self.peak_rss = current_rss_bytes()
+        self.started = time.perf_counter()
+        self.finished = None
+        self.trace = None
+
+    @contextmanager
+    def stage(self, name):
+        """Chronomètre une étape pour la frame courante"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        self.stage_totals[name] = self.stage_totals.get(name, 0.0) + seconds
+        self.stage_counts[name] = self.stage_counts.get(name, 0) + 1
+        self.stage_max[name] = max(self.stage_max.get(name, 0.0), seconds)
+        if self.registry is not None:
+            self.registry.observe("stage_seconds", seconds, {"stage": name, "job": self.job_type})
+
+    def frame_done(self):
+        """Fin d'une frame (échantillonne la mémoire toutes les `memory_every` frames)"""
+        self.frames += 1
+        if self.frames % self.memory_every == 0:
+            self.peak_rss = max(self.peak_rss, current_rss_bytes())
+
+    def skip(self, count=1):
+        """Frames non rendues / non traitées (write_every, cache, politique de latence)"""
+        self.frames_skipped += count
+
+    def merge(self, other):
+        """Agrège les mesures d'un autre profil (ex: segment traité par un worker)"""
+        for name in other["stage_totals"]:
+            self.stage_totals[name] = self.stage_totals.get(name, 0.0) + other["stage_totals"][name]
+            self.stage_counts[name] = self.stage_counts.get(name, 0) + other["stage_counts"][name]
+            self.stage_max[name] = max(self.stage_max.get(name, 0.0), other["stage_max"][name])
+        self.frames += other["frames"]
+        self.frames_skipped += other["frames_skipped"]
+        self.peak_rss = max(self.peak_rss, other["peak_rss"])
+
+    def to_state(self):
+        """État brut, sérialisable entre processus (voir merge)"""
+        return {
+            "stage_totals": self.stage_totals,
+            "stage_counts": self.stage_counts,
+            "stage_max": self.stage_max,
+            "frames": self.frames,
+            "frames_skipped": self.frames_skipped,
+            "peak_rss": max(self.peak_rss, current_rss_bytes()),
+        }
+
+    def finish(self, status="success"):
+        """Clôt le job, met à jour les métriques globales et retourne le résumé"""
+        self.finished = time.perf_counter()
+        self.peak_rss = max(self.peak_rss, current_rss_bytes())
+        summary = self.summary()
+
+        if self.registry is not None:
+            labels = {"job": self.job_type}
+            self.registry.inc("jobs_total", 1, {**labels, "status": status})
+            self.registry.inc("frames_total", self.frames, labels)
+            self.registry.inc("frames_skipped_total", self.frames_skipped, labels)
+            self.registry.set("job_fps", round(summary["fps"], 3), labels)
+            self.registry.set("job_peak_rss_bytes", self.peak_rss, labels)
+
+        return summary
+
+    def summary(self):
+        wall = (self.finished or time.perf_counter()) - self.started
+        stages = {}
+        for name, total in self.stage_totals.items():
+            count = self.stage_counts.get(name, 0)
+            if count:
+                stages[name] = {
+                    "total_s": round(total, 4),
+                    "mean_ms": round(total / count * 1000, 3),
+                    "max_ms": round(self.stage_max[name] * 1000, 3),
+                    "calls": count,
+                }
+        return {
+            "job_type": self.job_type,
+            "frames": self.frames,
+            "frames_skipped": self.frames_skipped,
+            "wall_time_s": round(wall, 3),
+            "fps": round(self.frames / wall, 2) if wall > 0 else 0.0,
+            "peak_rss_mb": round(self.peak_rss / (1024 * 1024), 1),
+            "stages": stages,
+            "trace": self.trace,
+        }
+
+
+@contextmanager
+def profiler_trace(profile, enabled, name, top=15):
+    """Exécute le bloc sous cProfile si `enabled` et attache la trace au profil du job"""
+    if not enabled:
+        yield
+        return
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        path = os.path.join(PROFILE_DIR, f"{name}.prof")
+        profiler.dump_stats(path)
+
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(top)
+        profile.trace = {"file": os.path.basename(path), "top_cumulative": report.getvalue()}
+        print(f"🔬 Trace de profilage: {path}")
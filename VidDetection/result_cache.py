@@ -0,0 +1,142 @@
+"""
+result_cache.py - Cache disque des résultats, adressé par le contenu de la vidéo
+
+La clé combine le hash SHA-256 de la vidéo et la configuration du pipeline
+(modèle, seuil de confiance, tracker, tuilage...). Un même clip ré-uploadé
+réutilise donc les tracks déjà calculés. La taille du cache est bornée et les
+entrées les moins récemment utilisées sont supprimées en premier (LRU).
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from track_format import VERSION as VDT_VERSION, TrackReader, write_tracks
+
+
+def hash_bytes(content):
+    """Hash SHA-256 du contenu d'une vidéo"""
+    return hashlib.sha256(content).hexdigest()
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """Hash SHA-256 d'un fichier, lu par blocs"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(content_hash, params):
+    """Clé de cache: hash du contenu + configuration du pipeline (+ version du format)"""
+    canonical = json.dumps({**params, "vdt_version": VDT_VERSION}, sort_keys=True, default=str)
+    params_hash = hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+    return f"{content_hash}-{params_hash}"
+
+
+class ResultCache:
+    """Cache disque borné en taille avec éviction LRU (entrées au format .vdt)"""
+
+    extension = ".vdt"
+
+    def __init__(self, directory="cache", max_bytes=2 * 1024 ** 3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.extension)
+
+    def open(self, key):
+        """
+        Lecteur (TrackReader) de l'entrée en cache, ou None, marquée comme récemment utilisée
+
+        Le fichier est ouvert sous le verrou de l'éviction: un put() concurrent
+        ne peut pas le supprimer entre le test et l'ouverture, et une fois
+        mappé il reste lisible même s'il est évincé ensuite. À fermer par
+        l'appelant (with).
+        """
+        path = self._path(key)
+        with self._lock:
+            try:
+                reader = TrackReader(path)
+            except FileNotFoundError:
+                self.misses += 1
+                return None
+            except (OSError, ValueError):
+                # Entrée corrompue: on la supprime
+                self.misses += 1
+                if os.path.exists(path):
+                    os.remove(path)
+                return None
+            # mtime sert d'horodatage LRU
+            os.utime(path, None)
+            self.hits += 1
+        return reader
+
+    def get(self, key):
+        """Retourne les frames en cache (ou None)"""
+        reader = self.open(key)
+        if reader is None:
+            return None
+        with reader:
+            return reader.to_frames()
+
+    def put(self, key, frames, **meta):
+        """Enregistre les frames (écriture atomique) puis applique la borne de taille"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            write_tracks(tmp_path, frames, **meta)
+            os.replace(tmp_path, self._path(key))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        self._evict()
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.extension):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self):
+        """Supprime les entrées les moins récemment utilisées au-delà de max_bytes"""
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                print(f"🗑️  Cache: éviction de {os.path.basename(path)}")
+
+    def stats(self):
+        """Statistiques du cache"""
+        with self._lock:
+            entries = self._entries()
+            return {
+                "entries": len(entries),
+                "size_bytes": sum(size for _, size, _ in entries),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
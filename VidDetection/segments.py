@@ -0,0 +1,348 @@
+"""
+segments.py - Traitement parallèle des longues vidéos par segments
+
+La vidéo est découpée en segments alignés sur les keyframes. Chaque segment
+est traité par un processus distinct (avec son propre détecteur et tracker),
+en relisant quelques frames de recouvrement avant son début. Les IDs de
+tracks sont ensuite recousus d'un segment à l'autre grâce à ces frames
+communes, pour produire un flux de tracks unique et cohérent.
+
+Le pool de processus est persistant: créé au premier job parallèle puis
+réutilisé, chaque worker garde ses modèles chargés d'un job à l'autre.
+"""
+
+import json
+import multiprocessing as mp
+import os
+import shutil
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import numpy as np
+
+from profiling import JobProfile
+from tiling import box_iou_matrix
+
+
+# Pool persistant (processus principal), recréé seulement s'il est trop petit
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+# Détecteurs (par configuration) et tracker propres à chaque processus worker
+MAX_WORKER_MODELS = 2
+_worker_detectors = OrderedDict()
+_worker_tracker = None
+_worker_threads = None
+
+
+def probe_keyframes(video_path, fps):
+    """Indices des keyframes via ffprobe (None si ffprobe est indisponible)"""
+    if not shutil.which("ffprobe") or not fps:
+        return None
+
+    command = [
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-skip_frame", "nokey", "-show_entries", "frame=pts_time",
+        "-of", "csv=p=0", video_path,
+    ]
+    try:
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    except (subprocess.SubprocessError, OSError):
+        return None
+
+    keyframes = sorted({
+        int(round(float(line.strip().strip(",")) * fps))
+        for line in output.splitlines() if line.strip().strip(",")
+    })
+    return keyframes or None
+
+
+def plan_segments(total_frames, num_segments, overlap_frames=30, keyframes=None):
+    """
+    Découpe [0, total_frames) en segments
+
+    Chaque segment contient `start`/`end` (frames dont il est responsable) et
+    `read_start` (début de lecture, `overlap_frames` plus tôt, aligné sur une
+    keyframe si possible). Le dernier segment lit jusqu'à la fin du fichier.
+    """
+    num_segments = max(1, min(num_segments, total_frames // max(2 * overlap_frames, 1) or 1))
+
+    boundaries = [0]
+    for k in range(1, num_segments):
+        target = total_frames * k // num_segments
+        if keyframes:
+            target = min(keyframes, key=lambda kf: abs(kf - target))
+        if boundaries[-1] < target < total_frames:
+            boundaries.append(target)
+    boundaries.append(None)
+
+    segments = []
+    for index, (start, end) in enumerate(zip(boundaries[:-1], boundaries[1:])):
+        read_start = max(0, start - overlap_frames)
+        if keyframes and read_start > 0:
+            # Keyframe proche avant le recouvrement (sinon le décodeur s'en charge)
+            earlier = [kf for kf in keyframes if read_start - overlap_frames <= kf <= read_start]
+            if earlier:
+                read_start = earlier[-1]
+        segments.append({
+            "index": index,
+            "start": start,
+            "end": end,
+            "read_start": read_start,
+        })
+
+    return segments
+
+
+def _init_worker(num_threads):
+    """Initialise un processus worker (les modèles sont chargés au premier segment)"""
+    global _worker_threads
+    _worker_threads = num_threads
+
+
+def _worker_models(detector_config):
+    """Détecteur de cette configuration et tracker du worker, chargés une seule fois"""
+    global _worker_tracker
+    from object_tracking import ObjectDetector, ObjectTracker
+
+    key = json.dumps(detector_config, sort_keys=True, default=str)
+    detector = _worker_detectors.get(key)
+    if detector is None:
+        config = dict(detector_config)
+        if not config.get("num_threads"):
+            config["num_threads"] = _worker_threads
+        detector = _worker_detectors[key] = ObjectDetector(**config)
+        # Modèles choisis par job: seuls les plus récents restent en mémoire
+        while len(_worker_detectors) > MAX_WORKER_MODELS:
+            _worker_detectors.popitem(last=False)
+    else:
+        _worker_detectors.move_to_end(key)
+
+    if _worker_tracker is None:
+        _worker_tracker = ObjectTracker()
+    return detector, _worker_tracker
+
+
+def segment_pool(workers):
+    """Pool de processus persistant d'au moins `workers` workers (spawn)"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers < workers:
+            if _pool is not None:
+                _pool.shutdown(wait=True)
+            # Répartir les cœurs entre les workers pour éviter la sur-souscription
+            threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=mp.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(threads_per_worker,),
+            )
+            _pool_workers = workers
+            print(f"⚡ Pool de segments: {workers} workers, {threads_per_worker} threads/worker")
+        return _pool
+
+
+def shutdown_segment_pool():
+    """Arrête le pool persistant (arrêt du serveur)"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool, _pool_workers = None, 0
+
+
+def process_segment(video_path, segment, detector_config, tiling=None, detection_filter=None):
+    """Traite un segment (recouvrement inclus) avec des IDs de tracks locaux"""
+    detector, tracker = _worker_models(detector_config)
+    tracker.reset()
+
+    cap = cv2.VideoCapture(video_path)
+    if segment["read_start"] > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, segment["read_start"])
+
+    frames = []
+    frame_number = segment["read_start"]
+    start_time = time.perf_counter()
+    # Mesures locales au worker, agrégées par le processus principal
+    profile = JobProfile("segment", registry=None)
+
+    while segment["end"] is None or frame_number < segment["end"]:
+        with profile.stage("decode"):
+            ret, frame = cap.read()
+        if not ret:
+            break
+
+        with profile.stage("detect"):
+            detections = detector.detect(frame, tiling=tiling, detection_filter=detection_filter)
+        with profile.stage("track"):
+            tracks = tracker.update(frame, detections)
+            track_info = tracker.get_track_info(tracks)
+
+        frames.append({
+            "frame_number": frame_number,
+            "detections": detections,
+            "tracks": track_info,
+        })
+        frame_number += 1
+        profile.frame_done()
+
+    cap.release()
+    elapsed = time.perf_counter() - start_time
+    print(f"  Segment {segment['index']}: frames {segment['read_start']}-{frame_number} "
+          f"({elapsed:.1f}s, pid {os.getpid()})")
+
+    return {"segment": segment, "frames": frames, "profile": profile.to_state()}
+
+
+def _overlap_votes(previous_frames, local_frames, iou_threshold):
+    """Compte, sur les frames communes, les paires (ID global, ID local) qui se superposent"""
+    votes = {}
+    for prev, local in zip(previous_frames, local_frames):
+        prev_tracks, local_tracks = prev["tracks"], local["tracks"]
+        if not prev_tracks or not local_tracks:
+            continue
+
+        ious = box_iou_matrix(
+            [t["bbox"] for t in prev_tracks],
+            [t["bbox"] for t in local_tracks]
+        )
+        same_class = np.array([
+            [p["class"] == l["class"] for l in local_tracks] for p in prev_tracks
+        ])
+        for i, j in zip(*np.nonzero((ious >= iou_threshold) & same_class)):
+            key = (prev_tracks[i]["id"], local_tracks[j]["id"])
+            votes[key] = votes.get(key, 0) + 1
+
+    return votes
+
+
+def stitch_segments(results, iou_threshold=0.5, min_votes=2):
+    """
+    Fusionne les résultats des segments en un flux de tracks aux IDs globaux
+
+    Les IDs locaux d'un segment sont associés aux IDs globaux du segment
+    précédent par vote sur les frames de recouvrement (appariement glouton,
+    chaque ID au plus une fois). Les tracks non appariés reçoivent un nouvel ID.
+    """
+    merged = []
+    by_number = {}
+    next_id = 1
+
+    for result in sorted(results, key=lambda r: r["segment"]["index"]):
+        segment = result["segment"]
+        frames = result["frames"]
+        overlap = [f for f in frames if f["frame_number"] < segment["start"]]
+        owned = [f for f in frames if f["frame_number"] >= segment["start"]]
+
+        mapping = {}
+        if overlap:
+            previous = [by_number.get(f["frame_number"]) for f in overlap]
+            pairs = [(p, f) for p, f in zip(previous, overlap) if p is not None]
+            votes = _overlap_votes([p for p, _ in pairs], [f for _, f in pairs], iou_threshold)
+
+            used_global = set()
+            for (global_id, local_id), count in sorted(votes.items(), key=lambda kv: -kv[1]):
+                if count < min_votes:
+                    break
+                if local_id in mapping or global_id in used_global:
+                    continue
+                mapping[local_id] = global_id
+                used_global.add(global_id)
+
+        for frame in owned:
+            tracks = []
+            for track in frame["tracks"]:
+                if track["id"] not in mapping:
+                    mapping[track["id"]] = next_id
+                    next_id += 1
+                tracks.append({**track, "id": mapping[track["id"]]})
+
+            frame = {**frame, "tracks": tracks}
+            merged.append(frame)
+            by_number[frame["frame_number"]] = frame
+
+    return merged
+
+
+def process_video_parallel(video_path, detector_config, num_workers=2, tiling=None,
+                           overlap_frames=30, profile=None, detection_filter=None):
+    """
+    Traite une vidéo en segments parallèles et retourne les frames recousues
+
+    Retourne (frames, stats): frames est la liste complète des frames
+    {"frame_number", "detections", "tracks"} avec des IDs globaux. Les
+    mesures par étape des workers sont agrégées dans `profile` (JobProfile).
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError("Impossible d'ouvrir la vidéo")
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+
+    keyframes = probe_keyframes(video_path, fps)
+    segments = plan_segments(total_frames, num_workers, overlap_frames, keyframes)
+    workers = len(segments)
+
+    print(f"⚡ Traitement parallèle: {len(segments)} segments, {workers} workers "
+          f"({'keyframes ffprobe' if keyframes else 'découpage uniforme'})")
+
+    start_time = time.perf_counter()
+    # Pool réutilisé d'un job à l'autre: les modèles des workers restent chargés
+    pool = segment_pool(num_workers)
+    try:
+        futures = [
+            pool.submit(process_segment, video_path, seg, detector_config, tiling, detection_filter)
+            for seg in segments
+        ]
+        results = [future.result() for future in futures]
+    except BrokenProcessPool:
+        # Worker tué (ex: mémoire): le pool sera recréé au prochain job
+        shutdown_segment_pool()
+        raise
+
+    if profile is not None:
+        for result in results:
+            profile.merge(result["profile"])
+
+    frames = stitch_segments(results)
+    elapsed = time.perf_counter() - start_time
+
+    stats = {
+        "workers": workers,
+        "segments": [
+            {k: seg[k] for k in ("index", "start", "end", "read_start")} for seg in segments
+        ],
+        "keyframe_aligned": keyframes is not None,
+        "wall_time_s": round(elapsed, 3),
+    }
+    print(f"✅ Segments recousus: {len(frames)} frames en {elapsed:.1f}s")
+    return frames, stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Traitement parallèle d'une vidéo par segments")
+    parser.add_argument("video")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--overlap", type=int, default=30)
+    parser.add_argument("--output", default=None, help="Fichier JSON de sortie")
+    args = parser.parse_args()
+
+    frames, stats = process_video_parallel(
+        args.video, {"model_name": "yolov8n.pt", "confidence_threshold": 0.5},
+        num_workers=args.workers, overlap_frames=args.overlap
+    )
+    shutdown_segment_pool()
+    print(json.dumps(stats, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"stats": stats, "frames": frames}, f)
@@ -0,0 +1,6 @@
+"""Les modules de VidDetection sont importés à plat (comme par main.py)"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,38 @@
+"""Tests de l'appariement de la matrice de confusion"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("matplotlib")
+from evaluation import EvalDataset, confusion_matrix
+
+
+def _matrix(pred_boxes, pred_classes, gt_boxes, gt_classes, num_classes=2):
+    predictions = [(
+        np.asarray(pred_boxes, dtype=np.float32),
+        np.ones(len(pred_boxes), dtype=np.float32),
+        np.asarray(pred_classes, dtype=np.int64),
+    )]
+    dataset = EvalDataset(["image.jpg"], [np.asarray(gt_boxes, dtype=np.float32)],
+                          [np.asarray(gt_classes, dtype=np.int64)])
+    return confusion_matrix(predictions, dataset, np.arange(num_classes), num_classes)
+
+
+def test_gt_matched_to_best_overlapping_prediction():
+    # IoU 0.5 (classe 0) puis 0.9 (classe 1) avec la même vérité terrain (classe 1)
+    matrix = _matrix([[0, 0, 10, 5], [0, 0, 10, 9]], [0, 1], [[0, 0, 10, 10]], [1])
+    assert matrix[1, 1] == 1
+    assert matrix[1, 0] == 0
+    assert matrix[2, 0] == 1
+    assert matrix.sum() == 2
+
+
+def test_greedy_matching_frees_boxes_for_later_pairs():
+    # p1-g0 (IoU 1.0) d'abord: p0 (0.9 avec g0) se rabat sur g1 (0.67)
+    matrix = _matrix(
+        [[0, 0, 10, 9], [0, 0, 10, 10]], [0, 1],
+        [[0, 0, 10, 10], [0, 0, 10, 6]], [0, 1],
+    )
+    assert matrix[0, 1] == 1
+    assert matrix[1, 0] == 1
+    assert matrix.sum() == 2
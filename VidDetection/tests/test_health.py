@@ -0,0 +1,64 @@
+"""/health et /ready répondent pendant le chargement d'un modèle"""
+
+import threading
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("ultralytics")
+pytest.importorskip("deep_sort_realtime")
+from fastapi.testclient import TestClient
+
+import main
+from model_registry import ModelRegistry
+
+
+class SlowDetector:
+    """Détecteur factice dont le chargement reste bloqué jusqu'à `release`"""
+
+    started = threading.Event()
+    release = threading.Event()
+
+    def __init__(self, model_name, **kwargs):
+        self.model_name = model_name
+        self.model = None
+        self.names = {0: "person"}
+        SlowDetector.started.set()
+        SlowDetector.release.wait(10)
+
+
+def _get(client, path, timeout=5):
+    """GET dans un thread: None si la requête ne répond pas avant `timeout`"""
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(response=client.get(path)))
+    thread.start()
+    thread.join(timeout)
+    return result.get("response")
+
+
+def test_health_responds_while_model_loads(monkeypatch):
+    registry = ModelRegistry(main.DETECTOR_CONFIG, factory=SlowDetector)
+    monkeypatch.setattr(main, "model_registry", registry)
+    loader = threading.Thread(target=registry.pin)
+    loader.start()
+    try:
+        assert SlowDetector.started.wait(5)
+        # Sans `with`: l'événement de démarrage (warm_pool) n'est pas lancé
+        client = TestClient(main.app)
+
+        health = _get(client, "/health")
+        assert health is not None, "/health bloqué par le chargement du modèle"
+        assert health.status_code == 200
+        body = health.json()
+        assert body["models_loaded"] is False
+        assert body["models"] == []
+        assert body["models_loading"] == [f"{main.DETECTOR_CONFIG['model_name']} "
+                                          f"({main.DETECTOR_CONFIG['backend']})"]
+
+        ready = _get(client, "/ready")
+        assert ready is not None and ready.status_code == 503
+    finally:
+        SlowDetector.release.set()
+        loader.join(5)
+
+    assert registry.loaded() == [(main.DETECTOR_CONFIG["model_name"], main.DETECTOR_CONFIG["backend"])]
@@ -0,0 +1,225 @@
+"""
+tiling.py - Inférence par tuiles pour les vidéos haute résolution (4K)
+
+La frame est découpée en tuiles qui se chevauchent, les tuiles sont envoyées
+à YOLO en un seul batch, puis les boîtes sont ramenées dans le repère de la
+frame et fusionnées avec une NMS inter-tuiles.
+"""
+
+import json
+
+import cv2
+import numpy as np
+
+
+class TilingConfig:
+    """Configuration de l'inférence par tuiles (par job)"""
+
+    def __init__(self, tile_size=640, overlap=0.2, imgsz=None, rois=None,
+                 full_frame=False, nms_threshold=0.5, match_metric="ios"):
+        if tile_size <= 0:
+            raise ValueError("tile_size doit être > 0")
+        if not 0 <= overlap < 1:
+            raise ValueError("overlap doit être dans [0, 1[")
+        if match_metric not in ("iou", "ios"):
+            raise ValueError("match_metric doit être 'iou' ou 'ios'")
+
+        self.tile_size = int(tile_size)
+        self.overlap = float(overlap)
+        # Taille d'entrée du modèle (None = taille de la tuile)
+        self.imgsz = int(imgsz) if imgsz else self.tile_size
+        # Régions d'intérêt [[x1, y1, x2, y2], ...] (None = frame entière)
+        self.rois = [list(map(int, roi)) for roi in rois] if rois else None
+        # Passe supplémentaire sur la frame entière pour les grands objets (sur
+        # demande: une inférence de plus par frame, en plus des tuiles)
+        self.full_frame = bool(full_frame)
+        self.nms_threshold = float(nms_threshold)
+        # 'ios' (intersection / plus petite boîte) fusionne mieux les objets coupés
+        self.match_metric = match_metric
+
+    def to_dict(self):
+        """Représentation sérialisable de la configuration"""
+        return {
+            "tile_size": self.tile_size,
+            "overlap": self.overlap,
+            "imgsz": self.imgsz,
+            "rois": self.rois,
+            "full_frame": self.full_frame,
+            "nms_threshold": self.nms_threshold,
+            "match_metric": self.match_metric,
+        }
+
+
+def parse_rois(rois):
+    """Convertit une chaîne JSON '[[x1,y1,x2,y2], ...]' en liste de régions"""
+    if not rois:
+        return None
+
+    parsed = json.loads(rois) if isinstance(rois, str) else rois
+    if not isinstance(parsed, list) or not all(
+        isinstance(roi, (list, tuple)) and len(roi) == 4 for roi in parsed
+    ):
+        raise ValueError("Les ROIs doivent être une liste de [x1, y1, x2, y2]")
+
+    for x1, y1, x2, y2 in parsed:
+        if x2 <= x1 or y2 <= y1:
+            raise ValueError(f"ROI invalide: {[x1, y1, x2, y2]}")
+
+    return [list(map(int, roi)) for roi in parsed]
+
+
+def _tile_starts(start, end, tile_size, stride):
+    """Positions de départ des tuiles sur un axe (la dernière colle au bord)"""
+    if end - start <= tile_size:
+        return [start]
+    starts = list(range(start, end - tile_size, stride))
+    starts.append(end - tile_size)
+    return starts
+
+
+def compute_tiles(width, height, tile_size=640, overlap=0.2, region=None):
+    """Calcule les tuiles [x1, y1, x2, y2] couvrant la frame (ou une région)"""
+    if region is None:
+        x_min, y_min, x_max, y_max = 0, 0, width, height
+    else:
+        x_min = max(0, min(int(region[0]), width))
+        y_min = max(0, min(int(region[1]), height))
+        x_max = max(0, min(int(region[2]), width))
+        y_max = max(0, min(int(region[3]), height))
+        if x_max <= x_min or y_max <= y_min:
+            return []
+
+    stride = max(1, int(tile_size * (1 - overlap)))
+    tiles = []
+    for y in _tile_starts(y_min, y_max, tile_size, stride):
+        for x in _tile_starts(x_min, x_max, tile_size, stride):
+            tiles.append((x, y, min(x + tile_size, x_max), min(y + tile_size, y_max)))
+
+    return tiles
+
+
+def frame_tiles(frame, config):
+    """Découpe une frame selon la configuration: retourne (crops, offsets)"""
+    height, width = frame.shape[:2]
+    regions = config.rois if config.rois else [None]
+
+    tiles = []
+    for region in regions:
+        for tile in compute_tiles(width, height, config.tile_size, config.overlap, region):
+            if tile not in tiles:
+                tiles.append(tile)
+
+    crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in tiles]
+    offsets = [(x1, y1) for x1, y1, _, _ in tiles]
+
+    # La passe pleine frame n'a de sens que sans ROI
+    if config.full_frame and not config.rois and len(tiles) > 1:
+        crops.append(frame)
+        offsets.append((0, 0))
+
+    return crops, offsets
+
+
+def box_overlap(box, boxes, metric="iou"):
+    """Recouvrement (IoU ou IoS) entre une boîte et un tableau de boîtes"""
+    xx1 = np.maximum(box[0], boxes[:, 0])
+    yy1 = np.maximum(box[1], boxes[:, 1])
+    xx2 = np.minimum(box[2], boxes[:, 2])
+    yy2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+    if metric == "ios":
+        denom = np.minimum(area, areas)
+    else:
+        denom = area + areas - inter
+
+    return inter / np.maximum(denom, 1e-9)
+
+
+def box_iou_matrix(boxes_a, boxes_b):
+    """Matrice d'IoU (len(a), len(b)) entre deux tableaux de boîtes xyxy"""
+    boxes_a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    inter = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def nms(boxes, scores, class_ids, threshold=0.5, metric="iou"):
+    """
+    NMS par classe - retourne les indices conservés (score décroissant)
+
+    IoU: NMS par lots d'OpenCV (cv2.dnn.NMSBoxesBatched, en C++). IoS (non
+    supporté par OpenCV): boucle gloutonne, une itération Python par boîte
+    conservée (le recouvrement avec les boîtes restantes est vectorisé).
+    """
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    if metric == "iou":
+        xywh = boxes.astype(np.float64)
+        xywh[:, 2:] -= xywh[:, :2]
+        keep = np.asarray(cv2.dnn.NMSBoxesBatched(
+            xywh.tolist(), scores.astype(np.float64).tolist(),
+            class_ids.astype(np.int32).tolist(), -1.0, float(threshold)
+        ), dtype=np.int64).reshape(-1)
+        return keep[np.argsort(-scores[keep], kind="stable")]
+
+    # Décaler les boîtes par classe pour que deux classes ne se suppriment jamais
+    offsets = class_ids.astype(np.float32)[:, None] * (float(boxes.max()) + 1.0)
+    shifted = boxes.astype(np.float32) + offsets
+
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        if order.size == 1:
+            break
+        overlaps = box_overlap(shifted[i], shifted[order[1:]], metric)
+        order = order[1:][overlaps <= threshold]
+
+    return np.asarray(keep, dtype=np.int64)
+
+
+def shift_predictions(predictions, offsets):
+    """
+    Ramène les prédictions de découpes dans le repère de la frame (concaténées)
+
+    predictions: liste de (xyxy, scores, class_ids) par découpe (tableaux NumPy)
+    """
+    all_boxes, all_scores, all_classes = [], [], []
+    for (boxes, scores, class_ids), (ox, oy) in zip(predictions, offsets):
+        if len(boxes) == 0:
+            continue
+        shifted = boxes.astype(np.float32).copy()
+        shifted[:, [0, 2]] += ox
+        shifted[:, [1, 3]] += oy
+        all_boxes.append(shifted)
+        all_scores.append(scores)
+        all_classes.append(class_ids)
+
+    if not all_boxes:
+        return (np.empty((0, 4), dtype=np.float32),
+                np.empty(0, dtype=np.float32),
+                np.empty(0, dtype=np.int64))
+
+    return (np.concatenate(all_boxes),
+            np.concatenate(all_scores),
+            np.concatenate(all_classes).astype(np.int64))
+
+
+def merge_tile_predictions(predictions, offsets, config):
+    """Ramène les prédictions des tuiles dans le repère de la frame et les fusionne (NMS)"""
+    boxes, scores, class_ids = shift_predictions(predictions, offsets)
+    keep = nms(boxes, scores, class_ids, config.nms_threshold, config.match_metric)
+    return boxes[keep], scores[keep], class_ids[keep]
@@ -0,0 +1,246 @@
+"""
+track_analytics.py - Statistiques incrémentales par track
+
+Les agrégats sont mis à jour à chaque frame, pendant le tracking: première et
+dernière frame, nombre de frames vues, classe, trajectoire sous-échantillonnée
+(tampon circulaire de taille fixe) et franchissements de lignes de comptage.
+Le stockage est colonnaire (tableaux NumPy agrandis par doublement, une ligne
+par track): le résumé final est petit et complet, sans renvoyer les frames.
+"""
+
+import json
+
+import numpy as np
+
+
+def parse_lines(lines):
+    """Convertit une chaîne JSON '[[x1,y1,x2,y2], ...]' en lignes de comptage"""
+    if not lines:
+        return None
+
+    parsed = json.loads(lines) if isinstance(lines, str) else lines
+    if not isinstance(parsed, list) or not all(
+        isinstance(line, (list, tuple)) and len(line) == 4 for line in parsed
+    ):
+        raise ValueError("Les lignes doivent être une liste de [x1, y1, x2, y2]")
+
+    for x1, y1, x2, y2 in parsed:
+        if (x1, y1) == (x2, y2):
+            raise ValueError(f"Ligne de longueur nulle: {[x1, y1, x2, y2]}")
+
+    return [list(map(int, line)) for line in parsed]
+
+
+def _cross(ax, ay, bx, by):
+    return ax * by - ay * bx
+
+
+class TrackAnalytics:
+    """
+    Agrégats par track, mis à jour frame par frame
+
+    Un franchissement est compté quand le centre d'un track passe d'un côté à
+    l'autre du segment (x1, y1) -> (x2, y2): "forward" quand il passe à gauche
+    du sens de la ligne (repère image, y vers le bas), "backward" sinon.
+    """
+
+    def __init__(self, lines=None, trajectory_size=32, trajectory_every=5, capacity=64):
+        self.lines = parse_lines(lines) or []
+        self.trajectory_size = trajectory_size
+        self.trajectory_every = max(int(trajectory_every), 1)
+        self._line_array = np.array(self.lines, dtype=np.float32).reshape(-1, 4)
+        self._capacity = capacity
+        self.reset()
+
+    def reset(self):
+        """Oublie tous les tracks (mêmes lignes de comptage)"""
+        capacity = self._capacity
+        self.frames_seen = 0
+        self.last_frame = -1
+        self.classes = []
+        self._class_index = {}
+        self._slots = {}
+        self._ids = []
+        self._size = 0
+
+        self.first = np.zeros(capacity, dtype=np.int32)
+        self.last = np.zeros(capacity, dtype=np.int32)
+        self.seen = np.zeros(capacity, dtype=np.int32)
+        self.class_idx = np.zeros(capacity, dtype=np.int16)
+        self.center = np.zeros((capacity, 2), dtype=np.float32)
+        self.trajectory = np.zeros((capacity, self.trajectory_size, 2), dtype=np.float32)
+        self.trajectory_count = np.zeros(capacity, dtype=np.int32)
+        # Franchissements: [ligne, classe, sens (forward, backward)]
+        self.crossings = np.zeros((len(self.lines), 4, 2), dtype=np.int32)
+
+    def _grow(self):
+        """Double la capacité des tableaux par track"""
+        for name in ("first", "last", "seen", "class_idx", "center",
+                     "trajectory", "trajectory_count"):
+            array = getattr(self, name)
+            grown = np.zeros((array.shape[0] * 2,) + array.shape[1:], dtype=array.dtype)
+            grown[:array.shape[0]] = array
+            setattr(self, name, grown)
+
+    def _class(self, name):
+        """Indice d'une classe (vocabulaire construit au fil de la vidéo)"""
+        index = self._class_index.get(name)
+        if index is None:
+            index = self._class_index[name] = len(self.classes)
+            self.classes.append(name)
+            if index >= self.crossings.shape[1]:
+                grown = np.zeros((self.crossings.shape[0], index * 2, 2), dtype=np.int32)
+                grown[:, :self.crossings.shape[1]] = self.crossings
+                self.crossings = grown
+        return index
+
+    def update(self, frame_number, track_info):
+        """Intègre les tracks confirmés d'une frame ({"id", "class", "bbox"})"""
+        self.frames_seen += 1
+        self.last_frame = max(self.last_frame, frame_number)
+        if not track_info:
+            return
+
+        slots = np.empty(len(track_info), dtype=np.int64)
+        new = np.zeros(len(track_info), dtype=bool)
+        for i, track in enumerate(track_info):
+            slot = self._slots.get(track["id"])
+            if slot is None:
+                if self._size == self.first.shape[0]:
+                    self._grow()
+                slot = self._slots[track["id"]] = self._size
+                self._ids.append(track["id"])
+                self._size += 1
+                self.first[slot] = frame_number
+                new[i] = True
+            slots[i] = slot
+            self.class_idx[slot] = self._class(track["class"])
+
+        boxes = np.array([track["bbox"] for track in track_info], dtype=np.float32)
+        centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+
+        if len(self.lines):
+            self._count_crossings(slots[~new], self.center[slots[~new]], centers[~new])
+
+        self.center[slots] = centers
+        self.last[slots] = frame_number
+        self.seen[slots] += 1
+
+        # Trajectoire: un point toutes les `trajectory_every` frames du track
+        sampled = slots[(frame_number - self.first[slots]) % self.trajectory_every == 0]
+        position = self.trajectory_count[sampled] % self.trajectory_size
+        self.trajectory[sampled, position] = self.center[sampled]
+        self.trajectory_count[sampled] += 1
+
+    def _count_crossings(self, slots, previous, current):
+        """Segments centre précédent -> centre courant qui coupent une ligne"""
+        if not len(slots):
+            return
+        lines = self._line_array
+        lx, ly = lines[:, 0], lines[:, 1]
+        dx, dy = lines[:, 2] - lx, lines[:, 3] - ly
+
+        # Côté de chaque centre par rapport à chaque ligne: (tracks, lignes)
+        side_before = _cross(dx, dy, previous[:, :1] - lx, previous[:, 1:] - ly)
+        side_after = _cross(dx, dy, current[:, :1] - lx, current[:, 1:] - ly)
+
+        # Et côté des extrémités de la ligne par rapport au déplacement
+        mx = (current[:, 0] - previous[:, 0])[:, None]
+        my = (current[:, 1] - previous[:, 1])[:, None]
+        end_1 = _cross(mx, my, lx - previous[:, :1], ly - previous[:, 1:])
+        end_2 = _cross(mx, my, lines[:, 2] - previous[:, :1], lines[:, 3] - previous[:, 1:])
+
+        crossed = ((side_before < 0) != (side_after < 0)) & ((end_1 < 0) != (end_2 < 0))
+        track_rows, line_rows = np.nonzero(crossed)
+        if not len(track_rows):
+            return
+        # Repère image (y vers le bas): côté négatif = gauche du sens de la ligne
+        direction = (side_after[track_rows, line_rows] >= 0).astype(np.int64)
+        np.add.at(self.crossings, (line_rows, self.class_idx[slots[track_rows]], direction), 1)
+
+    @classmethod
+    def from_frames(cls, frames, lines=None, **kwargs):
+        """Agrégats recalculés à partir de frames déjà trackées (cache, segments)"""
+        analytics = cls(lines=lines, **kwargs)
+        for frame in frames:
+            analytics.update(frame["frame_number"], frame["tracks"])
+        return analytics
+
+    def track_trajectory(self, slot):
+        """Points de trajectoire d'un track, du plus ancien au plus récent"""
+        count = self.trajectory_count[slot]
+        points = self.trajectory[slot]
+        if count > self.trajectory_size:
+            points = np.roll(points, -(count % self.trajectory_size), axis=0)
+        return points[:min(count, self.trajectory_size)]
+
+    def track_details(self, fps=None, offset=0, limit=None):
+        """
+        Détail des tracks `offset` à `offset + limit` (dans l'ordre d'apparition)
+
+        Premières/dernières frames, durée de présence et trajectoire de chaque
+        track: volumineux sur une longue vidéo, d'où la pagination.
+        """
+        n = self._size
+        stop = n if limit is None else min(n, offset + limit)
+        seconds = (lambda frames: round(float(frames) / fps, 2)) if fps else (lambda frames: None)
+        return [
+            {
+                "id": self._ids[slot],
+                "class": self.classes[self.class_idx[slot]],
+                "first_frame": int(self.first[slot]),
+                "last_frame": int(self.last[slot]),
+                "frames_seen": int(self.seen[slot]),
+                "dwell_s": seconds(self.last[slot] - self.first[slot] + 1),
+                "trajectory": self.track_trajectory(slot).round().astype(int).tolist(),
+            }
+            for slot in range(offset, stop)
+        ]
+
+    def summary(self, fps=None, include_tracks=False):
+        """
+        Résumé JSON-compatible (durées en secondes si `fps` est connu)
+
+        Le détail par track (`include_tracks`, voir track_details) n'est
+        inclus que sur demande.
+        """
+        n = self._size
+        dwell_frames = self.last[:n] - self.first[:n] + 1
+        seconds = (lambda frames: round(float(frames) / fps, 2)) if fps else (lambda frames: None)
+
+        counts = np.bincount(self.class_idx[:n], minlength=len(self.classes))
+        classes = {}
+        for index, name in enumerate(self.classes):
+            mask = self.class_idx[:n] == index
+            if not counts[index]:
+                continue
+            classes[name] = {
+                "unique": int(counts[index]),
+                "mean_dwell_frames": round(float(dwell_frames[mask].mean()), 1),
+                "mean_dwell_s": seconds(dwell_frames[mask].mean()),
+            }
+
+        lines = []
+        for index, line in enumerate(self.lines):
+            per_class = self.crossings[index, :len(self.classes)]
+            lines.append({
+                "line": line,
+                "forward": int(per_class[:, 0].sum()),
+                "backward": int(per_class[:, 1].sum()),
+                "by_class": {
+                    name: {"forward": int(forward), "backward": int(backward)}
+                    for name, (forward, backward) in zip(self.classes, per_class)
+                    if forward or backward
+                },
+            })
+
+        summary = {
+            "frames": self.frames_seen,
+            "fps": fps,
+            "total_tracks": n,
+            "classes": classes,
+            "lines": lines,
+        }
+        if include_tracks:
+            summary["tracks"] = self.track_details(fps)
+        return summary
@@ -0,0 +1,414 @@
+"""
+track_format.py - Format binaire colonnaire compact pour les résultats par frame (.vdt)
+
+Contrairement au JSON (qui répète "bbox", "confidence", "class_name"... pour
+chaque objet de chaque frame), toutes les frames sont stockées sous forme de
+colonnes NumPy, par blocs de frames:
+
+- les noms de classes sont encodés par dictionnaire (index uint16);
+- les boîtes des tracks sont encodées en delta par rapport à la frame
+  précédente du même track (les deltas repartent de zéro à chaque bloc);
+- chaque colonne de chaque bloc est compressée indépendamment (zlib).
+
+Structure du fichier:
+
+    MAGIC | blocs de colonnes... | pied JSON | longueur du pied (uint64) | MAGIC
+
+Le pied décrit les blocs (frames couvertes, position de chaque colonne), ce
+qui permet une lecture paresseuse d'un intervalle de frames: seuls les blocs
+concernés sont lus et décompressés. Sans compression, les colonnes sont des
+vues directes sur le fichier mappé en mémoire (mmap).
+
+Usage:
+    write_tracks("result.vdt", frames, fps=30)
+    with TrackReader("result.vdt") as reader:
+        tracks = reader.read_range(300, 600)   # colonnes NumPy
+        for frame in reader.frames(300, 600):  # dicts compatibles JSON
+            ...
+"""
+
+import io
+import json
+import mmap
+import struct
+import zlib
+
+import numpy as np
+
+
+MAGIC = b"VDTRACK1"
+# Version 2: confiances en float32 (float16 en version 1)
+VERSION = 2
+MEDIA_TYPE = "application/x-vdt"
+
+# (colonne, dtype, largeur) par table
+TABLES = {
+    "detections": [
+        ("count", "<u2", 0),       # nombre de lignes par frame du bloc
+        ("class", "<u2", 1),
+        # float32: une lecture du cache rend exactement les scores calculés
+        ("confidence", "<f4", 1),
+        ("bbox", "<i4", 4),
+    ],
+    "tracks": [
+        ("count", "<u2", 0),
+        ("id", "<i4", 1),
+        ("class", "<u2", 1),
+        ("bbox", "<i4", 4),        # encodé en delta par track
+    ],
+}
+
+# Colonnes dont le dtype a changé, par version de fichier
+LEGACY_DTYPES = {1: {("detections", "confidence"): "<f2"}}
+
+
+def _group_order(ids):
+    """Ordre stable par ID + indicateur de début de groupe"""
+    order = np.argsort(ids, kind="stable")
+    sorted_ids = ids[order]
+    starts = np.ones(len(ids), dtype=bool)
+    starts[1:] = sorted_ids[1:] != sorted_ids[:-1]
+    return order, starts
+
+
+def delta_encode(ids, boxes):
+    """Remplace chaque boîte par son écart à la précédente du même track"""
+    if len(ids) == 0:
+        return boxes
+    order, starts = _group_order(ids)
+    sorted_boxes = boxes[order]
+    deltas = sorted_boxes.copy()
+    deltas[1:] -= sorted_boxes[:-1]
+    deltas[starts] = sorted_boxes[starts]
+    encoded = np.empty_like(boxes)
+    encoded[order] = deltas
+    return encoded
+
+
+def delta_decode(ids, deltas):
+    """Inverse de delta_encode (somme cumulée par track, vectorisée)"""
+    if len(ids) == 0:
+        return deltas
+    order, starts = _group_order(ids)
+    sorted_deltas = deltas[order].astype(np.int64)
+    cumulative = np.cumsum(sorted_deltas, axis=0)
+    start_idx = np.flatnonzero(starts)
+    base = cumulative[start_idx] - sorted_deltas[start_idx]
+    group = np.cumsum(starts) - 1
+    boxes = np.empty_like(cumulative)
+    boxes[order] = cumulative - base[group]
+    return boxes.astype(np.int32)
+
+
+class TrackWriter:
+    """Écriture séquentielle des résultats par frame au format .vdt"""
+
+    def __init__(self, target, fps=None, width=None, height=None,
+                 chunk_frames=256, compression="zlib", metadata=None):
+        if compression not in ("zlib", "none"):
+            raise ValueError("compression doit être 'zlib' ou 'none'")
+
+        self._owns_file = isinstance(target, str)
+        self._file = open(target, "wb") if self._owns_file else target
+        self._file.write(MAGIC)
+
+        self.chunk_frames = int(chunk_frames)
+        self.compression = compression
+        self.meta = {"fps": fps, "width": width, "height": height, **(metadata or {})}
+
+        self.classes = []
+        self.class_model_ids = []
+        self._class_index = {}
+        self.chunks = []
+        self.n_frames = 0
+        self._buffer = []
+
+    def _class_id(self, name, model_id=None):
+        """Index du nom de classe dans le dictionnaire (créé à la volée)"""
+        index = self._class_index.get(name)
+        if index is None:
+            index = self._class_index[name] = len(self.classes)
+            self.classes.append(name)
+            self.class_model_ids.append(None)
+        if model_id is not None and self.class_model_ids[index] is None:
+            self.class_model_ids[index] = int(model_id)
+        return index
+
+    def add_frame(self, frame_result):
+        """Ajoute une frame {"frame_number", "detections", "tracks"} (ordre croissant)"""
+        frame_number = frame_result.get("frame_number", self.n_frames)
+        if frame_number < self.n_frames:
+            raise ValueError("Les frames doivent être ajoutées dans l'ordre")
+
+        # Les frames manquantes sont stockées vides
+        while self.n_frames < frame_number:
+            self._append({"detections": [], "tracks": []})
+        self._append(frame_result)
+
+    def _append(self, frame_result):
+        self._buffer.append(frame_result)
+        self.n_frames += 1
+        if len(self._buffer) >= self.chunk_frames:
+            self._flush()
+
+    def _write_column(self, array):
+        raw = np.ascontiguousarray(array).tobytes()
+        data = zlib.compress(raw, 6) if self.compression == "zlib" else raw
+        offset = self._file.tell()
+        self._file.write(data)
+        return [offset, len(data), len(raw)]
+
+    def _flush(self):
+        if not self._buffer:
+            return
+
+        frames = self._buffer
+        det_rows = [d for f in frames for d in f.get("detections", [])]
+        track_rows = [t for f in frames for t in f.get("tracks", [])]
+
+        try:
+            track_ids = np.array([int(t["id"]) for t in track_rows], dtype="<i4")
+        except (TypeError, ValueError):
+            raise ValueError("Le format .vdt nécessite des IDs de tracks numériques")
+
+        track_boxes = np.array([t["bbox"] for t in track_rows], dtype="<i4").reshape(-1, 4)
+
+        columns = {
+            "detections": {
+                "count": np.array([len(f.get("detections", [])) for f in frames], dtype="<u2"),
+                "class": np.array(
+                    [self._class_id(d["class_name"], d.get("class_id")) for d in det_rows], dtype="<u2"
+                ),
+                "confidence": np.array([d["confidence"] for d in det_rows], dtype="<f4"),
+                "bbox": np.array([d["bbox"] for d in det_rows], dtype="<i4").reshape(-1, 4),
+            },
+            "tracks": {
+                "count": np.array([len(f.get("tracks", [])) for f in frames], dtype="<u2"),
+                "id": track_ids,
+                "class": np.array([self._class_id(t["class"]) for t in track_rows], dtype="<u2"),
+                "bbox": delta_encode(track_ids, track_boxes),
+            },
+        }
+
+        chunk = {
+            "frame_start": self.n_frames - len(frames),
+            "frame_end": self.n_frames,
+            "tables": {},
+        }
+        for table, cols in columns.items():
+            chunk["tables"][table] = {
+                "rows": int(len(cols["class"])),
+                "columns": {name: self._write_column(array) for name, array in cols.items()},
+            }
+
+        self.chunks.append(chunk)
+        self._buffer = []
+
+    def close(self):
+        """Écrit le dernier bloc et le pied du fichier"""
+        if self._file is None:
+            return
+        self._flush()
+
+        footer = json.dumps({
+            "version": VERSION,
+            "n_frames": self.n_frames,
+            "chunk_frames": self.chunk_frames,
+            "compression": self.compression,
+            "classes": self.classes,
+            "class_model_ids": self.class_model_ids,
+            "meta": self.meta,
+            "chunks": self.chunks,
+        }, separators=(",", ":")).encode("utf-8")
+
+        self._file.write(footer)
+        self._file.write(struct.pack("<Q", len(footer)))
+        self._file.write(MAGIC)
+
+        if self._owns_file:
+            self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_tracks(target, frames, **kwargs):
+    """Écrit une liste complète de frames au format .vdt"""
+    with TrackWriter(target, **kwargs) as writer:
+        for frame_result in frames:
+            writer.add_frame(frame_result)
+
+
+def dumps(frames, **kwargs):
+    """Encode une liste de frames en bytes .vdt"""
+    buffer = io.BytesIO()
+    write_tracks(buffer, frames, **kwargs)
+    return buffer.getvalue()
+
+
+class TrackReader:
+    """Lecture paresseuse d'un fichier .vdt (chemin, bytes ou fichier ouvert)"""
+
+    def __init__(self, source):
+        self._file = None
+        self._mmap = None
+
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            self._data = memoryview(source)
+        else:
+            self._file = open(source, "rb") if isinstance(source, str) else source
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._data = memoryview(self._mmap)
+
+        if bytes(self._data[:8]) != MAGIC or bytes(self._data[-8:]) != MAGIC:
+            raise ValueError("Fichier .vdt invalide")
+
+        (footer_len,) = struct.unpack("<Q", bytes(self._data[-16:-8]))
+        footer = bytes(self._data[-16 - footer_len:-16])
+        self.footer = json.loads(footer.decode("utf-8"))
+
+        if self.footer["version"] > VERSION:
+            raise ValueError(f"Version .vdt non supportée: {self.footer['version']}")
+
+        self.n_frames = self.footer["n_frames"]
+        self.classes = self.footer["classes"]
+        self.class_model_ids = self.footer.get("class_model_ids") or [None] * len(self.classes)
+        self.meta = self.footer.get("meta", {})
+        self.fps = self.meta.get("fps")
+        self.chunks = self.footer["chunks"]
+        self.compressed = self.footer["compression"] == "zlib"
+        self._legacy = LEGACY_DTYPES.get(self.footer["version"], {})
+
+    def getbuffer(self):
+        """Contenu brut du fichier .vdt (memoryview, valable jusqu'à close())"""
+        return self._data
+
+    def _column(self, chunk, table, name):
+        offset, size, _ = chunk["tables"][table]["columns"][name]
+        dtype, width = next((d, w) for n, d, w in TABLES[table] if n == name)
+        dtype = self._legacy.get((table, name), dtype)
+
+        if self.compressed:
+            array = np.frombuffer(zlib.decompress(self._data[offset:offset + size]), dtype=dtype)
+        else:
+            # Vue sans copie sur le fichier mappé
+            array = np.frombuffer(self._data, dtype=dtype, count=size // np.dtype(dtype).itemsize,
+                                  offset=offset)
+
+        return array.reshape(-1, width) if width > 1 else array
+
+    def _read_chunk(self, chunk, table):
+        counts = self._column(chunk, table, "count")
+        frames = np.repeat(
+            np.arange(chunk["frame_start"], chunk["frame_end"], dtype=np.int64), counts
+        )
+        columns = {"frame": frames}
+        for name, _, _ in TABLES[table][1:]:
+            columns[name] = self._column(chunk, table, name)
+
+        if table == "tracks":
+            columns["bbox"] = delta_decode(columns["id"], columns["bbox"])
+        return columns
+
+    def read_range(self, start=0, end=None, table="tracks"):
+        """
+        Colonnes NumPy des lignes de `table` pour les frames [start, end)
+
+        Retourne un dict: frame, class (index dans `classes`), bbox, et
+        id (tracks) ou confidence (détections).
+        """
+        if table not in TABLES:
+            raise ValueError(f"Table inconnue: {table}")
+        end = self.n_frames if end is None else min(end, self.n_frames)
+
+        parts = [
+            self._read_chunk(chunk, table) for chunk in self.chunks
+            if chunk["frame_end"] > start and chunk["frame_start"] < end
+        ]
+        names = ["frame"] + [name for name, _, _ in TABLES[table][1:]]
+        if not parts:
+            empty = {name: np.empty(0, dtype=np.int64) for name in names}
+            empty["bbox"] = np.empty((0, 4), dtype=np.int32)
+            return empty
+
+        columns = {name: np.concatenate([p[name] for p in parts]) for name in names}
+        mask = (columns["frame"] >= start) & (columns["frame"] < end)
+        return {name: array[mask] for name, array in columns.items()}
+
+    def class_counts(self, table="tracks"):
+        """Nombre de lignes par classe (sans reconstruire les frames)"""
+        counts = np.zeros(len(self.classes), dtype=np.int64)
+        for chunk in self.chunks:
+            classes = self._column(chunk, table, "class")
+            counts += np.bincount(classes, minlength=len(self.classes))
+        return dict(zip(self.classes, counts.tolist()))
+
+    def frames(self, start=0, end=None):
+        """Itère sur les frames [start, end) au format dict de l'API JSON"""
+        end = self.n_frames if end is None else min(end, self.n_frames)
+        for chunk in self.chunks:
+            if chunk["frame_end"] <= start or chunk["frame_start"] >= end:
+                continue
+
+            dets = self._read_chunk(chunk, "detections")
+            tracks = self._read_chunk(chunk, "tracks")
+            det_bounds = np.searchsorted(dets["frame"], np.arange(chunk["frame_start"], chunk["frame_end"] + 1))
+            track_bounds = np.searchsorted(tracks["frame"], np.arange(chunk["frame_start"], chunk["frame_end"] + 1))
+
+            for i, frame_number in enumerate(range(chunk["frame_start"], chunk["frame_end"])):
+                if frame_number < start or frame_number >= end:
+                    continue
+                d0, d1 = det_bounds[i], det_bounds[i + 1]
+                t0, t1 = track_bounds[i], track_bounds[i + 1]
+                yield {
+                    "frame_number": frame_number,
+                    "detections": [
+                        {
+                            "bbox": dets["bbox"][j].tolist(),
+                            "confidence": float(dets["confidence"][j]),
+                            "class_id": self.class_model_ids[dets["class"][j]],
+                            "class_name": self.classes[dets["class"][j]],
+                        }
+                        for j in range(d0, d1)
+                    ],
+                    "tracks": [
+                        {
+                            "id": int(tracks["id"][j]),
+                            "class": self.classes[tracks["class"][j]],
+                            "bbox": tracks["bbox"][j].tolist(),
+                        }
+                        for j in range(t0, t1)
+                    ],
+                }
+
+    def to_frames(self):
+        """Toutes les frames au format dict de l'API JSON"""
+        return list(self.frames())
+
+    def close(self):
+        self._data = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Des vues NumPy (mode non compressé) référencent encore le mmap
+                pass
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load(source):
+    """Ouvre un fichier .vdt (chemin, bytes ou fichier) en lecture paresseuse"""
+    return TrackReader(source)